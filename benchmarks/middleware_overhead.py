@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-request overhead of the ZestAPI middleware stack.
+
+Compares a bare Starlette application with the same application wrapped in
+the legacy ``BaseHTTPMiddleware`` based stack, the raw ASGI stack and the
+fused ``CoreMiddleware`` stack used by ``ZestAPI.create_app``.
+Requests are driven directly through the ASGI interface so the numbers only
+reflect middleware cost, not HTTP parsing or client overhead.
+
+Usage:
+    python benchmarks/middleware_overhead.py [--requests N]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from zestapi import (
+    CoreMiddleware,
+    ErrorHandlingMiddleware,
+    RateLimitMiddleware,
+    RequestLoggingMiddleware,
+)
+
+
+class LegacyErrorHandlingMiddleware(BaseHTTPMiddleware):
+    """Hot path of the pre-ASGI ErrorHandlingMiddleware"""
+
+    async def dispatch(self, request: Any, call_next: Any) -> Response:
+        start_time = time.time()
+        request_id = str(uuid.uuid4())[:8]
+        request.state.request_id = request_id
+        response = await call_next(request)
+        response.headers["X-Process-Time"] = f"{time.time() - start_time:.4f}"
+        response.headers["X-Request-ID"] = request_id
+        return response  # type: ignore
+
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    """Hot path of the pre-ASGI RequestLoggingMiddleware"""
+
+    async def dispatch(self, request: Any, call_next: Any) -> Response:
+        start_time = time.time()
+        log_data = {
+            "request_id": getattr(request.state, "request_id", "unknown"),
+            "method": request.method,
+            "url": str(request.url),
+            "user_agent": request.headers.get("user-agent"),
+            "client_ip": request.client.host if request.client else None,
+        }
+        logging.getLogger("zestapi.core.middleware").info(
+            "Request started", extra=log_data
+        )
+        response = await call_next(request)
+        logging.getLogger("zestapi.core.middleware").info(
+            "Request %s %s completed in %.2fms",
+            request.method,
+            request.url.path,
+            (time.time() - start_time) * 1000,
+        )
+        return response  # type: ignore
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    """Hot path of the pre-ASGI RateLimitMiddleware"""
+
+    def __init__(self, app: Any) -> None:
+        super().__init__(app)
+        self.requests: Dict[str, List[float]] = {}
+
+    async def dispatch(self, request: Any, call_next: Any) -> Response:
+        now = time.time()
+        hits = [t for t in self.requests.get("bench", []) if now - t < 60]
+        hits.append(now)
+        self.requests["bench"] = hits
+        response = await call_next(request)
+        response.headers["X-RateLimit-Limit"] = "1000000000"
+        response.headers["X-RateLimit-Remaining"] = "1000000000"
+        response.headers["X-RateLimit-Window"] = "60"
+        return response  # type: ignore
+
+
+async def plain(request: Any) -> Response:
+    return PlainTextResponse("ok")
+
+
+async def stream(request: Any) -> Response:
+    async def chunks() -> Any:
+        for _ in range(10):
+            yield b"x" * 64
+
+    return StreamingResponse(chunks())
+
+
+def build_app(middleware: List[Middleware]) -> Starlette:
+    return Starlette(
+        routes=[Route("/plain", plain), Route("/stream", stream)],
+        middleware=middleware,
+    )
+
+
+STACKS: Dict[str, Callable[[], Starlette]] = {
+    "bare": lambda: build_app([]),
+    "legacy": lambda: build_app(
+        [
+            Middleware(LegacyRequestLoggingMiddleware),
+            Middleware(LegacyErrorHandlingMiddleware),
+            Middleware(LegacyRateLimitMiddleware),
+        ]
+    ),
+    "asgi": lambda: build_app(
+        [
+            Middleware(RequestLoggingMiddleware),
+            Middleware(ErrorHandlingMiddleware),
+            Middleware(RateLimitMiddleware, rate_limit="1000000000/minute"),
+        ]
+    ),
+    "core": lambda: build_app(
+        [
+            Middleware(CoreMiddleware),
+            Middleware(RateLimitMiddleware, rate_limit="1000000000/minute"),
+        ]
+    ),
+}
+
+
+async def run_requests(app: Starlette, path: str, count: int) -> List[float]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"user-agent", b"bench")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+
+    async def send(message: Dict[str, Any]) -> None:
+        pass
+
+    timings = []
+    for _ in range(count):
+        request_sent = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Block like a server would until the client disconnects
+            await asyncio.Event().wait()
+            return {"type": "http.disconnect"}
+
+        start = time.perf_counter()
+        await app(dict(scope), receive, send)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def main(count: int) -> None:
+    # Keep the log records cheap so they don't dominate the measurement
+    logging.basicConfig(level=logging.WARNING)
+
+    for path in ("/plain", "/stream"):
+        print(f"{path} ({count} requests)")
+        baseline = 0.0
+        for name, factory in STACKS.items():
+            app = factory()
+            await run_requests(app, path, min(count, 500))  # warm up
+            timings = await run_requests(app, path, count)
+            mean = sum(timings) / len(timings)
+            if name == "bare":
+                baseline = mean
+            print(
+                f"  {name:<7} mean {mean * 1e6:8.1f}us  "
+                f"p99 {percentile(timings, 0.99) * 1e6:8.1f}us  "
+                f"overhead {(mean - baseline) * 1e6:8.1f}us"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark route discovery startup time for large route directories.
+
+Generates a routes directory with the given number of modules (each with a
+few routes and a block of module-level work) and times eager discovery,
+parallel discovery, lazy discovery and registration from a route manifest.
+
+Usage:
+    python benchmarks/route_discovery.py [--files N] [--workers N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, List
+
+from zestapi.core.manifest import manifest_routes, read_manifest, write_manifest
+from zestapi.core.routing import discover_lazy_routes, discover_routes
+
+ROUTE_MODULE = """
+from zestapi import ORJSONResponse, route
+
+# Stand-in for module-level setup work (constants, schemas, lookups)
+TABLE = {{i: str(i) * 8 for i in range(2000)}}
+
+
+@route("/r{index}", methods=["GET"])
+async def list_r{index}(request):
+    return ORJSONResponse([])
+
+
+@route("/r{index}/{{item_id:int}}", methods=["GET", "PUT"])
+async def get_r{index}(request):
+    return ORJSONResponse({{"id": request.path_params["item_id"]}})
+
+
+@route("/r{index}/{{item_id:int}}/history", rate_limit="10/minute")
+async def history_r{index}(request):
+    return ORJSONResponse([])
+"""
+
+
+def make_routes_dir(root: str, files: int) -> str:
+    for index in range(files):
+        directory = os.path.join(root, f"group{index % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"r{index}.py"), "w") as f:
+            f.write(ROUTE_MODULE.format(index=index))
+    return root
+
+
+def timed(name: str, discover: Callable[[], List]) -> None:
+    start = time.perf_counter()
+    routes = discover()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<10} {elapsed * 1000:9.1f}ms  ({len(routes)} routes)")
+
+
+def main(files: int, workers: int) -> None:
+    with tempfile.TemporaryDirectory() as root:
+        routes_dir = make_routes_dir(root, files)
+        # Populate __pycache__ so every mode starts warm
+        discover_routes(routes_dir)
+        manifest = read_manifest(write_manifest(routes_dir))
+        assert manifest is not None
+
+        print(f"{files} route modules, {workers} workers")
+        timed("eager", lambda: discover_routes(routes_dir))
+        timed("parallel", lambda: discover_routes(routes_dir, workers=workers))
+        timed("lazy", lambda: discover_lazy_routes(routes_dir, workers=workers))
+        timed("manifest", lambda: manifest_routes(routes_dir, manifest))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+    main(args.files, args.workers)
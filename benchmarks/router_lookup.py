@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark route lookup with Starlette's linear router and the radix router.
+
+Builds route tables of 10, 100 and 1000 routes shaped like auto-discovered
+REST resources (collections, typed item routes and nested sub-resources) and
+dispatches requests for every route, plus unknown paths, through each router.
+Endpoints are bare ASGI callables so the numbers only reflect matching cost.
+
+Usage:
+    python benchmarks/router_lookup.py [--rounds N]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+
+from starlette.routing import Route, Router
+
+from zestapi.core.router import RadixRouter
+
+
+class Endpoint:
+    """Raw ASGI endpoint, so Route doesn't wrap it in a request/response"""
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        pass
+
+
+def build_routes(count: int) -> Tuple[List[Route], List[str]]:
+    app = Endpoint()
+    routes = []
+    paths = []
+    for i in range(count):
+        # Cycle through the routes of one resource, then start the next
+        resource = f"/svc{i // 4}"
+        route_path, path = [
+            (f"{resource}/items", f"{resource}/items"),
+            (f"{resource}/items/{{item_id:int}}", f"{resource}/items/{i}"),
+            (
+                f"{resource}/items/{{item_id:int}}/tags/{{tag}}",
+                f"{resource}/items/{i}/tags/new",
+            ),
+            (f"{resource}/search/{{query}}", f"{resource}/search/shoes"),
+        ][i % 4]
+        routes.append(Route(route_path, app))
+        paths.append(path)
+    return routes, paths
+
+
+def make_scope(path: str) -> Dict[str, Any]:
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    }
+
+
+async def run(router: Router, paths: List[str], rounds: int) -> float:
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        pass
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for path in paths:
+            await router(make_scope(path), receive, send)
+    return (time.perf_counter() - start) / (rounds * len(paths))
+
+
+async def main(rounds: int) -> None:
+    for count in (10, 100, 1000):
+        routes, paths = build_routes(count)
+        print(f"{len(routes)} routes")
+        for name, router_class in (("linear", Router), ("radix", RadixRouter)):
+            router = router_class(routes, redirect_slashes=False)
+            hit = await run(router, paths, rounds)
+            # Unknown paths show the worst case for linear matching
+            miss = await run(router, ["/nowhere/1", "/svc0/nowhere"], rounds)
+            print(f"  {name:<7} hit {hit * 1e6:8.2f}us  miss {miss * 1e6:8.2f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds))
@@ -46,7 +46,7 @@ async def health_check(request):
 
 
 # Add routes
-app_instance.add_route("/", root)
+app_instance.add_route("/", root, static=True)
 app_instance.add_route("/health", health_check)
 
 # Get ASGI app for deployment
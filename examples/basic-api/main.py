@@ -25,8 +25,8 @@ async def health_check(request):
 
 
 # Add routes manually
-app_instance.add_route("/", root)
-app_instance.add_route("/health", health_check)
+app_instance.add_route("/", root, static=True)
+app_instance.add_route("/health", health_check, static=True)
 
 # Get ASGI app for deployment
 app = app_instance.app
@@ -8,7 +8,7 @@ from app.auth import (
 )
 from app.database import get_user_by_email, user_id_counter, users_db
 from app.models import Message, Token, UserCreate, UserLogin
-from zestapi import ORJSONResponse, route
+from zestapi import ExecutorBusy, ORJSONResponse, route, run_cpu_bound
 
 
 @route("/auth/register", methods=["POST"])
@@ -27,7 +27,8 @@ async def register(request):
 
         # Create new user
         global user_id_counter
-        hashed_password = hash_password(user_data.password)
+        # bcrypt takes tens of milliseconds; keep it off the event loop
+        hashed_password = await run_cpu_bound(hash_password, user_data.password)
 
         new_user = {
             "id": user_id_counter,
@@ -57,6 +58,9 @@ async def register(request):
             }
         )
 
+    except ExecutorBusy:
+        # Served as 503 with Retry-After while password hashing is saturated
+        raise
     except ValueError as e:
         return ORJSONResponse({"error": str(e)}, status_code=400)
     except Exception as e:
@@ -79,7 +83,9 @@ async def login(request):
             )
 
         # Verify password
-        if not verify_password(login_data.password, user["password"]):
+        if not await run_cpu_bound(
+            verify_password, login_data.password, user["password"]
+        ):
             return ORJSONResponse(
                 {"error": "Invalid email or password"}, status_code=401
             )
@@ -103,6 +109,9 @@ async def login(request):
             }
         )
 
+    except ExecutorBusy:
+        # Served as 503 with Retry-After while password hashing is saturated
+        raise
     except ValueError as e:
         return ORJSONResponse({"error": str(e)}, status_code=400)
     except Exception as e:
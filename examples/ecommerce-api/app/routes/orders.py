@@ -6,7 +6,12 @@ from app.database import (
 )
 from app.models import OrderCreate, OrderStatusUpdate
 from app.routes.auth import get_current_user
-from zestapi import ORJSONResponse, route
+from zestapi import (
+    ORJSONResponse,
+    ORJSONStreamingResponse,
+    invalidate_cache,
+    route,
+)
 
 
 @route("/orders", methods=["GET"])
@@ -22,18 +27,22 @@ async def get_orders(request):
         orders = get_user_orders(user_id)
 
         # Add product details to order items
-        enriched_orders = []
-        for order in orders:
+        def enrich(order):
             enriched_items = []
             for item in order["items"]:
                 product = get_product_by_id(item["product_id"])
                 if product:
                     enriched_item = {**item, "product": product}
                     enriched_items.append(enriched_item)
+            return {**order, "items": enriched_items}
 
-            enriched_order = {**order, "items": enriched_items}
-            enriched_orders.append(enriched_order)
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            # Stream one order per line instead of building the whole list
+            return ORJSONStreamingResponse(
+                (enrich(order) for order in orders), format="ndjson"
+            )
 
+        enriched_orders = [enrich(order) for order in orders]
         return ORJSONResponse(
             {"orders": enriched_orders, "total": len(enriched_orders)}
         )
@@ -100,6 +109,8 @@ async def create_order(request):
         try:
             # Create order from cart
             order = create_order_from_cart(user_id, order_data.shipping_address)
+            # Ordering lowers stock, which product listings show
+            await invalidate_cache("products")
 
             # Add product details to order items
             enriched_items = []
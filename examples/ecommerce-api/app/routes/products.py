@@ -16,10 +16,19 @@ from app.models import (
     ProductUpdate,
 )
 from app.routes.auth import get_current_user
-from zestapi import ORJSONResponse, route
+from zestapi import (
+    ORJSONResponse,
+    ORJSONStreamingResponse,
+    cached,
+    invalidate_cache,
+    not_modified,
+    route,
+    version_etag,
+)
 
 
 @route("/products", methods=["GET"])
+@cached(ttl=30, tags=["products"], vary=["accept"], stale_while_revalidate=30)
 async def list_products(request):
     """List all products with optional filters"""
     try:
@@ -59,6 +68,16 @@ async def list_products(request):
             in_stock_only=in_stock_only,
         )
 
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            # Stream one product per line, adding categories as they are sent
+            return ORJSONStreamingResponse(
+                (
+                    {**product, "category": get_category_by_id(product["category_id"])}
+                    for product in products
+                ),
+                format="ndjson",
+            )
+
         # Add category information to products
         for product in products:
             category = get_category_by_id(product["category_id"])
@@ -92,11 +111,21 @@ async def get_product(request):
         if not product:
             return ORJSONResponse({"error": "Product not found"}, status_code=404)
 
+        # update_product bumps updated_at and orders only change the stock,
+        # so clients polling an unchanged product get a 304 without it being
+        # serialized
+        etag = version_etag(
+            product_id, product["updated_at"], product["stock_quantity"]
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
         # Add category information
         category = get_category_by_id(product["category_id"])
         product["category"] = category
 
-        return ORJSONResponse(product)
+        return ORJSONResponse(product, etag=etag)
 
     except ValueError:
         return ORJSONResponse({"error": "Invalid product ID"}, status_code=400)
@@ -140,6 +169,7 @@ async def create_product(request):
 
         products_db[product_id_counter] = new_product
         product_id_counter += 1
+        await invalidate_cache("products")
 
         # Add category information
         category = get_category_by_id(new_product["category_id"])
@@ -187,6 +217,7 @@ async def update_product(request):
                 product[field] = value
 
         product["updated_at"] = datetime.utcnow()
+        await invalidate_cache("products")
 
         # Add category information
         category = get_category_by_id(product["category_id"])
@@ -220,6 +251,7 @@ async def delete_product(request):
 
         # Delete product
         del products_db[product_id]
+        await invalidate_cache("products")
 
         return ORJSONResponse({"message": "Product deleted successfully"})
 
@@ -230,11 +262,14 @@ async def delete_product(request):
 
 
 @route("/categories", methods=["GET"])
+@cached(ttl=300, tags=["categories"])
 async def list_categories(request):
     """List all categories"""
     try:
         categories = list(categories_db.values())
-        return ORJSONResponse({"categories": categories, "total": len(categories)})
+        return ORJSONResponse(
+            {"categories": categories, "total": len(categories)}, etag=True
+        )
     except Exception as e:
         return ORJSONResponse({"error": "Internal server error"}, status_code=500)
 
@@ -265,6 +300,7 @@ async def create_category(request):
 
         categories_db[category_id_counter] = new_category
         category_id_counter += 1
+        await invalidate_cache("categories")
 
         return ORJSONResponse(new_category, status_code=201)
 
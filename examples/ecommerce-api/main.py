@@ -67,8 +67,8 @@ async def health_check(request):
 
 
 # Add manual routes
-app_instance.add_route("/", root)
-app_instance.add_route("/health", health_check)
+app_instance.add_route("/", root, static=True)
+app_instance.add_route("/health", health_check, static=True)
 
 # Expose the app for ASGI servers
 app = app_instance.app
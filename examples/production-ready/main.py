@@ -54,7 +54,7 @@ async def root(request):
 
 
 # Add routes
-app_instance.add_route("/", root)
+app_instance.add_route("/", root, static=True)
 
 # Get ASGI app for deployment
 app = app_instance.app
@@ -729,7 +729,7 @@ async def health_check(request):
 
 # Add routes
 app_instance.add_route("/", video_interface)
-app_instance.add_route("/api", root)
+app_instance.add_route("/api", root, static=True)
 app_instance.add_route("/api/streams", list_streams, methods=["GET"])
 app_instance.add_route("/api/streams", create_stream, methods=["POST"])
 app_instance.add_route("/api/streams/{stream_id}", get_stream_info, methods=["GET"])
@@ -1,10 +1,8 @@
 import uvicorn
 import os
-import orjson
 import importlib.util
 import logging
 from starlette.applications import Starlette
-from starlette.responses import JSONResponse
 from starlette.routing import Route, WebSocketRoute
 from starlette.middleware.authentication import AuthenticationMiddleware
 from starlette.middleware.cors import CORSMiddleware
@@ -13,6 +11,7 @@ from app.security import JWTAuthBackend
 from app.settings import settings
 from app.middleware import ErrorHandlingMiddleware, RequestLoggingMiddleware
 from app.ratelimit import RateLimitMiddleware
+from zestapi import StaticJSONResponse
 
 # Configure logging
 logging.basicConfig(
@@ -22,23 +21,21 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class ORJSONResponse(JSONResponse):
-    media_type = "application/json"
-
-    def render(self, content) -> bytes:
-        return orjson.dumps(content)
+# Constant responses, rendered once at import and replayed to every request
+HOMEPAGE = StaticJSONResponse({"hello": "world", "framework": "ZestAPI"})
+HEALTH = StaticJSONResponse(
+    {"status": "healthy", "version": "1.0.0", "timestamp": "2025-07-07T00:00:00Z"}
+)
 
 
 @route("/")
 async def homepage(request):
-    return ORJSONResponse({"hello": "world", "framework": "ZestAPI"})
+    return HOMEPAGE
 
 
 @route("/health")
 async def health_check(request):
-    return ORJSONResponse(
-        {"status": "healthy", "version": "1.0.0", "timestamp": "2025-07-07T00:00:00Z"}
-    )
+    return HEALTH
 
 
 @websocket_route("/ws")
@@ -0,0 +1,171 @@
+"""
+In-process fake Redis server for testing the Redis rate limit store and
+response cache.
+
+Speaks enough RESP2 for their client. Lua scripts are not interpreted: each
+script shipped with the store or cache is recognised by its SHA1 and executed
+by equivalent Python against the fake's own key space.
+"""
+
+import asyncio
+import fnmatch
+import hashlib
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from zestapi.core.cache import CACHE_SCRIPTS
+from zestapi.core.ratelimit import get_algorithm
+from zestapi.core.ratelimit_stores import SCRIPTS
+
+
+class FakeRedisServer:
+    def __init__(self) -> None:
+        self.data: Dict[bytes, tuple] = {}
+        # Strings with their expiry (Unix time), and sets
+        self.strings: Dict[bytes, Tuple[bytes, float]] = {}
+        self.sets: Dict[bytes, Set[bytes]] = {}
+        self.scripts: Dict[str, str] = {}
+        self.commands: List[List[bytes]] = []
+        self.batches = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: List[asyncio.Task] = []
+        self._known = {
+            hashlib.sha1(source.encode()).hexdigest(): name
+            for name, source in SCRIPTS.items()
+        }
+        self._cache_scripts = {
+            hashlib.sha1(source.encode()).hexdigest(): name
+            for name, source in CACHE_SCRIPTS.items()
+        }
+
+    @property
+    def url(self) -> str:
+        assert self._server is not None
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for handler in self._handlers:
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def _handle(self, reader, writer) -> None:
+        # Run the connection in a task we own so stop() can wait for it
+        handler = asyncio.ensure_future(self._serve(reader, writer))
+        self._handlers.append(handler)
+
+    async def _serve(self, reader, writer) -> None:
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                if not reader._buffer:  # end of a pipelined batch
+                    self.batches += 1
+                self.commands.append(command)
+                writer.write(self._encode(self._execute(command)))
+                await writer.drain()
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_command(self, reader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _encode(self, value: Any) -> bytes:
+        if isinstance(value, Exception):
+            return b"-%s\r\n" % str(value).encode()
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            value = value.encode()
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if value is None:
+            return b"$-1\r\n"
+        return b"*%d\r\n" % len(value) + b"".join(self._encode(v) for v in value)
+
+    def _execute(self, command: List[bytes]) -> Any:
+        name = command[0].upper()
+        if name == b"PING":
+            return "PONG"
+        if name == b"GET":
+            value, expires = self.strings.get(command[1], (None, 0.0))
+            return value if expires > time.time() else None
+        if name == b"DEL":
+            return sum(self._delete(key) for key in command[1:])
+        if name == b"SCAN":
+            pattern = command[3].decode()
+            keys = [*self.strings, *self.sets]
+            return [b"0", [k for k in keys if fnmatch.fnmatch(k.decode(), pattern)]]
+        if name == b"EVAL":
+            source = command[1].decode()
+            sha = hashlib.sha1(source.encode()).hexdigest()
+            self.scripts[sha] = source
+            return self._run(sha, command[3:])
+        if name == b"EVALSHA":
+            sha = command[1].decode()
+            if sha not in self.scripts:
+                return Exception("NOSCRIPT No matching script")
+            return self._run(sha, command[3:])
+        return Exception(f"ERR unknown command {name.decode()}")
+
+    def _delete(self, key: bytes) -> int:
+        found = self.strings.pop(key, None) or self.sets.pop(key, None)
+        return int(found is not None)
+
+    def _run_cache_script(self, name: str, args: List[bytes]) -> Any:
+        if name == "set":
+            key, *tag_keys, payload, lifetime = args
+            self.strings[key] = (payload, time.time() + int(lifetime) / 1000)
+            for tag_key in tag_keys:
+                self.sets.setdefault(tag_key, set()).add(key)
+            return 1
+        count = 0
+        for tag_key in args:
+            for key in self.sets.pop(tag_key, set()):
+                count += self._delete(key)
+        return count
+
+    def _run(self, sha: str, args: List[bytes]) -> Any:
+        if sha in self._cache_scripts:
+            return self._run_cache_script(self._cache_scripts[sha], args)
+        key, now, limit, window, increment, force = args
+        algorithm = get_algorithm(self._known[sha], int(limit), int(window))
+        now_f = float(now)
+        state = self.data.get(key)
+        if state is not None and algorithm.expires_at(state) <= now_f:
+            state = None
+
+        if force == b"1":
+            # Batched increments are applied unconditionally
+            window_start = float(int(now_f // algorithm.window) * algorithm.window)
+            previous = current = 0.0
+            if state is not None and state[0] == window_start:
+                previous, current = state[1], state[2]
+            elif state is not None and state[0] == window_start - algorithm.window:
+                previous = state[2]
+            state = (window_start, previous, current + int(increment))
+            allowed, remaining, retry_after = True, 0, 0.0
+        else:
+            allowed, state, remaining, retry_after = algorithm.hit(state, now_f)
+
+        self.data[key] = state
+        reply = [int(allowed), remaining, repr(retry_after)]
+        if algorithm.name == "sliding_window":
+            reply.extend(repr(value) for value in state)
+        return reply
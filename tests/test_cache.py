@@ -0,0 +1,324 @@
+"""
+Tests for the server-side response cache.
+"""
+
+import asyncio
+
+import pytest
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.testclient import TestClient
+
+from tests.fake_redis import FakeRedisServer
+from zestapi import ORJSONResponse, ZestAPI, cached, invalidate_cache
+from zestapi.core.cache import (
+    CachedResponse,
+    MemoryResponseCache,
+    RedisResponseCache,
+    create_response_cache,
+    get_response_cache,
+)
+from zestapi.core.settings import Settings
+
+
+def make_request(path="/items", query=b"", method="GET", headers=()):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": list(headers),
+    }
+    return Request(scope)
+
+
+def make_entry(body=b"{}", tags=(), ttl=60.0, now=1000.0):
+    return CachedResponse(
+        200,
+        [(b"content-type", b"application/json")],
+        body,
+        now + ttl,
+        now + ttl,
+        tuple(tags),
+    )
+
+
+class Counter:
+    """Counts calls of its ``endpoint``"""
+
+    def __init__(self, delay=0.0, status_code=200, headers=None):
+        self.calls = 0
+        self.delay = delay
+        self.status_code = status_code
+        self.headers = headers
+
+    async def endpoint(self, request):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return ORJSONResponse(
+            {"calls": self.calls},
+            status_code=self.status_code,
+            headers=self.headers,
+        )
+
+
+class TestCachedDecorator:
+    """Test cases for caching route responses."""
+
+    async def test_hit_and_miss(self):
+        """Test the second request is served from the cache."""
+        endpoint = Counter()
+        handler = cached(ttl=60, cache=MemoryResponseCache())(endpoint.endpoint)
+
+        first = await handler(make_request())
+        second = await handler(make_request())
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.body == first.body
+        assert second.headers["content-type"] == "application/json"
+        assert endpoint.calls == 1
+
+        # A different query string is a different key
+        await handler(make_request(query=b"page=2"))
+        assert endpoint.calls == 2
+
+    async def test_expiry(self):
+        """Test responses are recomputed after their TTL."""
+        endpoint = Counter()
+        handler = cached(ttl=0.05, cache=MemoryResponseCache())(endpoint.endpoint)
+        await handler(make_request())
+        await asyncio.sleep(0.1)
+        assert (await handler(make_request())).headers["x-cache"] == "MISS"
+        assert endpoint.calls == 2
+
+    async def test_key_and_vary(self):
+        """Test custom keys and varying request headers."""
+        endpoint = Counter()
+        handler = cached(
+            ttl=60,
+            key=lambda request: request.url.path,
+            vary=["accept"],
+            cache=MemoryResponseCache(),
+        )(endpoint.endpoint)
+
+        await handler(make_request(query=b"a=1"))
+        await handler(make_request(query=b"a=2"))
+        assert endpoint.calls == 1
+        await handler(make_request(headers=[(b"accept", b"application/x-ndjson")]))
+        assert endpoint.calls == 2
+
+    @pytest.mark.parametrize(
+        "endpoint, method",
+        [
+            (Counter(), "POST"),
+            (Counter(status_code=404), "GET"),
+            (Counter(headers={"Set-Cookie": "session=1"}), "GET"),
+        ],
+        ids=["post", "error", "cookie"],
+    )
+    async def test_not_cached(self, endpoint, method):
+        """Test writes, errors and responses setting cookies are not stored."""
+        store = MemoryResponseCache()
+        handler = cached(ttl=60, cache=store)(endpoint.endpoint)
+        await handler(make_request(method=method))
+        await handler(make_request(method=method))
+        assert endpoint.calls == 2
+        assert len(store) == 0
+
+    async def test_concurrent_misses_are_coalesced(self):
+        """Test concurrent misses for one key run the handler once."""
+        endpoint = Counter(delay=0.05)
+        handler = cached(ttl=60, cache=MemoryResponseCache())(endpoint.endpoint)
+        responses = await asyncio.gather(*(handler(make_request()) for _ in range(10)))
+        assert endpoint.calls == 1
+        assert {response.body for response in responses} == {b'{"calls":1}'}
+        assert [response.headers["x-cache"] for response in responses] == ["MISS"] * 10
+
+    async def test_stale_while_revalidate(self):
+        """Test expired responses are served while one refresh runs."""
+        endpoint = Counter(delay=0.02)
+        handler = cached(
+            ttl=0.05, stale_while_revalidate=60, cache=MemoryResponseCache()
+        )(endpoint.endpoint)
+        await handler(make_request())
+        await asyncio.sleep(0.1)
+
+        stale = await asyncio.gather(*(handler(make_request()) for _ in range(5)))
+        assert {response.headers["x-cache"] for response in stale} == {"STALE"}
+        assert {response.body for response in stale} == {b'{"calls":1}'}
+
+        await asyncio.sleep(0.05)
+        fresh = await handler(make_request())
+        assert fresh.headers["x-cache"] == "HIT"
+        assert fresh.body == b'{"calls":2}'
+        assert endpoint.calls == 2
+
+    async def test_tag_invalidation(self):
+        """Test invalidating a tag drops only the entries with it."""
+        store = MemoryResponseCache()
+        products = Counter()
+        categories = Counter()
+        product_handler = cached(ttl=60, tags=["products"], cache=store)(
+            products.endpoint
+        )
+        category_handler = cached(
+            ttl=60, tags=lambda request: ["categories"], cache=store
+        )(categories.endpoint)
+        await product_handler(make_request("/products"))
+        await category_handler(make_request("/categories"))
+
+        assert await store.invalidate("products") == 1
+        await product_handler(make_request("/products"))
+        await category_handler(make_request("/categories"))
+        assert products.calls == 2
+        assert categories.calls == 1
+
+    async def test_invalidation_during_miss(self):
+        """Test a response computed before an invalidation is not stored."""
+        store = MemoryResponseCache()
+        handler = cached(ttl=60, tags=["products"], cache=store)(
+            Counter(delay=0.05).endpoint
+        )
+        request = asyncio.ensure_future(handler(make_request()))
+        await asyncio.sleep(0.01)
+        await store.invalidate("products")
+        await request
+        assert len(store) == 0
+
+    async def test_not_modified_from_cache(self):
+        """Test cached responses with an ETag answer If-None-Match with 304."""
+
+        async def endpoint(request):
+            return ORJSONResponse({"ok": True}, etag=True)
+
+        handler = cached(ttl=60, cache=MemoryResponseCache())(endpoint)
+        etag = (await handler(make_request())).headers["etag"].encode()
+        response = await handler(make_request(headers=[(b"if-none-match", etag)]))
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await response(
+            {"type": "http", "method": "GET", "headers": [(b"if-none-match", etag)]},
+            None,
+            send,
+        )
+        assert sent[0]["status"] == 304
+        assert sent[1]["body"] == b""
+
+
+class TestMemoryResponseCache:
+    """Test cases for the in-process LRU."""
+
+    async def test_evicts_least_recently_used(self):
+        """Test entries are evicted by total size, oldest use first."""
+        entry_size = make_entry(b"x" * 100).size
+        store = MemoryResponseCache(max_bytes=entry_size * 4)
+        for name in "abcd":
+            await store.set(name, make_entry(b"x" * 100, now=1e12))
+        assert await store.get("a") is not None
+        await store.set("e", make_entry(b"x" * 100, now=1e12))
+        assert await store.get("b") is None
+        assert await store.get("a") is not None
+        assert store.size == entry_size * 4
+
+        # Entries over a quarter of the budget are not stored
+        await store.set("big", make_entry(b"x" * entry_size, now=1e12))
+        assert await store.get("big") is None
+
+    async def test_expired_entries_are_dropped(self):
+        """Test entries past their stale time are not returned."""
+        store = MemoryResponseCache()
+        await store.set("old", make_entry(now=0.0))
+        assert await store.get("old") is None
+        assert store.size == 0
+
+
+class TestRedisResponseCache:
+    """Test cases for the shared Redis cache."""
+
+    @pytest.fixture
+    async def redis_server(self):
+        server = FakeRedisServer()
+        await server.start()
+        yield server
+        await server.stop()
+
+    async def test_shared_between_workers(self, redis_server):
+        """Test entries and invalidations are shared between instances."""
+        first = RedisResponseCache(redis_server.url)
+        second = RedisResponseCache(redis_server.url)
+        entry = make_entry(b'{"a":1}', tags=["products"], now=1e12)
+        await first.set("key", entry)
+
+        loaded = await second.get("key")
+        assert loaded.body == entry.body
+        assert loaded.headers == entry.headers
+        assert loaded.tags == ("products",)
+
+        assert await second.invalidate("products") == 1
+        assert await first.get("key") is None
+        await first.close()
+        await second.close()
+
+    async def test_fails_open_when_unavailable(self):
+        """Test an unreachable server behaves like an empty cache."""
+        store = RedisResponseCache("redis://127.0.0.1:1/0", timeout=0.2)
+        await store.set("key", make_entry(now=1e12))
+        assert await store.get("key") is None
+        assert await store.invalidate("products") == 0
+        await store.close()
+
+    async def test_fails_open_on_bad_replies(self, redis_server, monkeypatch):
+        """Test error replies and malformed entries are handled as misses."""
+        store = RedisResponseCache(redis_server.url)
+        redis_server.strings[b"zestapi:cache:key"] = (b"not an entry", 1e12)
+        assert await store.get("key") is None
+
+        monkeypatch.setattr(
+            redis_server, "_execute", lambda command: Exception("LOADING loading")
+        )
+        await store.set("key", make_entry(now=1e12))
+        assert await store.get("key") is None
+        assert await store.invalidate("products") == 0
+        await store.close()
+
+    def test_create_response_cache(self):
+        """Test caches are created from storage URLs."""
+        assert isinstance(create_response_cache("memory://"), MemoryResponseCache)
+        store = create_response_cache("redis://localhost:6379/1?prefix=app:")
+        assert isinstance(store, RedisResponseCache)
+        assert store.prefix == "app:"
+        with pytest.raises(ValueError):
+            create_response_cache("memcached://localhost")
+
+
+class TestApplicationCache:
+    """Test cases for cached routes in an application."""
+
+    def test_cached_route(self):
+        """Test @cached routes use the application's shared cache."""
+        settings = Settings()
+        settings.jwt_secret = "test-secret"
+        settings.response_cache_bytes = 1024 * 1024
+        app_instance = ZestAPI(settings=settings)
+        endpoint = Counter()
+        app_instance.add_route(
+            "/items", cached(ttl=60, tags=["items"])(endpoint.endpoint)
+        )
+
+        @app_instance.route("/items", methods=["POST"])
+        async def create_item(request):
+            await invalidate_cache("items")
+            return PlainTextResponse("created", status_code=201)
+
+        client = TestClient(app_instance.create_app())
+        assert get_response_cache() is app_instance.response_cache
+        assert get_response_cache().max_bytes == 1024 * 1024
+
+        assert client.get("/items").json() == {"calls": 1}
+        assert client.get("/items").headers["x-cache"] == "HIT"
+        client.post("/items")
+        assert client.get("/items").json() == {"calls": 2}
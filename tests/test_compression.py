@@ -0,0 +1,287 @@
+"""
+Tests for response compression.
+"""
+
+import gzip
+import zlib
+
+import anyio
+import orjson
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ORJSONStreamingResponse, ZestAPI
+from zestapi.core import compression
+from zestapi.core.compression import (
+    CompressedCache,
+    CompressionMiddleware,
+    StreamCompressor,
+    available_encodings,
+    negotiate,
+)
+from zestapi.core.metrics import MetricsRegistry
+from zestapi.core.settings import Settings
+
+ITEMS = [{"id": i, "name": f"product {i}"} for i in range(200)]
+
+
+async def items(request):
+    return ORJSONResponse(ITEMS)
+
+
+async def tiny(request):
+    return ORJSONResponse({"ok": True})
+
+
+async def text(request):
+    return PlainTextResponse("hello " * 200)
+
+
+async def image(request):
+    return Response(b"\x89PNG" + b"\0" * 2000, media_type="image/png")
+
+
+async def tagged(request):
+    return ORJSONResponse(ITEMS, headers={"ETag": '"v1"'})
+
+
+async def variants(request):
+    # One version ETag for every variant, as handlers using version_etag do
+    category = request.query_params.get("category", "")
+    tenant = request.headers.get("x-tenant", "")
+    return ORJSONResponse(
+        [{**item, "category": category, "tenant": tenant} for item in ITEMS],
+        headers={"ETag": '"v1"', "Vary": "X-Tenant"},
+    )
+
+
+async def stream(request):
+    return ORJSONStreamingResponse(ITEMS, format="ndjson", flush_size=1024)
+
+
+def make_client(**options):
+    app = Starlette(
+        routes=[
+            Route(path, endpoint)
+            for path, endpoint in (
+                ("/items", items),
+                ("/tiny", tiny),
+                ("/text", text),
+                ("/image", image),
+                ("/tagged", tagged),
+                ("/variants", variants),
+                ("/stream", stream),
+            )
+        ]
+    )
+    middleware = CompressionMiddleware(app, **options)
+    return middleware, TestClient(middleware)
+
+
+def get_raw(client, path, encoding):
+    """Response and its body, left encoded"""
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def send_messages(app, path, encoding):
+    """Messages sent by ``app`` for a GET request"""
+    messages = []
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": [(b"accept-encoding", encoding.encode())],
+    }
+
+    async def receive():
+        await anyio.sleep_forever()
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await app(scope, receive, send)
+
+    anyio.run(run)
+    return messages
+
+
+class TestNegotiation:
+    """Test cases for choosing an encoding from Accept-Encoding."""
+
+    @pytest.mark.parametrize(
+        "header, expected",
+        [
+            ("gzip", "gzip"),
+            ("gzip, deflate, br, zstd", "zstd"),
+            ("br;q=0.5, gzip;q=0.9", "gzip"),
+            ("zstd;q=0, br", "br"),
+            ("*", "zstd"),
+            ("*;q=0.5, gzip", "gzip"),
+            ("gzip;q=0", None),
+            ("identity", None),
+            ("", None),
+            ("gzip;q=invalid, br", "br"),
+        ],
+    )
+    def test_negotiate(self, header, expected):
+        """Test the highest quality wins and server order breaks ties."""
+        assert negotiate(header, ("zstd", "br", "gzip")) == expected
+
+    def test_unavailable_encodings_are_skipped(self, monkeypatch):
+        """Test encodings whose library is missing are not offered."""
+        monkeypatch.setattr(compression, "brotli", None)
+        monkeypatch.setattr(compression, "zstandard", None)
+        assert available_encodings() == ("gzip",)
+        middleware, client = make_client()
+        assert middleware.encodings == ("gzip",)
+        response = client.get("/items", headers={"Accept-Encoding": "br, gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+
+
+class TestCompressionMiddleware:
+    """Test cases for compressing responses."""
+
+    def test_gzip(self):
+        """Test a large JSON body is gzipped with matching headers."""
+        _, client = make_client()
+        response, raw = get_raw(client, "/items", "gzip")
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) == len(raw)
+        assert gzip.decompress(raw) == ORJSONResponse(ITEMS).body
+
+    @pytest.mark.parametrize("encoding", ["br", "zstd"])
+    def test_optional_encodings(self, encoding):
+        """Test brotli and zstd when their libraries are installed."""
+        if encoding not in available_encodings():
+            pytest.skip(f"{encoding} library not installed")
+        _, client = make_client()
+        response, raw = get_raw(client, "/items", encoding)
+        assert response.headers["content-encoding"] == encoding
+        assert len(raw) < len(ORJSONResponse(ITEMS).body)
+
+    def test_skipped_responses(self):
+        """Test small, binary and unaccepted responses are sent as is."""
+        _, client = make_client()
+        tiny_response = client.get("/tiny", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in tiny_response.headers
+        assert tiny_response.headers["vary"] == "Accept-Encoding"
+
+        image_response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in image_response.headers
+        assert "vary" not in image_response.headers
+
+        identity = client.get("/items", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in identity.headers
+        assert identity.json() == ITEMS
+
+        text_response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+        assert text_response.headers["content-encoding"] == "gzip"
+
+    def test_minimum_size_setting(self):
+        """Test the size threshold is configurable."""
+        _, client = make_client(minimum_size=5)
+        response = client.get("/tiny", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == {"ok": True}
+
+    def test_streaming(self):
+        """Test streamed chunks are compressed and flushed one by one."""
+        middleware, _ = make_client()
+        start, *bodies = send_messages(middleware, "/stream", "gzip")
+        headers = dict(start["headers"])
+        assert headers[b"content-encoding"] == b"gzip"
+        assert b"content-length" not in headers
+
+        assert len(bodies) > 2
+        decompressor = zlib.decompressobj(31)
+        lines = b""
+        # Each chunk decompresses to whole lines without waiting for the next
+        for message in bodies[:-1]:
+            assert message["more_body"]
+            data = decompressor.decompress(message["body"])
+            assert data.endswith(b"\n")
+            lines += data
+        assert not bodies[-1]["more_body"]
+        lines += decompressor.decompress(bodies[-1]["body"])
+        assert decompressor.eof
+        assert [orjson.loads(line) for line in lines.splitlines()] == ITEMS
+
+    def test_etag_cache(self):
+        """Test bodies with an ETag are compressed once and the ETag is
+        weakened."""
+        registry = MetricsRegistry()
+        middleware, client = make_client(metrics=registry)
+        first = client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+        second = client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+        assert first.headers["etag"] == 'W/"v1"'
+        assert first.content == second.content
+        assert len(middleware.cache) == 1
+
+        exposition = registry.exposition().decode()
+        assert 'zestapi_compression_cache_hits_total{encoding="gzip"} 1' in (exposition)
+        assert 'zestapi_compression_seconds_total{encoding="gzip"}' in exposition
+        raw_size = len(ORJSONResponse(ITEMS).body)
+        assert (
+            f'zestapi_compression_input_bytes_total{{encoding="gzip"}} {raw_size}'
+            in exposition
+        )
+
+    def test_etag_cache_keeps_variants_apart(self):
+        """Test variants sharing an ETag are cached by query string and the
+        request headers named in Vary."""
+        middleware, client = make_client()
+        gzip_only = {"Accept-Encoding": "gzip"}
+        for category in ("a", "b", "a"):
+            response = client.get(f"/variants?category={category}", headers=gzip_only)
+            assert {item["category"] for item in response.json()} == {category}
+        for tenant in ("x", "y"):
+            response = client.get(
+                "/variants?category=a", headers={**gzip_only, "X-Tenant": tenant}
+            )
+            assert {item["tenant"] for item in response.json()} == {tenant}
+        assert len(middleware.cache) == 4
+
+    def test_enabled_by_setting(self):
+        """Test the application adds the middleware when enabled."""
+        settings = Settings()
+        settings.jwt_secret = "test-secret"
+        settings.compression = True
+        app_instance = ZestAPI(settings=settings)
+        app_instance.add_route("/items", items)
+        client = TestClient(app_instance.create_app())
+        response = client.get("/items", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == ITEMS
+
+
+class TestHelpers:
+    """Test cases for the compressor and cache helpers."""
+
+    def test_stream_compressor(self):
+        """Test chunked output decompresses to the input."""
+        compressor = StreamCompressor("gzip", 6)
+        data = compressor.compress(b"a" * 1000) + compressor.compress(b"b" * 1000)
+        data += compressor.finish()
+        assert gzip.decompress(data) == b"a" * 1000 + b"b" * 1000
+
+    def test_cache_evicts_by_size(self):
+        """Test the least recently used bodies are evicted over the budget."""
+        cache = CompressedCache(max_bytes=400)
+        cache.put(("/", "a", "gzip"), b"a" * 100)
+        cache.put(("/", "b", "gzip"), b"b" * 100)
+        cache.put(("/", "c", "gzip"), b"c" * 100)
+        assert cache.get(("/", "a", "gzip")) is not None
+        cache.put(("/", "d", "gzip"), b"d" * 100)
+        cache.put(("/", "e", "gzip"), b"e" * 100)
+        assert cache.get(("/", "b", "gzip")) is None
+        assert cache.get(("/", "a", "gzip")) is not None
+        assert cache.size == 400
+        # Bodies over a quarter of the budget are not cached
+        cache.put(("/", "big", "gzip"), b"x" * 101)
+        assert cache.get(("/", "big", "gzip")) is None
@@ -0,0 +1,183 @@
+"""
+Tests for ETags and conditional requests.
+"""
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI, not_modified, version_etag
+from zestapi.core.conditional import (
+    ConditionalMiddleware,
+    compute_etag,
+    etag_matches,
+)
+from zestapi.core.settings import Settings
+
+DATA = {"items": list(range(300))}
+
+
+def make_client():
+    renders = []
+
+    async def data(request):
+        return ORJSONResponse(DATA, headers={"Cache-Control": "max-age=60"})
+
+    async def versioned(request):
+        etag = version_etag("catalog", 3)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        renders.append(1)
+        return ORJSONResponse(DATA, etag=etag)
+
+    async def stream(request):
+        async def chunks():
+            yield b"a"
+            yield b"b"
+
+        return StreamingResponse(chunks(), headers={"ETag": '"s1"'})
+
+    async def untagged_stream(request):
+        return StreamingResponse(iter([b"a", b"b"]), media_type="text/plain")
+
+    async def missing(request):
+        return PlainTextResponse("missing", status_code=404)
+
+    app = Starlette(
+        routes=[
+            Route("/data", data, methods=["GET", "POST"]),
+            Route("/versioned", versioned),
+            Route("/stream", stream),
+            Route("/untagged-stream", untagged_stream),
+            Route("/missing", missing),
+        ]
+    )
+    return TestClient(ConditionalMiddleware(app)), renders
+
+
+class TestETags:
+    """Test cases for ETag helpers."""
+
+    def test_compute_etag(self):
+        """Test body ETags are quoted and depend on the body."""
+        etag = compute_etag(b"body")
+        assert etag.startswith('"') and etag.endswith('"')
+        assert etag == compute_etag(b"body")
+        assert etag != compute_etag(b"other")
+        assert version_etag(1, "a") != version_etag(1, "b")
+
+    @pytest.mark.parametrize(
+        "header, matches",
+        [
+            ('"x"', True),
+            ('W/"x"', True),
+            ('"y", "x"', True),
+            ("*", True),
+            ('"y"', False),
+            ('"xx"', False),
+        ],
+    )
+    def test_etag_matches(self, header, matches):
+        """Test If-None-Match uses weak comparison."""
+        assert etag_matches(header, '"x"') is matches
+
+
+class TestConditionalMiddleware:
+    """Test cases for adding ETags and answering with 304."""
+
+    def test_etag_and_not_modified(self):
+        """Test a matching If-None-Match gets an empty 304."""
+        client, _ = make_client()
+        response = client.get("/data")
+        etag = response.headers["etag"]
+        assert etag == compute_etag(response.content)
+
+        response = client.get("/data", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert response.headers["cache-control"] == "max-age=60"
+        assert "content-type" not in response.headers
+        assert "content-length" not in response.headers
+
+        weak = client.get("/data", headers={"If-None-Match": f"W/{etag}"})
+        assert weak.status_code == 304
+        changed = client.get("/data", headers={"If-None-Match": '"other"'})
+        assert changed.status_code == 200
+        assert changed.json() == DATA
+
+    def test_skipped_responses(self):
+        """Test errors, other methods and untagged streams get no ETag."""
+        client, _ = make_client()
+        assert "etag" not in client.get("/missing").headers
+        assert "etag" not in client.post("/data").headers
+        response = client.get("/untagged-stream")
+        assert response.text == "ab"
+        assert "etag" not in response.headers
+
+    def test_tagged_stream(self):
+        """Test streaming responses with an ETag are compared too."""
+        client, _ = make_client()
+        response = client.get("/stream", headers={"If-None-Match": '"s1"'})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert client.get("/stream").content == b"ab"
+
+    def test_version_etag_skips_rendering(self):
+        """Test handlers can answer 304 before building the response."""
+        client, renders = make_client()
+        response = client.get("/versioned")
+        assert response.headers["etag"] == version_etag("catalog", 3)
+        assert len(renders) == 1
+
+        response = client.get(
+            "/versioned", headers={"If-None-Match": response.headers["etag"]}
+        )
+        assert response.status_code == 304
+        assert len(renders) == 1
+
+
+class TestORJSONResponseETag:
+    """Test cases for ETags set by ORJSONResponse itself."""
+
+    def test_etag_option(self):
+        """Test etag=True hashes the body and answers matching requests with
+        304 without any middleware."""
+
+        async def endpoint(request):
+            return ORJSONResponse(DATA, etag=True)
+
+        client = TestClient(Starlette(routes=[Route("/", endpoint)]))
+        response = client.get("/")
+        assert response.headers["etag"] == compute_etag(response.content)
+
+        response = client.get("/", headers={"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_enabled_by_setting(self):
+        """Test the application adds the middleware when enabled."""
+        settings = Settings()
+        settings.jwt_secret = "test-secret"
+        settings.etags = True
+        settings.compression = True
+        app_instance = ZestAPI(settings=settings)
+
+        @app_instance.route("/data")
+        async def data(request):
+            return ORJSONResponse(DATA)
+
+        client = TestClient(app_instance.create_app())
+        response = client.get("/data", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        # Compression weakens the ETag, which still matches
+        etag = response.headers["etag"]
+        assert etag.startswith("W/")
+        response = client.get(
+            "/data", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert "content-encoding" not in response.headers
@@ -0,0 +1,179 @@
+"""
+Tests for the bounded CPU executor.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI, run_cpu_bound
+from zestapi.core.executor import (
+    CPUExecutor,
+    ExecutorBusy,
+    get_cpu_executor,
+    set_cpu_executor,
+)
+from zestapi.core.metrics import MetricsRegistry
+from zestapi.core.settings import Settings
+
+
+def blocking_work(seconds, result="done"):
+    time.sleep(seconds)
+    return result
+
+
+class TestCPUExecutor:
+    """Test cases for running CPU-bound calls off the event loop."""
+
+    async def test_run(self):
+        """Test results, keyword arguments and exceptions are passed through."""
+        executor = CPUExecutor(max_workers=2)
+        assert await executor.run(pow, 2, 10) == 1024
+        assert await executor.run(blocking_work, 0, result="kw") == "kw"
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(divmod, 1, 0)
+
+        stats = executor.stats()
+        assert stats["completed"] == 2
+        assert stats["failed"] == 1
+        assert stats["active"] == stats["queued"] == 0
+        executor.shutdown()
+
+    async def test_event_loop_keeps_running(self):
+        """Test other coroutines run while a call blocks a worker."""
+        executor = CPUExecutor(max_workers=1)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        await executor.run(blocking_work, 0.1)
+        task.cancel()
+        assert ticks > 5
+        executor.shutdown()
+
+    async def test_backpressure(self):
+        """Test calls beyond workers plus queue are rejected."""
+        executor = CPUExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert executor.stats()["active"] == 1
+        assert executor.stats()["queued"] == 1
+
+        with pytest.raises(ExecutorBusy) as exc_info:
+            await executor.run(pow, 2, 2)
+        assert exc_info.value.status_code == 503
+        assert executor.stats()["rejected"] == 1
+
+        release.set()
+        await asyncio.gather(*running)
+        assert await executor.run(pow, 2, 2) == 4
+        executor.shutdown()
+
+    async def test_metrics(self):
+        """Test running and queued calls are exported as gauges."""
+        registry = MetricsRegistry()
+        executor = CPUExecutor(max_workers=1, metrics=registry)
+        release = threading.Event()
+        running = [asyncio.create_task(executor.run(release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        _, values = registry.collect()
+        assert values[("zestapi_cpu_executor_running_tasks", "")] == 1
+        assert values[("zestapi_cpu_executor_queued_tasks", "")] == 2
+
+        release.set()
+        await asyncio.gather(*running)
+        _, values = registry.collect()
+        assert values[("zestapi_cpu_executor_running_tasks", "")] == 0
+        assert values[("zestapi_cpu_executor_queued_tasks", "")] == 0
+        executor.shutdown()
+
+    async def test_queue_timeout(self):
+        """Test a full queue waits up to queue_timeout for a slot."""
+        executor = CPUExecutor(max_workers=1, max_queue=0, queue_timeout=1.0)
+        first = asyncio.create_task(executor.run(blocking_work, 0.05, result=1))
+        await asyncio.sleep(0.01)
+        assert await executor.run(blocking_work, 0, result=2) == 2
+        assert await first == 1
+        assert executor.stats()["rejected"] == 0
+        executor.shutdown()
+
+    async def test_process_pool(self):
+        """Test calls can run in worker processes."""
+        executor = CPUExecutor(max_workers=1, kind="process")
+        assert await executor.run(pow, 3, 3) == 27
+        executor.shutdown()
+
+    def test_invalid_kind(self):
+        """Test unknown pool kinds are rejected."""
+        with pytest.raises(ValueError):
+            CPUExecutor(kind="fiber")
+
+
+class TestApplicationExecutor:
+    """Test cases for the executor configured by the application."""
+
+    def test_run_cpu_bound(self):
+        """Test handlers use the executor sized from settings."""
+        settings = Settings()
+        settings.cpu_executor_workers = 2
+        settings.cpu_executor_max_queue = 0
+        app_instance = ZestAPI(settings=settings)
+
+        @app_instance.route("/hash")
+        async def hash_route(request):
+            return ORJSONResponse({"value": await run_cpu_bound(pow, 2, 8)})
+
+        with TestClient(app_instance.create_app()) as client:
+            assert client.get("/hash").json() == {"value": 256}
+
+        assert get_cpu_executor() is app_instance.cpu_executor
+        stats = app_instance.cpu_executor.stats()
+        assert stats["workers"] == 2
+        assert stats["completed"] == 1
+
+    def test_busy_returns_503(self):
+        """Test rejected calls are served as 503 with Retry-After."""
+        app_instance = ZestAPI(settings=Settings())
+
+        @app_instance.route("/busy")
+        async def busy(request):
+            raise ExecutorBusy()
+
+        client = TestClient(app_instance.create_app())
+        response = client.get("/busy")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+    def test_shared_executor_is_kept(self):
+        """Test an application only replaces an installed executor when its
+        settings configure one."""
+        settings = Settings()
+        settings.cpu_executor_workers = 3
+        first = ZestAPI(settings=settings)
+        first.create_app()
+        installed = get_cpu_executor()
+        assert installed is first.cpu_executor
+
+        second = ZestAPI(settings=Settings())
+        with TestClient(second.create_app()):
+            pass
+        assert second.cpu_executor is installed
+        assert get_cpu_executor() is installed
+        assert installed.max_workers == 3
+
+        configured = Settings()
+        configured.cpu_executor_max_queue = 8
+        third = ZestAPI(settings=configured)
+        third.create_app()
+        assert get_cpu_executor() is third.cpu_executor
+        assert third.cpu_executor.max_queue == 8
+        set_cpu_executor(None)
@@ -0,0 +1,127 @@
+"""
+Tests for the built-in HMAC JWT implementation, cross-checked against
+python-jose.
+"""
+
+import time
+
+import pytest
+from jose import jws, jwt
+from jose.exceptions import JWTError
+
+from zestapi.core import hmac_jwt
+from zestapi.core.security import (
+    HMACJWTAuthBackend,
+    JWTAuthBackend,
+    create_access_token,
+    create_auth_backend,
+)
+
+SECRET = "test-secret-key-for-testing-only"
+ALGORITHMS = ["HS256", "HS384", "HS512"]
+
+
+def jose_error(token, algorithm="HS256", secret=SECRET):
+    """The python-jose exception type raised for a token, or None"""
+    try:
+        jwt.decode(token, secret, algorithms=[algorithm])
+    except JWTError as e:
+        return type(e)
+    return None
+
+
+def hmac_error(token, algorithm="HS256", secret=SECRET):
+    try:
+        hmac_jwt.decode(token, hmac_jwt.HMACKey(secret, algorithm))
+    except JWTError as e:
+        return type(e)
+    return None
+
+
+def signed(payload, algorithm="HS256", secret=SECRET, **headers):
+    return jws.sign(payload, secret, algorithm=algorithm, headers=headers or None)
+
+
+NOW = int(time.time())
+
+INVALID_TOKENS = {
+    "expired": signed({"sub": "a", "exp": NOW - 10}),
+    "not yet valid": signed({"sub": "a", "nbf": NOW + 60}),
+    "wrong secret": signed({"sub": "a"}, secret="other-secret"),
+    "wrong algorithm": signed({"sub": "a"}, algorithm="HS512"),
+    "audience": signed({"sub": "a", "aud": "billing"}),
+    "integer subject": signed({"sub": 42}),
+    "integer jti": signed({"sub": "a", "jti": 7}),
+    "at_hash": signed({"sub": "a", "at_hash": "abc"}),
+    "list payload": signed(b"[1, 2]"),
+    "tampered": signed({"sub": "a"})[:-4] + "AAAA",
+    "two segments": "abc.def",
+    "garbage": "not.a.token",
+    "unsigned": "eyJhbGciOiJub25lIn0.eyJzdWIiOiJhIn0.",
+}
+
+
+class TestHMACJWT:
+    """Test cases for HS256/HS384/HS512 signing and verification."""
+
+    @pytest.mark.parametrize("algorithm", ALGORITHMS)
+    def test_interoperates_with_jose(self, algorithm):
+        """Test tokens from either implementation verify with the other."""
+        claims = {"sub": "alice", "role": "admin", "exp": NOW + 60, "iat": NOW}
+        key = hmac_jwt.HMACKey(SECRET, algorithm)
+
+        ours = hmac_jwt.encode(claims, key)
+        theirs = jwt.encode(claims, SECRET, algorithm=algorithm)
+        assert ours == theirs
+        assert jwt.decode(ours, SECRET, algorithms=[algorithm]) == claims
+        assert hmac_jwt.decode(theirs, key) == claims
+
+    @pytest.mark.parametrize("name", sorted(INVALID_TOKENS))
+    def test_rejects_like_jose(self, name):
+        """Test invalid tokens fail with the same exception type."""
+        token = INVALID_TOKENS[name]
+        assert jose_error(token) is not None
+        assert hmac_error(token) is jose_error(token)
+
+    def test_time_claims(self):
+        """Test exp and nbf boundaries match python-jose's."""
+        key = hmac_jwt.HMACKey(SECRET)
+        token = hmac_jwt.encode({"nbf": 100, "exp": 200}, key)
+        assert hmac_jwt.decode(token, key, now=100)
+        assert hmac_jwt.decode(token, key, now=200)
+        with pytest.raises(JWTError):
+            hmac_jwt.decode(token, key, now=99)
+        with pytest.raises(jwt.ExpiredSignatureError):
+            hmac_jwt.decode(token, key, now=201)
+
+    def test_unsupported_algorithm(self):
+        """Test only HMAC algorithms are accepted."""
+        with pytest.raises(ValueError):
+            hmac_jwt.HMACKey(SECRET, "RS256")
+        with pytest.raises(ValueError):
+            HMACJWTAuthBackend("RS256")
+
+
+class TestBackendSelection:
+    """Test cases for choosing the JWT backend from the algorithm."""
+
+    def test_create_auth_backend(self):
+        """Test HMAC algorithms use the built-in implementation."""
+        for algorithm in ALGORITHMS:
+            backend = create_auth_backend(algorithm, cache_size=0)
+            assert isinstance(backend, HMACJWTAuthBackend)
+            assert backend.algorithm == algorithm
+        assert type(create_auth_backend("RS256")) is JWTAuthBackend
+
+    @pytest.mark.parametrize("algorithm", ALGORITHMS)
+    def test_access_tokens(self, monkeypatch, algorithm):
+        """Test access tokens round trip through both backends."""
+        from zestapi.core.settings import settings
+
+        monkeypatch.setattr(settings, "jwt_secret", SECRET)
+        token = create_access_token({"sub": "alice"}, algorithm=algorithm)
+
+        for backend_class in (JWTAuthBackend, HMACJWTAuthBackend):
+            backend = backend_class(algorithm, cache_size=0)
+            _, user = backend._verify(token)
+            assert user.username == "alice"
@@ -0,0 +1,211 @@
+"""
+Tests for JWKS key sets and asymmetric JWT verification.
+"""
+
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+from starlette.responses import JSONResponse
+from starlette.testclient import TestClient
+
+from zestapi import ZestAPI
+from zestapi.core import jwks as jwks_module
+from zestapi.core.jwks import JWKSKeySet
+from zestapi.core.security import JWKSAuthBackend, create_auth_backend
+from zestapi.core.settings import Settings
+
+
+def private_pem(key):
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+def make_key(kid, algorithm="RS256"):
+    """Private PEM and public JWK for a new signing key"""
+    if algorithm.startswith("ES"):
+        private = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_pem(private)
+    public = jwk.construct(pem, algorithm).public_key().to_dict()
+    public.update({"kid": kid, "use": "sig"})
+    return pem, public
+
+
+RSA_PEM, RSA_JWK = make_key("rsa-1")
+EC_PEM, EC_JWK = make_key("ec-1", "ES256")
+NEW_PEM, NEW_JWK = make_key("rsa-2")
+
+
+def write_jwks(path, *keys):
+    path.write_text(json.dumps({"keys": list(keys)}))
+    return str(path)
+
+
+def token(pem, kid, algorithm="RS256", **claims):
+    claims = {"sub": "alice", "exp": int(time.time()) + 60, **claims}
+    return jwt.encode(claims, pem, algorithm=algorithm, headers={"kid": kid})
+
+
+class TestJWKSKeySet:
+    """Test cases for loading and refreshing a JWKS."""
+
+    def test_load(self, tmp_path):
+        """Test keys are indexed by kid with their algorithm."""
+        key_set = JWKSKeySet(write_jwks(tmp_path / "jwks.json", RSA_JWK, EC_JWK))
+        key_set.load()
+
+        assert sorted(key_set.kids) == ["ec-1", "rsa-1"]
+        assert key_set.get("rsa-1").algorithm == "RS256"
+        assert key_set.get("ec-1").algorithm == "ES256"
+        # Ambiguous without a kid
+        assert key_set.get(None) is None
+
+    def test_unsupported_keys_are_skipped(self, tmp_path):
+        """Test symmetric and encryption keys are never used to verify."""
+        oct_key = {"kty": "oct", "kid": "hmac", "k": "c2VjcmV0", "alg": "HS256"}
+        enc_key = {**NEW_JWK, "use": "enc"}
+        key_set = JWKSKeySet(
+            write_jwks(tmp_path / "jwks.json", RSA_JWK, oct_key, enc_key)
+        )
+        key_set.load()
+        assert key_set.kids == ["rsa-1"]
+        assert key_set.get(None) is key_set.get("rsa-1")
+
+    def test_keys_are_parsed_once(self, tmp_path, monkeypatch):
+        """Test keys are reused across requests and unchanged refreshes."""
+        path = write_jwks(tmp_path / "jwks.json", RSA_JWK)
+        key_set = JWKSKeySet(path)
+        key_set.load()
+        value = token(RSA_PEM, "rsa-1")
+
+        constructed = []
+        construct = jwks_module.jwk.construct
+        monkeypatch.setattr(
+            jwks_module.jwk,
+            "construct",
+            lambda *args: constructed.append(args) or construct(*args),
+        )
+        backend = JWKSAuthBackend(key_set, cache_size=0)
+        for _ in range(3):
+            assert backend._verify(value)[1].username == "alice"
+
+        write_jwks(tmp_path / "jwks.json", RSA_JWK, NEW_JWK)
+        key_set.load()
+        assert [args[0]["kid"] for args in constructed] == ["rsa-2"]
+
+    async def test_stale_keys_survive_failed_refresh(self, tmp_path):
+        """Test a failed refresh keeps serving the cached keys."""
+        path = tmp_path / "jwks.json"
+        key_set = JWKSKeySet(write_jwks(path, RSA_JWK))
+        key_set.load()
+
+        path.write_text("not json")
+        assert await key_set.refresh() is False
+        assert key_set.kids == ["rsa-1"]
+
+        path.unlink()
+        assert await key_set.refresh() is False
+        assert key_set.kids == ["rsa-1"]
+
+    async def test_unknown_kid_triggers_refresh(self, tmp_path):
+        """Test a rotated-in key is picked up by a background refresh."""
+        path = tmp_path / "jwks.json"
+        key_set = JWKSKeySet(write_jwks(path, RSA_JWK), min_refresh_interval=0)
+        key_set.load()
+        backend = JWKSAuthBackend(key_set)
+        new_token = token(NEW_PEM, "rsa-2")
+
+        write_jwks(path, RSA_JWK, NEW_JWK)
+        # Rejected while the key set refreshes in the background
+        with pytest.raises(JWTError):
+            backend._verify(new_token)
+        await key_set._refresh_task
+        assert backend._verify(new_token)[1].username == "alice"
+
+    async def test_refreshes_are_rate_limited(self, tmp_path):
+        """Test unknown kids don't refresh more than once per interval."""
+        key_set = JWKSKeySet(write_jwks(tmp_path / "jwks.json", RSA_JWK))
+        key_set.load()
+        assert key_set.get("unknown") is None
+        assert key_set._refresh_task is None
+
+
+class TestJWKSAuthBackend:
+    """Test cases for verifying tokens against a JWKS."""
+
+    @pytest.fixture
+    def backend(self, tmp_path):
+        key_set = JWKSKeySet(write_jwks(tmp_path / "jwks.json", RSA_JWK, EC_JWK))
+        key_set.load()
+        return JWKSAuthBackend(key_set)
+
+    @pytest.mark.parametrize(
+        "pem,kid,algorithm", [(RSA_PEM, "rsa-1", "RS256"), (EC_PEM, "ec-1", "ES256")]
+    )
+    def test_verifies(self, backend, pem, kid, algorithm):
+        """Test RS256 and ES256 tokens verify with their kid's key."""
+        _, user = backend._verify(token(pem, kid, algorithm))
+        assert user.username == "alice"
+
+    def test_rejects(self, backend):
+        """Test wrong keys, algorithms and claims are rejected."""
+        invalid = [
+            # Signed by a key not in the set, claiming a known kid
+            token(NEW_PEM, "rsa-1"),
+            # Algorithm doesn't match the key
+            token(RSA_PEM, "rsa-1", "RS512"),
+            # HMAC token signed with the public key
+            jwt.encode({"sub": "alice"}, json.dumps(RSA_JWK), headers={"kid": "rsa-1"}),
+            token(RSA_PEM, "rsa-1", exp=int(time.time()) - 10),
+            token(RSA_PEM, "unknown"),
+        ]
+        for value in invalid:
+            with pytest.raises(JWTError):
+                backend._verify(value)
+
+    def test_rotation_clears_cache(self, tmp_path):
+        """Test tokens signed by a removed key stop verifying."""
+        path = tmp_path / "jwks.json"
+        key_set = JWKSKeySet(write_jwks(path, RSA_JWK, NEW_JWK))
+        key_set.load()
+        backend = JWKSAuthBackend(key_set)
+        old_token = token(RSA_PEM, "rsa-1")
+        assert backend._verify(old_token)
+        assert backend._verify(old_token)
+        assert backend.cache_hits == 1
+
+        write_jwks(path, NEW_JWK)
+        key_set.load()
+        with pytest.raises(JWTError):
+            backend._verify(old_token)
+
+    def test_create_auth_backend(self, backend):
+        """Test a key set selects the JWKS backend."""
+        selected = create_auth_backend("RS256", key_set=backend.key_set)
+        assert isinstance(selected, JWKSAuthBackend)
+
+    def test_application(self, tmp_path):
+        """Test an application authenticates requests with a JWKS."""
+        settings = Settings()
+        settings.jwt_jwks = write_jwks(tmp_path / "jwks.json", RSA_JWK)
+        settings.jwt_algorithm = "RS256"
+        app_instance = ZestAPI(settings=settings, routes_dir=str(tmp_path))
+
+        @app_instance.route("/me")
+        async def me(request):
+            return JSONResponse({"user": request.user.display_name})
+
+        with TestClient(app_instance.create_app()) as client:
+            headers = {"Authorization": f"Bearer {token(RSA_PEM, 'rsa-1')}"}
+            assert client.get("/me", headers=headers).json() == {"user": "alice"}
+            assert client.get("/me").json() == {"user": ""}
+        assert isinstance(app_instance.auth_backend, JWKSAuthBackend)
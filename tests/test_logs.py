@@ -0,0 +1,243 @@
+"""
+Tests for the queued, non-blocking log handlers.
+"""
+
+import io
+import logging
+import sys
+import threading
+
+import orjson
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from zestapi import ZestAPI
+from zestapi.core.logs import (
+    BatchRotatingFileHandler,
+    BatchStreamHandler,
+    JSONFormatter,
+    LazyValue,
+    QueueLogHandler,
+)
+from zestapi.core.middleware import CoreMiddleware
+from zestapi.core.settings import Settings
+
+
+class BlockingHandler(logging.Handler):
+    """Collects messages, holding the writer thread until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+        self.messages = []
+        self.flushes = 0
+
+    def emit(self, record):
+        self.unblock.wait(5)
+        self.messages.append(record.getMessage())
+
+    def flush(self):
+        self.flushes += 1
+
+
+def make_logger(handler):
+    test_logger = logging.getLogger(f"zestapi.tests.logs.{id(handler)}")
+    test_logger.propagate = False
+    test_logger.setLevel(logging.INFO)
+    test_logger.addHandler(handler)
+    return test_logger
+
+
+class TestQueueLogHandler:
+    """Test cases for writing log records from a background thread."""
+
+    def test_records_are_written_in_order(self):
+        """Test every record reaches the handler with its arguments."""
+        stream = io.StringIO()
+        handler = BatchStreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        queued = QueueLogHandler([handler])
+        test_logger = make_logger(queued)
+
+        items = ["a"]
+        test_logger.info("items: %s", items)
+        # Arguments are captured when the record is logged
+        items.append("b")
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            test_logger.exception("failed")
+        queued.close()
+
+        lines = stream.getvalue().splitlines()
+        assert lines[0] == "INFO items: ['a']"
+        assert lines[1] == "ERROR failed"
+        assert "RuntimeError: boom" in stream.getvalue()
+
+    @pytest.mark.parametrize(
+        "drop,expected", [("new", ["0", "1", "2"]), ("oldest", ["0", "3", "4"])]
+    )
+    def test_drop_policy(self, drop, expected):
+        """Test a full queue drops records and counts them."""
+        target = BlockingHandler()
+        queued = QueueLogHandler([target], queue_size=2, drop=drop)
+        test_logger = make_logger(queued)
+
+        test_logger.info("0")
+        # Wait for the writer to take the first record and block on it
+        while queued.queue.qsize():
+            pass
+        for index in range(1, 5):
+            test_logger.info(str(index))
+        assert queued.dropped == 2
+
+        target.unblock.set()
+        queued.close()
+        report = "Log queue full, dropped 2 records (2 in total)"
+        assert report in target.messages
+        assert [m for m in target.messages if m != report] == expected
+
+    def test_flushes_once_per_batch(self):
+        """Test handlers are flushed per batch rather than per record."""
+        target = BlockingHandler()
+        queued = QueueLogHandler([target])
+        test_logger = make_logger(queued)
+
+        test_logger.info("first")
+        while queued.queue.qsize():
+            pass
+        for index in range(50):
+            test_logger.info(str(index))
+        target.unblock.set()
+        queued.close()
+
+        assert len(target.messages) == 51
+        assert target.flushes <= 3
+
+    def test_rotating_file(self, tmp_path):
+        """Test queued records are written to a rotating file."""
+        path = tmp_path / "app.log"
+        handler = BatchRotatingFileHandler(str(path), maxBytes=100, backupCount=2)
+        queued = QueueLogHandler([handler])
+        test_logger = make_logger(queued)
+        for index in range(20):
+            test_logger.info("record %02d %s", index, "x" * 20)
+        queued.close()
+        handler.close()
+
+        assert path.exists()
+        assert (tmp_path / "app.log.1").exists()
+        assert not (tmp_path / "app.log.3").exists()
+        assert "record 19" in path.read_text()
+
+    def test_invalid_drop_policy(self):
+        """Test unknown drop policies are rejected."""
+        with pytest.raises(ValueError):
+            QueueLogHandler([], drop="random")
+
+
+class TestJSONFormatter:
+    """Test cases for JSON log records."""
+
+    def format(self, formatter=None, exc_info=None, **extra):
+        record = logging.makeLogRecord(
+            {
+                "name": "zestapi.tests",
+                "levelno": logging.INFO,
+                "levelname": "INFO",
+                "msg": "Request %s done",
+                "args": ("abc",),
+                "exc_info": exc_info,
+                **extra,
+            }
+        )
+        return orjson.loads((formatter or JSONFormatter()).format(record))
+
+    def test_fields(self):
+        """Test the base fields and known extras are serialized."""
+        data = self.format(request_id="abc", status_code=200, unknown="x")
+        assert list(data) == [
+            "timestamp",
+            "level",
+            "logger",
+            "message",
+            "request_id",
+            "status_code",
+        ]
+        assert data["message"] == "Request abc done"
+        assert data["timestamp"].endswith("+00:00")
+
+    def test_lazy_and_custom_fields(self):
+        """Test lazy values are evaluated and fields can be renamed."""
+        calls = []
+        url = LazyValue(lambda: calls.append(1) or "http://test/items")
+        formatter = JSONFormatter(fields=["url", "tenant"], rename={"url": "u"})
+
+        data = self.format(formatter, url=url, tenant=object())
+        assert data["u"] == "http://test/items"
+        assert data["tenant"].startswith("<object")
+        assert calls == [1]
+        assert str(url) == "http://test/items"
+
+    def test_exception(self):
+        """Test exceptions are rendered into a field."""
+        try:
+            raise KeyError("missing")
+        except KeyError:
+            data = self.format(exc_info=sys.exc_info())
+        assert "KeyError: 'missing'" in data["exception"]
+
+    def test_access_log(self, caplog):
+        """Test access log records carry request metadata as JSON."""
+
+        async def ok(request):
+            return PlainTextResponse("ok")
+
+        app = Starlette(
+            routes=[Route("/ok", ok)], middleware=[Middleware(CoreMiddleware)]
+        )
+        with caplog.at_level(logging.INFO, logger="zestapi.core.middleware"):
+            response = TestClient(app).get("/ok?x=1")
+
+        (record,) = [r for r in caplog.records if "completed" in r.getMessage()]
+        data = orjson.loads(JSONFormatter().format(record))
+        assert data["request_id"] == response.headers["x-request-id"]
+        assert data["method"] == "GET"
+        assert data["path"] == "/ok"
+        assert data["status_code"] == 200
+        assert data["duration_ms"] >= 0
+
+
+class TestLoggingSettings:
+    """Test cases for the handlers configured by the application."""
+
+    def test_queued_handlers(self, tmp_path):
+        """Test log_queue puts console and file handlers behind a queue."""
+        settings = Settings()
+        settings.debug = False
+        settings.jwt_secret = "test-secret"
+        settings.log_queue = True
+        settings.log_file = str(tmp_path / "zestapi.log")
+        settings.log_file_max_bytes = 1024
+        app_instance = ZestAPI(settings=settings)
+
+        (queued,) = app_instance._log_handlers()
+        assert isinstance(queued, QueueLogHandler)
+        console, log_file = queued.handlers
+        assert isinstance(console, BatchStreamHandler)
+        assert isinstance(log_file, BatchRotatingFileHandler)
+        assert log_file.maxBytes == 1024
+        queued.close()
+        log_file.close()
+
+    def test_json_format(self):
+        """Test log_format selects the JSON formatter."""
+        settings = Settings()
+        settings.log_format = "json"
+        app_instance = ZestAPI(settings=settings)
+        console, _ = app_instance._log_handlers()
+        assert isinstance(console.formatter, JSONFormatter)
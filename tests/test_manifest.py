@@ -0,0 +1,144 @@
+"""
+Tests for ZestAPI route manifests.
+"""
+
+import json
+import os
+
+from starlette.testclient import TestClient
+
+from zestapi import ZestAPI
+from zestapi.cli import build_route_manifest
+from zestapi.core import routing
+from zestapi.core.manifest import manifest_routes, read_manifest, write_manifest
+from zestapi.core.routing import LazyEndpoint
+from zestapi.core.settings import Settings
+
+ROUTE_MODULE = """
+from zestapi import ORJSONResponse, route
+
+# Record every time the module is executed
+with open({log!r}, "a") as f:
+    f.write(__name__ + "\\n")
+
+
+@route("/{name}", rate_limit="{rate_limit}")
+async def get_{name}(request):
+    return ORJSONResponse({{"version": "{version}"}})
+"""
+
+
+def write_route(routes_dir, name, version="1", subdir="", rate_limit="100/minute"):
+    directory = routes_dir / subdir if subdir else routes_dir
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.py"
+    path.write_text(
+        ROUTE_MODULE.format(
+            name=name,
+            version=version,
+            rate_limit=rate_limit,
+            log=str(routes_dir / "imports.log"),
+        )
+    )
+    return path
+
+
+def manifest_for(routes_dir):
+    """Write the manifest as `zest manifest` would, in another process"""
+    manifest_path = write_manifest(str(routes_dir))
+    routing._modules.clear()
+    (routes_dir / "imports.log").unlink()
+    return manifest_path
+
+
+def imports(routes_dir):
+    log = routes_dir / "imports.log"
+    return log.read_text().split() if log.exists() else []
+
+
+def make_client(routes_dir, manifest_path):
+    settings = Settings()
+    settings.routes_manifest = str(manifest_path)
+    app_instance = ZestAPI(settings=settings, routes_dir=str(routes_dir))
+    return TestClient(app_instance.create_app())
+
+
+class TestRouteManifest:
+    """Test cases for building routes from a manifest."""
+
+    def test_manifest_contents(self, tmp_path):
+        """Test the manifest records each file's routes and fingerprint."""
+        write_route(tmp_path, "users")
+        write_route(tmp_path, "orders", subdir="shop")
+
+        manifest = read_manifest(write_manifest(str(tmp_path)))
+        assert set(manifest["files"]) == {"users.py", "shop/orders.py"}
+
+        entry = manifest["files"]["shop/orders.py"]
+        assert entry["size"] == os.path.getsize(tmp_path / "shop" / "orders.py")
+        assert len(entry["sha256"]) == 64
+        assert entry["routes"] == [
+            {
+                "function": "get_orders",
+                "path": "/orders",
+                "methods": ["GET"],
+                "rate_limit": "100/minute",
+            }
+        ]
+
+    def test_modules_imported_on_first_request(self, tmp_path):
+        """Test routes are registered without executing their modules."""
+        write_route(tmp_path, "users")
+        write_route(tmp_path, "orders", subdir="shop")
+        client = make_client(tmp_path, manifest_for(tmp_path))
+        assert imports(tmp_path) == []
+
+        response = client.get("/shop/orders")
+        assert response.json() == {"version": "1"}
+        assert imports(tmp_path) == ["orders"]
+
+        client.get("/shop/orders")
+        assert imports(tmp_path) == ["orders"]
+
+    def test_rate_limits_from_manifest(self, tmp_path):
+        """Test per-route limits compile without importing the module."""
+        write_route(tmp_path, "users", rate_limit="1/minute")
+        client = make_client(tmp_path, manifest_for(tmp_path))
+        assert imports(tmp_path) == []
+
+        assert client.get("/users").status_code == 200
+        assert client.get("/users").status_code == 429
+
+    def test_stale_files_are_imported(self, tmp_path):
+        """Test new and modified files bypass the manifest."""
+        write_route(tmp_path, "users")
+        write_route(tmp_path, "orders")
+        manifest = read_manifest(manifest_for(tmp_path))
+
+        write_route(tmp_path, "users", version="22")
+        write_route(tmp_path, "items")
+        # Only touched: the hash still matches
+        os.utime(tmp_path / "orders.py", ns=(0, 0))
+
+        routes = {
+            route.path: route for route in manifest_routes(str(tmp_path), manifest)
+        }
+        assert set(routes) == {"/users", "/orders", "/items"}
+        assert isinstance(routes["/orders"].endpoint, LazyEndpoint)
+        assert not isinstance(routes["/users"].endpoint, LazyEndpoint)
+        assert sorted(imports(tmp_path)) == ["items", "users"]
+
+    def test_missing_manifest(self, tmp_path):
+        """Test routes are discovered as usual without a manifest."""
+        write_route(tmp_path, "users")
+        client = make_client(tmp_path, tmp_path / "missing.json")
+        assert client.get("/users").json() == {"version": "1"}
+
+    def test_cli_command(self, tmp_path, capsys):
+        """Test zest manifest writes the manifest to the given path."""
+        write_route(tmp_path, "users")
+        output = tmp_path / "routes.json"
+        build_route_manifest(str(tmp_path), str(output))
+
+        assert str(output) in capsys.readouterr().out
+        assert "users.py" in json.loads(output.read_text())["files"]
@@ -0,0 +1,162 @@
+"""
+Tests for Prometheus metrics.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI
+from zestapi.core.metrics import MetricsRegistry
+from zestapi.core.settings import Settings
+
+
+def samples(text):
+    """Exposition lines as {series: value}"""
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line and not line.startswith("#")
+    }
+
+
+def make_app(**options):
+    settings = Settings()
+    settings.metrics = True
+    for name, value in options.items():
+        setattr(settings, name, value)
+    app_instance = ZestAPI(settings=settings)
+
+    @app_instance.route("/items/{item_id:int}", methods=["GET", "POST"])
+    async def item(request):
+        return ORJSONResponse({"id": request.path_params["item_id"]})
+
+    @app_instance.route("/fail")
+    async def fail(request):
+        raise RuntimeError("boom")
+
+    return app_instance
+
+
+class TestMetricsRegistry:
+    """Test cases for metric storage and exposition."""
+
+    def test_exposition(self):
+        """Test counters, gauges and histograms in the text format."""
+        registry = MetricsRegistry()
+        counter = registry.counter("jobs_total", "Jobs run", {"queue": 'a"b'})
+        gauge = registry.gauge("workers", "Busy workers")
+        histogram = registry.histogram(
+            "job_seconds", "Job time", {"queue": "a"}, buckets=[0.1, 1]
+        )
+        counter.inc()
+        counter.inc(2)
+        gauge.inc()
+        gauge.set(4)
+        gauge.dec()
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        text = registry.exposition().decode()
+        assert "# TYPE jobs_total counter" in text
+        assert "# TYPE job_seconds histogram" in text
+        assert samples(text) == {
+            'jobs_total{queue="a\\"b"}': 3,
+            "workers": 3,
+            'job_seconds_bucket{queue="a",le="0.1"}': 2,
+            'job_seconds_bucket{queue="a",le="1"}': 3,
+            'job_seconds_bucket{queue="a",le="+Inf"}': 4,
+            'job_seconds_sum{queue="a"}': 3.65,
+            'job_seconds_count{queue="a"}': 4,
+        }
+
+    def test_series_are_registered_once(self):
+        """Test the same name and labels return the same series."""
+        registry = MetricsRegistry()
+        first = registry.counter("hits_total", "Hits", {"route": "/"})
+        assert registry.counter("hits_total", "Hits", {"route": "/"}) is first
+        assert registry.counter("hits_total", "Hits", {"route": "/x"}) is not first
+        with pytest.raises(ValueError):
+            registry.gauge("hits_total", "Hits")
+
+    def test_multiprocess(self, tmp_path):
+        """Test worker processes are aggregated through the metrics directory."""
+        registry = MetricsRegistry(str(tmp_path))
+        registry.counter("jobs_total", "Jobs run").inc(2)
+        registry.gauge("busy", "Busy").inc()
+        registry.histogram("job_seconds", "Job time", buckets=[1]).observe(0.5)
+
+        script = (
+            "from zestapi.core.metrics import MetricsRegistry\n"
+            f"registry = MetricsRegistry({str(tmp_path)!r})\n"
+            "registry.counter('jobs_total', 'Jobs run').inc(5)\n"
+            "registry.gauge('busy', 'Busy').inc(7)\n"
+            "registry.histogram('job_seconds', 'Job time', buckets=[1]).observe(2)\n"
+            "registry.sync()\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True)
+        assert len(os.listdir(tmp_path)) == 4
+
+        values = samples(registry.exposition().decode())
+        assert values["jobs_total"] == 7
+        # Gauges of exited workers are dropped
+        assert values["busy"] == 1
+        assert values['job_seconds_bucket{le="1"}'] == 1
+        assert values['job_seconds_bucket{le="+Inf"}'] == 2
+        assert values["job_seconds_sum"] == 2.5
+        registry.close()
+
+    def test_capacity(self, tmp_path):
+        """Test multiprocess registries refuse series beyond their capacity."""
+        registry = MetricsRegistry(str(tmp_path), capacity=4)
+        registry.counter("a_total", "A")
+        with pytest.raises(ValueError):
+            registry.histogram("b_seconds", "B", buckets=[1, 2])
+        registry.close()
+
+
+class TestApplicationMetrics:
+    """Test cases for route metrics and the /metrics endpoint."""
+
+    def test_route_metrics(self):
+        """Test requests are counted and timed per route template."""
+        app_instance = make_app()
+        client = TestClient(app_instance.create_app(), raise_server_exceptions=False)
+        client.get("/items/1")
+        client.get("/items/2")
+        client.post("/items/3")
+        assert client.get("/fail").status_code == 500
+
+        response = client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain")
+        values = samples(response.text)
+        get_items = 'method="GET",route="/items/{item_id:int}"'
+        assert values[f'zestapi_http_requests_total{{{get_items},status="2xx"}}'] == 2
+        assert (
+            values[f"zestapi_http_request_duration_seconds_count{{{get_items}}}"] == 2
+        )
+        assert values[f"zestapi_http_requests_in_progress{{{get_items}}}"] == 0
+        post_items = 'method="POST",route="/items/{item_id:int}"'
+        assert values[f'zestapi_http_requests_total{{{post_items},status="2xx"}}'] == 1
+        fail = 'method="GET",route="/fail"'
+        assert values[f'zestapi_http_requests_total{{{fail},status="5xx"}}'] == 1
+
+    def test_rate_limit_rejections(self):
+        """Test rejected requests are counted."""
+        app_instance = make_app(rate_limit="3/minute")
+        client = TestClient(app_instance.create_app())
+        statuses = [client.get("/items/1").status_code for _ in range(5)]
+        assert statuses.count(429) == 2
+
+        values = samples(app_instance.metrics.exposition().decode())
+        assert values['zestapi_rate_limit_rejections_total{route="*"}'] == 2
+
+    def test_disabled_by_default(self):
+        """Test no metrics route is added unless enabled."""
+        app_instance = make_app(metrics=False)
+        client = TestClient(app_instance.create_app())
+        assert client.get("/metrics").status_code == 404
+        assert app_instance.metrics is None
@@ -0,0 +1,257 @@
+"""
+Tests for ZestAPI middleware.
+"""
+
+import logging
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from zestapi import (
+    CoreMiddleware,
+    ErrorHandlingMiddleware,
+    ORJSONResponse,
+    RateLimitMiddleware,
+    RequestLoggingMiddleware,
+)
+from zestapi.core.middleware import is_sampled
+
+
+async def echo(request):
+    body = await request.body()
+    return ORJSONResponse(
+        {"body": body.decode(), "request_id": request.state.request_id}
+    )
+
+
+async def stream(request):
+    async def chunks():
+        for i in range(3):
+            yield f"chunk-{i};".encode()
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+async def forbidden(request):
+    raise PermissionError("nope")
+
+
+async def crash(request):
+    raise RuntimeError("boom")
+
+
+def make_client(*middleware: Middleware) -> TestClient:
+    app = Starlette(
+        routes=[
+            Route("/echo", echo, methods=["GET", "POST"]),
+            Route("/stream", stream),
+            Route("/forbidden", forbidden),
+            Route("/crash", crash),
+        ],
+        middleware=list(middleware),
+    )
+    return TestClient(app, raise_server_exceptions=False)
+
+
+class TestErrorHandlingMiddleware:
+    """Test cases for the ASGI error handling middleware."""
+
+    def test_headers_and_request_state(self):
+        """Test request ID and timing headers on successful responses."""
+        client = make_client(Middleware(ErrorHandlingMiddleware))
+        response = client.get("/echo")
+        assert response.status_code == 200
+        assert "x-process-time" in response.headers
+        assert response.headers["x-request-id"] == response.json()["request_id"]
+
+    def test_streaming_response_passes_through(self):
+        """Test streaming responses are forwarded chunk by chunk."""
+        client = make_client(Middleware(ErrorHandlingMiddleware))
+        response = client.get("/stream")
+        assert response.status_code == 200
+        assert response.text == "chunk-0;chunk-1;chunk-2;"
+        assert "x-request-id" in response.headers
+
+    def test_error_envelopes(self):
+        """Test exceptions are mapped to the standard error envelope."""
+        client = make_client(Middleware(ErrorHandlingMiddleware))
+
+        response = client.get("/forbidden")
+        assert response.status_code == 403
+        assert response.json()["error"]["type"] == "PermissionError"
+
+        response = client.get("/crash")
+        assert response.status_code == 500
+        error = response.json()["error"]
+        assert error["type"] == "InternalServerError"
+        assert "debug" not in error
+        assert response.headers["x-request-id"] == error["request_id"]
+
+    def test_debug_information(self):
+        """Test debug details are included when enabled."""
+        client = make_client(Middleware(ErrorHandlingMiddleware, debug=True))
+        error = client.get("/crash").json()["error"]
+        assert error["debug"]["exception"] == "boom"
+        assert error["debug"]["path"] == "/crash"
+
+
+class TestRequestLoggingMiddleware:
+    """Test cases for the ASGI request logging middleware."""
+
+    def test_body_is_logged_and_replayed(self, caplog):
+        """Test the logged request body is still readable by the endpoint."""
+        client = make_client(
+            Middleware(RequestLoggingMiddleware, log_body=True),
+            Middleware(ErrorHandlingMiddleware),
+        )
+        with caplog.at_level(logging.INFO, logger="zestapi.core.middleware"):
+            response = client.post("/echo", content=b"hello")
+
+        assert response.json()["body"] == "hello"
+        started = [r for r in caplog.records if r.getMessage() == "Request started"]
+        assert started[0].body_preview == "hello"
+        assert started[0].method == "POST"
+
+    def test_error_status_is_logged(self, caplog):
+        """Test responses with error status codes are logged as warnings."""
+        client = make_client(
+            Middleware(RequestLoggingMiddleware),
+            Middleware(ErrorHandlingMiddleware),
+        )
+        with caplog.at_level(logging.INFO, logger="zestapi.core.middleware"):
+            client.get("/forbidden")
+
+        completed = [
+            r
+            for r in caplog.records
+            if r.getMessage() == "Request completed with error"
+        ]
+        assert completed[0].status_code == 403
+
+
+class TestRateLimitMiddleware:
+    """Test cases for the ASGI rate limiting middleware."""
+
+    def test_limit_exceeded(self):
+        """Test requests over the limit are rejected with 429."""
+        client = make_client(Middleware(RateLimitMiddleware, rate_limit="2/minute"))
+
+        first = client.get("/stream")
+        assert first.headers["x-ratelimit-remaining"] == "1"
+        client.get("/stream")
+
+        response = client.get("/stream")
+        assert response.status_code == 429
+        assert response.json()["error"]["type"] == "RateLimitExceeded"
+        assert 1 <= int(response.headers["retry-after"]) <= 60
+
+
+class TestCoreMiddleware:
+    """Test cases for the fused core middleware."""
+
+    def test_headers_and_request_state(self):
+        """Test request ID and timing headers on successful responses."""
+        client = make_client(Middleware(CoreMiddleware))
+        response = client.get("/echo")
+        assert response.status_code == 200
+        assert "x-process-time" in response.headers
+        assert response.headers["x-request-id"] == response.json()["request_id"]
+
+    def test_error_envelope_and_access_log(self, caplog):
+        """Test exceptions are mapped and logged once with request metadata."""
+        client = make_client(Middleware(CoreMiddleware))
+        with caplog.at_level(logging.INFO, logger="zestapi.core.middleware"):
+            response = client.get("/forbidden", headers={"User-Agent": "tests"})
+
+        assert response.status_code == 403
+        assert response.json()["error"]["type"] == "PermissionError"
+        completed = [
+            r
+            for r in caplog.records
+            if r.getMessage() == "Request completed with error"
+        ]
+        assert len(completed) == 1
+        assert completed[0].status_code == 403
+        assert completed[0].user_agent == "tests"
+        assert completed[0].request_id == response.headers["x-request-id"]
+
+    def test_metadata_not_built_when_logging_disabled(self, monkeypatch):
+        """Test request metadata is only built for emitted log records."""
+        calls = []
+        monkeypatch.setattr(
+            CoreMiddleware, "_log_fields", lambda *args: calls.append(args) or {}
+        )
+        logger = logging.getLogger("zestapi.core.middleware")
+        monkeypatch.setattr(logger, "level", logging.ERROR)
+
+        client = make_client(Middleware(CoreMiddleware))
+        assert client.get("/forbidden").status_code == 403
+        assert calls == []
+
+
+class TestAccessLogSampling:
+    """Test cases for sampled and slow-request access logging."""
+
+    def access_log(self, caplog, client, path, requests=1):
+        caplog.clear()
+        with caplog.at_level(logging.DEBUG, logger="zestapi.core.middleware"):
+            responses = [client.get(path) for _ in range(requests)]
+        return responses, [
+            r for r in caplog.records if r.name == "zestapi.core.middleware"
+        ]
+
+    def test_is_sampled(self):
+        """Test sampling is deterministic and close to the rate."""
+        ids = [f"{i:08x}" for i in range(0, 2**32, 2**32 // 10_000)]
+        kept = [i for i in ids if is_sampled(i, 0.1)]
+        assert 800 < len(kept) < 1200
+        assert kept == [i for i in ids if is_sampled(i, 0.1)]
+        assert all(is_sampled(i, 1.0) for i in ids[:10])
+        assert not any(is_sampled(i, 0.0) for i in ids[:10])
+
+    def test_sampled_out_requests(self, caplog):
+        """Test successful requests are skipped while errors are kept."""
+        client = make_client(Middleware(CoreMiddleware, sample_rate=0.0))
+        responses, records = self.access_log(caplog, client, "/echo", 5)
+        assert all(r.status_code == 200 for r in responses)
+        assert records == []
+
+        _, records = self.access_log(caplog, client, "/forbidden")
+        assert "Request completed with error" in [r.getMessage() for r in records]
+
+    def test_trace_is_logged_fully_or_not_at_all(self, caplog):
+        """Test start and completion lines share the sampling decision."""
+        client = make_client(Middleware(CoreMiddleware, sample_rate=0.5))
+        responses, records = self.access_log(caplog, client, "/echo", 40)
+        logged = {r.request_id for r in records}
+        expected = {
+            r.headers["x-request-id"]
+            for r in responses
+            if is_sampled(r.headers["x-request-id"], 0.5)
+        }
+        assert logged == expected
+        assert 0 < len(logged) < 40
+        assert len(records) == 2 * len(logged)
+
+    def test_slow_requests_are_logged(self, caplog):
+        """Test requests over the threshold are logged regardless of sampling."""
+        client = make_client(
+            Middleware(CoreMiddleware, sample_rate=0.0, slow_threshold=0.0)
+        )
+        _, records = self.access_log(caplog, client, "/echo")
+        assert len(records) == 1
+        assert records[0].levelno == logging.WARNING
+        assert records[0].getMessage().startswith("Slow request GET /echo")
+        assert records[0].status_code == 200
+
+    def test_request_logging_middleware(self, caplog):
+        """Test the standalone logging middleware samples the same way."""
+        client = make_client(
+            Middleware(RequestLoggingMiddleware, sample_rate=0.0),
+            Middleware(ErrorHandlingMiddleware),
+        )
+        _, records = self.access_log(caplog, client, "/echo", 3)
+        assert records == []
@@ -0,0 +1,203 @@
+"""
+Tests for request phase timing and the stack sampling profiler.
+"""
+
+import logging
+import threading
+import time
+
+import orjson
+import pytest
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI
+from zestapi.core.profiling import RequestTimer, StackSampler, current_timer
+from zestapi.core.settings import Settings
+
+
+def make_app(**options):
+    settings = Settings()
+    for name, value in options.items():
+        setattr(settings, name, value)
+    app_instance = ZestAPI(settings=settings)
+
+    @app_instance.route("/items/{item_id:int}", rate_limit="100/minute")
+    async def item(request):
+        time.sleep(0.01)
+        return ORJSONResponse([{"id": i} for i in range(1000)])
+
+    @app_instance.route("/fail")
+    async def fail(request):
+        raise RuntimeError("boom")
+
+    return app_instance
+
+
+def busy_wait_for_profiler(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestRequestTimer:
+    """Test cases for attributing time to phases."""
+
+    def test_phases_add_up(self):
+        """Test time goes to the phase in progress and sums to the total."""
+        timer = RequestTimer("GET", "/")
+        assert timer.enter("handler") == "middleware"
+        time.sleep(0.01)
+        previous = timer.enter("serialization")
+        timer.enter(previous)
+        timer.finish()
+
+        assert list(timer.phases) == ["middleware", "handler", "serialization"]
+        assert timer.phases["handler"] >= 0.01
+        assert sum(timer.phases.values()) == pytest.approx(timer.total)
+
+
+class TestPhaseTiming:
+    """Test cases for the timing hooks of an application."""
+
+    def test_hooks_receive_phases(self):
+        """Test every configured phase is timed and passed to hooks."""
+        app_instance = make_app(jwt_secret="test-secret")
+        timers = []
+        app_instance.add_timing_hook(timers.append)
+        client = TestClient(app_instance.create_app())
+        assert client.get("/items/1").status_code == 200
+
+        (timer,) = timers
+        assert timer.route == "/items/{item_id:int}"
+        assert timer.status_code == 200
+        assert set(timer.phases) == {
+            "middleware",
+            "auth",
+            "rate_limit",
+            "routing",
+            "handler",
+            "serialization",
+            "send",
+        }
+        assert timer.phases["handler"] >= 0.01
+        assert sum(timer.phases.values()) == pytest.approx(timer.total)
+
+    def test_failed_requests_are_timed(self):
+        """Test hooks see requests whose handler raised, and hook errors are
+        contained."""
+        app_instance = make_app()
+        timers = []
+
+        def broken_hook(timer):
+            raise ValueError("broken")
+
+        app_instance.add_timing_hook(broken_hook)
+        app_instance.add_timing_hook(timers.append)
+        client = TestClient(app_instance.create_app(), raise_server_exceptions=False)
+        assert client.get("/fail").status_code == 500
+        assert client.get("/missing").status_code == 404
+
+        assert [(t.route, t.status_code) for t in timers] == [
+            ("/fail", 500),
+            (None, 404),
+        ]
+
+    def test_slow_requests_are_logged(self, caplog):
+        """Test profiling_log_threshold logs the phases of slow requests."""
+        app_instance = make_app(profiling=True, profiling_log_threshold=5)
+        client = TestClient(app_instance.create_app())
+        with caplog.at_level(logging.WARNING, logger="zestapi.core.profiling"):
+            client.get("/items/1")
+        (record,) = [r for r in caplog.records if r.name == "zestapi.core.profiling"]
+        assert "GET /items/{item_id:int}" in record.getMessage()
+        assert "handler=" in record.getMessage()
+
+    def test_phase_metrics(self):
+        """Test phases are recorded as a histogram with metrics enabled."""
+        app_instance = make_app(profiling=True, metrics=True)
+        client = TestClient(app_instance.create_app())
+        client.get("/items/1")
+        text = app_instance.metrics.exposition().decode()
+        assert (
+            'zestapi_http_request_phase_seconds_count{phase="handler",'
+            'route="/items/{item_id:int}"} 1'
+        ) in text
+
+    def test_disabled_by_default(self):
+        """Test no timer is started unless enabled."""
+        app_instance = make_app()
+        seen = []
+
+        @app_instance.route("/timer")
+        async def timer(request):
+            seen.append(current_timer())
+            return ORJSONResponse({})
+
+        TestClient(app_instance.create_app()).get("/timer")
+        assert seen == [None]
+
+
+class TestStackSampler:
+    """Test cases for sampling thread stacks."""
+
+    def test_profiles(self):
+        """Test samples render as collapsed stacks and speedscope JSON."""
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_wait_for_profiler, args=(stop,))
+        worker.start()
+        try:
+            sampler = StackSampler(interval=0.001, thread_ids=[worker.ident])
+            sampler.run(0.1)
+        finally:
+            stop.set()
+            worker.join()
+
+        lines = sampler.collapsed().splitlines()
+        assert lines
+        assert all("busy_wait_for_profiler (" in line for line in lines)
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == len(
+            sampler.samples[worker.ident]
+        )
+
+        (profile,) = sampler.speedscope()["profiles"]
+        assert profile["type"] == "sampled"
+        assert len(profile["samples"]) == len(profile["weights"])
+        assert profile["endValue"] == pytest.approx(sampler.duration, rel=0.2)
+
+
+class TestProfilerEndpoint:
+    """Test cases for the protected profiler route."""
+
+    def test_requires_token(self):
+        """Test the profiler is only mounted with a token and checks it."""
+        client = TestClient(make_app().create_app())
+        assert client.get("/admin/profile").status_code == 404
+
+        client = TestClient(make_app(profiler_token="s3cret").create_app())
+        assert client.get("/admin/profile?seconds=0.01").status_code == 403
+        response = client.get(
+            "/admin/profile?seconds=0.01", headers={"X-Profiler-Token": "wrong"}
+        )
+        assert response.status_code == 403
+
+    @pytest.mark.parametrize(
+        "query", ["seconds=0", "seconds=61", "seconds=x", "format=pprof"]
+    )
+    def test_invalid_parameters(self, query):
+        """Test out of range durations and unknown formats are rejected."""
+        client = TestClient(make_app(profiler_token="s3cret").create_app())
+        response = client.get(
+            f"/admin/profile?{query}", headers={"X-Profiler-Token": "s3cret"}
+        )
+        assert response.status_code == 400
+
+    def test_speedscope(self):
+        """Test a profile of every thread is returned as speedscope JSON."""
+        client = TestClient(make_app(profiler_token="s3cret").create_app())
+        response = client.get(
+            "/admin/profile?seconds=0.05&format=speedscope&threads=all",
+            headers={"X-Profiler-Token": "s3cret"},
+        )
+        assert response.status_code == 200
+        data = orjson.loads(response.content)
+        assert data["shared"]["frames"]
+        assert data["profiles"]
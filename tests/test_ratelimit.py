@@ -0,0 +1,214 @@
+"""
+Tests for ZestAPI rate limiting.
+"""
+
+import pytest
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI, create_access_token, route
+from zestapi.core.ratelimit import (
+    GCRA,
+    RateLimitPolicy,
+    SlidingWindowCounter,
+    TokenBucket,
+    get_algorithm,
+)
+from zestapi.core.ratelimit_stores import MemoryStore
+from zestapi.core.settings import Settings
+
+
+def run_hits(algorithm, count, now):
+    state = None
+    results = []
+    for _ in range(count):
+        allowed, state, remaining, retry_after = algorithm.hit(state, now)
+        results.append((allowed, remaining, retry_after))
+    return state, results
+
+
+class TestAlgorithms:
+    """Test cases for the rate limiting algorithms."""
+
+    @pytest.mark.parametrize(
+        "algorithm_class", [SlidingWindowCounter, TokenBucket, GCRA]
+    )
+    def test_allows_limit_then_rejects(self, algorithm_class):
+        """Test each algorithm allows exactly `limit` requests in a burst."""
+        algorithm = algorithm_class(5, 60)
+        state, results = run_hits(algorithm, 6, now=1000.0)
+
+        assert [allowed for allowed, _, _ in results] == [True] * 5 + [False]
+        assert [remaining for _, remaining, _ in results[:5]] == [4, 3, 2, 1, 0]
+        assert results[-1][2] > 0
+        assert len(state) <= 3
+
+    def test_sliding_window_decays_previous_window(self):
+        """Test the previous window only counts for its remaining share."""
+        algorithm = SlidingWindowCounter(10, 60)
+        state, _ = run_hits(algorithm, 10, now=60.0)
+
+        # Half way through the next window half of the old hits still count
+        allowed, state, remaining, _ = algorithm.hit(state, 150.0)
+        assert allowed
+        assert remaining == 4
+
+    def test_token_bucket_refills(self):
+        """Test tokens are refilled at limit / window per second."""
+        algorithm = TokenBucket(2, 10)
+        state, _ = run_hits(algorithm, 2, now=0.0)
+
+        allowed, _, _, retry_after = algorithm.hit(state, 1.0)
+        assert not allowed
+        assert retry_after == pytest.approx(4.0)
+        assert algorithm.hit(state, 5.0)[0]
+
+    def test_gcra_spacing(self):
+        """Test GCRA allows one more request per emission interval."""
+        algorithm = GCRA(4, 60)
+        state, _ = run_hits(algorithm, 4, now=0.0)
+
+        assert not algorithm.hit(state, 14.0)[0]
+        assert algorithm.hit(state, 15.0)[0]
+
+    def test_unknown_algorithm(self):
+        """Test unknown algorithm names are rejected."""
+        with pytest.raises(ValueError):
+            get_algorithm("leaky", 10, 60)
+        assert isinstance(get_algorithm("token-bucket", 10, 60), TokenBucket)
+
+
+class TestMemoryStore:
+    """Test cases for bounding the in-process store's memory."""
+
+    async def test_expired_keys_are_swept(self):
+        """Test idle keys are evicted as new requests arrive."""
+        store = MemoryStore()
+        algorithm = SlidingWindowCounter(5, 1)
+        for i in range(5):
+            await store.hit(f"10.0.0.{i}", algorithm, 100.0)
+        assert len(store.states) == 5
+
+        await store.hit("10.0.1.1", algorithm, 200.0)
+        assert list(store.states) == ["10.0.1.1"]
+
+    async def test_max_keys(self):
+        """Test the least recently seen keys are evicted over the cap."""
+        store = MemoryStore(max_keys=3)
+        algorithm = SlidingWindowCounter(5, 60)
+        for key in ["a", "b", "c", "a", "d"]:
+            await store.hit(key, algorithm, 100.0)
+        assert list(store.states) == ["c", "a", "d"]
+
+
+class TestPolicies:
+    """Test cases for per-route and per-identity rate limits."""
+
+    def make_app(self, settings=None, **route_options):
+        app_instance = ZestAPI(settings=settings or Settings())
+
+        @route("/limited", rate_limit="2/minute")
+        async def limited(request):
+            return ORJSONResponse({"ok": True})
+
+        async def open_endpoint(request):
+            return ORJSONResponse({"ok": True})
+
+        app_instance.add_route("/limited", limited)
+        app_instance.add_route("/open", open_endpoint, **route_options)
+        return TestClient(app_instance.create_app())
+
+    def test_route_limit_from_decorator(self):
+        """Test a limit declared with @route applies to that route only."""
+        client = self.make_app()
+
+        first = client.get("/limited")
+        assert first.headers["x-ratelimit-limit"] == "2"
+        assert first.headers["x-ratelimit-remaining"] == "1"
+        client.get("/limited")
+        assert client.get("/limited").status_code == 429
+
+        response = client.get("/open")
+        assert response.status_code == 200
+        assert response.headers["x-ratelimit-limit"] == "100"
+
+    def test_route_limit_from_add_route(self):
+        """Test limits passed to add_route, including identity overrides."""
+        client = self.make_app(
+            rate_limit={"default": "1/minute", "api_key:gold": "3/minute"}
+        )
+        assert client.get("/open").status_code == 200
+        assert client.get("/open").status_code == 429
+
+        gold = {"X-API-Key": "gold"}
+        statuses = [client.get("/open", headers=gold).status_code for _ in range(4)]
+        # Without rate_limit_key=api_key clients are still identified by IP
+        assert statuses == [429] * 4
+
+    def test_routes_sharing_a_path(self):
+        """Test routes on one path with different methods count separately."""
+        app_instance = ZestAPI(settings=Settings())
+
+        @app_instance.route("/items", rate_limit="100/minute")
+        async def list_items(request):
+            return ORJSONResponse([])
+
+        @app_instance.route("/items", methods=["POST"], rate_limit="2/minute")
+        async def create_item(request):
+            return ORJSONResponse({}, status_code=201)
+
+        client = TestClient(app_instance.create_app())
+        for _ in range(3):
+            assert client.get("/items").status_code == 200
+        statuses = [client.post("/items").status_code for _ in range(3)]
+        assert statuses == [201, 201, 429]
+        assert client.get("/items").headers["x-ratelimit-remaining"] == "96"
+
+    def test_route_rejection_headers(self):
+        """Test a route's 429 carries the route limit, not the global one."""
+        client = self.make_app()
+        client.get("/limited")
+        client.get("/limited")
+        response = client.get("/limited")
+        assert response.status_code == 429
+        assert response.headers["x-ratelimit-limit"] == "2"
+        assert "x-ratelimit-remaining" not in response.headers
+        assert int(response.headers["retry-after"]) >= 1
+
+    def test_identity_overrides(self):
+        """Test the global policy table keyed by API key."""
+        settings = Settings()
+        settings.rate_limit = "1/minute"
+        settings.rate_limit_key = "api_key"
+        settings.rate_limit_policies = {"api_key:gold": "3/minute"}
+        client = self.make_app(settings)
+
+        gold = {"X-API-Key": "gold"}
+        statuses = [client.get("/open", headers=gold).status_code for _ in range(4)]
+        assert statuses == [200, 200, 200, 429]
+
+        other = {"X-API-Key": "other"}
+        assert client.get("/open", headers=other).status_code == 200
+        assert client.get("/open", headers=other).status_code == 429
+
+    def test_user_identity(self):
+        """Test authenticated clients are limited by JWT subject."""
+        settings = Settings()
+        settings.jwt_secret = "test-secret-key-for-testing-only"
+        settings.rate_limit = "1/minute"
+        settings.rate_limit_key = "user"
+        client = self.make_app(settings)
+
+        alice = {"Authorization": f"Bearer {create_access_token({'sub': 'alice'})}"}
+        bob = {"Authorization": f"Bearer {create_access_token({'sub': 'bob'})}"}
+        assert client.get("/open", headers=alice).status_code == 200
+        assert client.get("/open", headers=alice).status_code == 429
+        assert client.get("/open", headers=bob).status_code == 200
+
+    def test_invalid_policies(self):
+        """Test malformed policy tables are rejected at startup."""
+        with pytest.raises(ValueError):
+            RateLimitPolicy.compile({"email:a@b.c": "1/minute", "default": "1/hour"})
+        with pytest.raises(ValueError):
+            RateLimitPolicy.compile({"ip:10.0.0.1": "1/minute"})
+        with pytest.raises(ValueError):
+            RateLimitPolicy.compile("often")
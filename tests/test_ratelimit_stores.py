@@ -0,0 +1,311 @@
+"""
+Tests for the shared rate limit stores.
+"""
+
+import asyncio
+import fcntl
+import multiprocessing
+import os
+import time
+import uuid
+from urllib.parse import urlparse
+
+import pytest
+
+from tests.fake_redis import FakeRedisServer
+from zestapi.core.ratelimit import GCRA, SlidingWindowCounter, TokenBucket
+from zestapi.core.ratelimit_stores import (
+    MemoryStore,
+    RedisConnection,
+    RedisError,
+    RedisStore,
+    SharedMemoryStore,
+    _default_table_path,
+    create_store,
+)
+
+# Server for the tests running the Lua scripts; they are skipped without one
+REDIS_URL = os.environ.get("ZESTAPI_TEST_REDIS_URL", "redis://localhost:6379/15")
+
+
+@pytest.fixture
+async def redis_server():
+    server = FakeRedisServer()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest.fixture
+async def real_redis():
+    parsed = urlparse(REDIS_URL)
+    connection = RedisConnection(
+        host=parsed.hostname or "localhost",
+        port=parsed.port or 6379,
+        db=int(parsed.path.lstrip("/") or 0),
+        password=parsed.password,
+    )
+    try:
+        await asyncio.wait_for(connection.connect(), 1.0)
+        await asyncio.wait_for(connection.execute("PING"), 1.0)
+    except (OSError, asyncio.TimeoutError, RedisError):
+        await connection.close()
+        if "ZESTAPI_TEST_REDIS_URL" in os.environ:
+            # An explicit server, as in CI, must be reachable
+            pytest.fail(f"Redis is not available at {REDIS_URL}")
+        pytest.skip(f"Redis is not available at {REDIS_URL}")
+    yield connection
+    await connection.close()
+
+
+def _hit_in_child(path, count):
+    store = SharedMemoryStore(path=path, slots=64)
+    algorithm = SlidingWindowCounter(10, 60)
+    for _ in range(count):
+        asyncio.run(store.hit("client", algorithm, 1000.0))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Requires fcntl and fork")
+class TestSharedMemoryStore:
+    """Test cases for the mmap store shared between workers."""
+
+    async def test_limit_shared_between_instances(self, tmp_path):
+        """Test two workers mapping the same table share one limit."""
+        path = str(tmp_path / "table")
+        worker_a = SharedMemoryStore(path=path, slots=64)
+        worker_b = SharedMemoryStore(path=path, slots=64)
+        algorithm = SlidingWindowCounter(4, 60)
+
+        results = []
+        for store in [worker_a, worker_b, worker_a, worker_b, worker_a]:
+            results.append(await store.hit("client", algorithm, 1000.0))
+
+        assert [allowed for allowed, _, _ in results] == [True] * 4 + [False]
+        await worker_a.close()
+        await worker_b.close()
+
+    async def test_limit_shared_with_child_process(self, tmp_path):
+        """Test hits from another process count against the same key."""
+        path = str(tmp_path / "table")
+        store = SharedMemoryStore(path=path, slots=64)
+        algorithm = SlidingWindowCounter(10, 60)
+
+        context = multiprocessing.get_context("fork")
+        child = context.Process(target=_hit_in_child, args=(path, 7))
+        child.start()
+        child.join()
+        assert child.exitcode == 0
+
+        allowed, remaining, _ = await store.hit("client", algorithm, 1000.0)
+        assert allowed
+        assert remaining == 2
+        await store.close()
+
+    async def test_full_table_evicts_earliest_expiry(self, tmp_path):
+        """Test a full table reuses the slot that expires first."""
+        store = SharedMemoryStore(path=str(tmp_path / "table"), slots=2)
+        algorithm = TokenBucket(1, 60)
+
+        assert (await store.hit("a", algorithm, 0.0))[0]
+        assert (await store.hit("b", algorithm, 10.0))[0]
+        assert (await store.hit("c", algorithm, 20.0))[0]
+        # "a" was evicted, "b" and "c" are still limited
+        assert not (await store.hit("b", algorithm, 21.0))[0]
+        assert not (await store.hit("c", algorithm, 22.0))[0]
+        assert (await store.hit("a", algorithm, 23.0))[0]
+        await store.close()
+
+    async def test_waits_for_lock_off_the_event_loop(self, tmp_path):
+        """Test a lock held by another process does not block the loop."""
+        path = str(tmp_path / "table")
+        store = SharedMemoryStore(path=path, slots=64)
+        algorithm = SlidingWindowCounter(10, 60)
+        other = os.open(path, os.O_RDWR)
+        fcntl.flock(other, fcntl.LOCK_EX)
+        try:
+            hits = [
+                asyncio.ensure_future(store.hit("client", algorithm, 1000.0))
+                for _ in range(3)
+            ]
+            await asyncio.sleep(0.05)
+            assert not any(hit.done() for hit in hits)
+        finally:
+            fcntl.flock(other, fcntl.LOCK_UN)
+            os.close(other)
+
+        results = await asyncio.gather(*hits)
+        assert sorted(remaining for _, remaining, _ in results) == [7, 8, 9]
+        await store.close()
+
+    async def test_cancelled_wait_releases_lock(self, tmp_path):
+        """Test cancelling a hit waiting for the lock leaves it unlocked."""
+        path = str(tmp_path / "table")
+        store = SharedMemoryStore(path=path, slots=64)
+        algorithm = SlidingWindowCounter(10, 60)
+        other = os.open(path, os.O_RDWR)
+        fcntl.flock(other, fcntl.LOCK_EX)
+        try:
+            hit = asyncio.ensure_future(store.hit("client", algorithm, 1000.0))
+            await asyncio.sleep(0.05)
+            hit.cancel()
+            await asyncio.sleep(0.05)
+            assert not hit.done()
+        finally:
+            fcntl.flock(other, fcntl.LOCK_UN)
+
+        with pytest.raises(asyncio.CancelledError):
+            await hit
+        try:
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(other, fcntl.LOCK_UN)
+        finally:
+            os.close(other)
+        await store.close()
+
+    def test_default_path_per_application(self):
+        """Test the default table path depends on the application name."""
+        assert _default_table_path("shop").endswith("zestapi-ratelimit-shop")
+        assert _default_table_path("shop") != _default_table_path("blog")
+        assert _default_table_path() == _default_table_path()
+
+    def test_rejects_foreign_file(self, tmp_path):
+        """Test files that are not rate limit tables are not mapped."""
+        path = tmp_path / "other"
+        path.write_bytes(b"not a table at all")
+        with pytest.raises(ValueError):
+            SharedMemoryStore(path=str(path))
+
+
+class TestRedisStore:
+    """Test cases for the Redis-protocol store."""
+
+    async def test_script_loaded_on_demand(self, redis_server):
+        """Test NOSCRIPT falls back to EVAL and later calls use EVALSHA."""
+        store = RedisStore(redis_server.url)
+        algorithm = SlidingWindowCounter(2, 60)
+
+        assert await store.hit("client", algorithm, 1000.0) == (True, 1, 0.0)
+        assert (await store.hit("client", algorithm, 1000.0))[0]
+        assert not (await store.hit("client", algorithm, 1000.0))[0]
+
+        names = [command[0] for command in redis_server.commands]
+        assert names == [b"EVALSHA", b"EVAL", b"EVALSHA", b"EVALSHA"]
+        await store.close()
+
+    async def test_limit_shared_between_workers(self, redis_server):
+        """Test two stores against the same server share one limit."""
+        worker_a = RedisStore(redis_server.url)
+        worker_b = RedisStore(redis_server.url)
+        algorithm = TokenBucket(3, 60)
+
+        results = [
+            await store.hit("client", algorithm, 1000.0)
+            for store in [worker_a, worker_b, worker_a, worker_b]
+        ]
+        assert [allowed for allowed, _, _ in results] == [True, True, True, False]
+        await worker_a.close()
+        await worker_b.close()
+
+    async def test_concurrent_hits_are_pipelined(self, redis_server):
+        """Test concurrent requests share a single socket write."""
+        store = RedisStore(redis_server.url)
+        algorithm = SlidingWindowCounter(100, 60)
+        await store.hit("warmup", algorithm, 1000.0)
+        batches = redis_server.batches
+
+        results = await asyncio.gather(
+            *[store.hit(f"client-{i}", algorithm, 1000.0) for i in range(20)]
+        )
+        assert all(allowed for allowed, _, _ in results)
+        assert redis_server.batches == batches + 1
+        await store.close()
+
+    async def test_batched_increments(self, redis_server):
+        """Test local decisions are flushed as one increment per key."""
+        store = RedisStore(redis_server.url, flush_interval=3600)
+        algorithm = SlidingWindowCounter(5, 3600)
+        now = time.time()
+
+        results = [await store.hit("client", algorithm, now) for _ in range(7)]
+        assert [allowed for allowed, _, _ in results] == [True] * 5 + [False] * 2
+        # Only the first hit needed a round trip
+        assert len(redis_server.commands) == 2
+
+        await store.flush()
+        assert redis_server.data[b"zestapi:ratelimit:client"][2] == 5.0
+        await store.close()
+
+    async def test_fails_open_when_unavailable(self):
+        """Test requests are allowed when the server cannot be reached."""
+        store = RedisStore("redis://127.0.0.1:1/0", timeout=0.5)
+        algorithm = SlidingWindowCounter(1, 60)
+        assert await store.hit("client", algorithm, 1000.0) == (True, 1, 0.0)
+        await store.close()
+
+
+class TestRedisScripts:
+    """Test cases running the Lua scripts on a real Redis server."""
+
+    @pytest.mark.parametrize(
+        "algorithm",
+        [SlidingWindowCounter(5, 20), TokenBucket(5, 20), GCRA(5, 20)],
+        ids=lambda algorithm: algorithm.name,
+    )
+    async def test_scripts_match_algorithms(self, real_redis, algorithm):
+        """Test each script makes the same decisions as its Python algorithm."""
+        prefix = f"zestapi:test:{uuid.uuid4().hex}:"
+        store = RedisStore(REDIS_URL, prefix=prefix)
+        memory = MemoryStore()
+        now = time.time()
+        try:
+            for step in range(16):
+                at = now + step * 1.5
+                expected = await memory.hit("client", algorithm, at)
+                allowed, remaining, retry_after = await store.hit(
+                    "client", algorithm, at
+                )
+                assert (allowed, remaining) == expected[:2], step
+                assert retry_after == pytest.approx(expected[2], abs=1e-6)
+        finally:
+            await store.close()
+            await real_redis.execute("DEL", prefix + "client")
+
+    async def test_batched_increments(self, real_redis):
+        """Test forced increments update the same counts as local hits."""
+        prefix = f"zestapi:test:{uuid.uuid4().hex}:"
+        store = RedisStore(REDIS_URL, prefix=prefix, flush_interval=3600)
+        other = RedisStore(REDIS_URL, prefix=prefix)
+        algorithm = SlidingWindowCounter(5, 3600)
+        try:
+            for _ in range(3):
+                await store.hit("client", algorithm, time.time())
+            await store.flush()
+            allowed, remaining, _ = await other.hit("client", algorithm, time.time())
+            assert allowed
+            assert remaining == 1
+        finally:
+            await store.close()
+            await other.close()
+            await real_redis.execute("DEL", prefix + "client")
+
+
+class TestCreateStore:
+    """Test cases for building stores from URLs."""
+
+    def test_store_urls(self, tmp_path):
+        """Test each URL scheme maps to its store."""
+        assert isinstance(create_store("memory://"), MemoryStore)
+        shared = create_store(f"mmap://{tmp_path}/table?slots=16")
+        assert isinstance(shared, SharedMemoryStore)
+        assert shared.slots == 16
+        assert os.path.exists(tmp_path / "table")
+        name = f"test-{uuid.uuid4().hex}"
+        named = create_store(f"mmap://?name={name}")
+        assert named.path == _default_table_path(name)
+        os.unlink(named.path)
+        redis = create_store("redis://localhost:6380/2?flush_interval=0.05")
+        assert isinstance(redis, RedisStore)
+        assert redis.flush_interval == 0.05
+
+        with pytest.raises(ValueError):
+            create_store("memcached://localhost")
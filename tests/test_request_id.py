@@ -0,0 +1,141 @@
+"""
+Tests for request ID generation.
+"""
+
+import os
+import re
+import time
+import uuid
+
+import pytest
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI
+from zestapi.core.request_id import (
+    CounterRequestIds,
+    RandomPool,
+    ULIDRequestIds,
+    UUID7RequestIds,
+    create_request_id_generator,
+    random_pool,
+)
+from zestapi.core.settings import Settings
+
+ULID_PATTERN = re.compile(r"^[0-9A-HJKMNP-TV-Z]{26}$")
+
+
+def scope_with(request_id):
+    return {"type": "http", "headers": [(b"x-request-id", request_id)]}
+
+
+class TestRandomPool:
+    """Test cases for batched random bytes."""
+
+    def test_read(self):
+        """Test reads are served from one buffer and refilled when used up."""
+        pool = RandomPool(size=16)
+        chunks = [pool.read(6) for _ in range(4)]
+        assert all(len(chunk) == 6 for chunk in chunks)
+        assert len(set(chunks)) == 4
+        assert len(pool.read(40)) == 40
+        assert 0 <= pool.randbits(10) < 1024
+
+    def test_hex_id(self):
+        """Test hex IDs have the requested length."""
+        assert re.match(r"^[0-9a-f]{32}$", random_pool.hex_id(32))
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+    def test_fork_gets_new_bytes(self):
+        """Test a forked child does not reuse its parent's buffer."""
+        pool = RandomPool()
+        pool.read(1)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write_fd, pool.read(16))
+            os._exit(0)
+        os.waitpid(pid, 0)
+        child = os.read(read_fd, 16)
+        os.close(read_fd)
+        os.close(write_fd)
+        assert child != pool.read(16)
+
+
+class TestRequestIdGenerators:
+    """Test cases for each request ID mode."""
+
+    def test_counter(self):
+        """Test counter IDs share a process prefix and count up."""
+        generator = CounterRequestIds()
+        first, second = generator(), generator()
+        assert re.match(r"^[0-9a-f]{8}-1$", first)
+        assert second == f"{generator.prefix}-2"
+        assert CounterRequestIds().prefix != generator.prefix
+
+    def test_ulid(self):
+        """Test ULIDs are valid and ordered by time."""
+        generator = ULIDRequestIds()
+        first = generator()
+        time.sleep(0.002)
+        second = generator()
+        assert ULID_PATTERN.match(first)
+        assert first[:10] < second[:10]
+
+    def test_uuid7(self):
+        """Test UUIDv7 strings parse with the right version and variant."""
+        value = uuid.UUID(UUID7RequestIds()())
+        assert value.version == 7
+        assert value.variant == uuid.RFC_4122
+        assert abs((value.int >> 80) - time.time() * 1000) < 1000
+
+    def test_trust_header(self):
+        """Test valid incoming IDs are kept and others replaced."""
+        generator = create_request_id_generator("uuid7", trust_header=True)
+        assert generator(scope_with(b"edge-42")) == "edge-42"
+        for invalid in (b"", b"has space", b"x" * 129, "café".encode()):
+            assert generator(scope_with(invalid)) != invalid.decode()
+        assert create_request_id_generator("counter")(scope_with(b"edge-42")) != (
+            "edge-42"
+        )
+
+    def test_unknown_mode(self):
+        """Test unknown modes are rejected."""
+        with pytest.raises(ValueError):
+            create_request_id_generator("uuid4")
+
+
+class TestApplicationRequestIds:
+    """Test cases for the request IDs used by an application."""
+
+    def make_client(self, **options):
+        settings = Settings()
+        for name, value in options.items():
+            setattr(settings, name, value)
+        app_instance = ZestAPI(settings=settings)
+
+        @app_instance.route("/state")
+        async def state(request):
+            return ORJSONResponse({"request_id": request.state.request_id})
+
+        @app_instance.route("/fail")
+        async def fail(request):
+            raise RuntimeError("boom")
+
+        return TestClient(app_instance.create_app(), raise_server_exceptions=False)
+
+    def test_mode_setting(self):
+        """Test the configured mode is used for headers, state and errors."""
+        client = self.make_client(request_id_mode="ulid")
+        response = client.get("/state")
+        assert ULID_PATTERN.match(response.headers["x-request-id"])
+        assert response.json()["request_id"] == response.headers["x-request-id"]
+
+        response = client.get("/fail")
+        assert ULID_PATTERN.match(response.json()["error"]["request_id"])
+
+    def test_trusted_header(self):
+        """Test an incoming X-Request-ID is echoed back when trusted."""
+        client = self.make_client(request_id_trust_header=True)
+        response = client.get("/state", headers={"X-Request-ID": "lb-123"})
+        assert response.headers["x-request-id"] == "lb-123"
+        assert response.json()["request_id"] == "lb-123"
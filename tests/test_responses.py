@@ -0,0 +1,196 @@
+"""
+Tests for the orjson response classes.
+"""
+
+import asyncio
+import threading
+
+import anyio
+import orjson
+import pytest
+from starlette.applications import Starlette
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from zestapi import (
+    ORJSONResponse,
+    ORJSONStreamingResponse,
+    StaticJSONResponse,
+    ZestAPI,
+    route,
+)
+from zestapi.core.responses import static_endpoint
+from zestapi.core.settings import Settings
+
+
+def send_messages(response, headers=()):
+    """ASGI messages sent for ``response``"""
+    messages = []
+
+    async def receive():
+        await anyio.sleep_forever()
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        scope = {"type": "http", "method": "GET", "headers": list(headers)}
+        await response(scope, receive, send)
+
+    anyio.run(run)
+    return messages
+
+
+def stream(response):
+    """Body chunks sent for ``response``"""
+    messages = send_messages(response)
+    return [m["body"] for m in messages if m["type"] == "http.response.body"]
+
+
+async def agen(items):
+    for item in items:
+        yield item
+
+
+class TestORJSONStreamingResponse:
+    """Test cases for streaming JSON arrays and NDJSON."""
+
+    @pytest.mark.parametrize(
+        "content", [[], (), iter([]), agen([])], ids=["list", "tuple", "iter", "async"]
+    )
+    def test_empty(self, content):
+        """Test an empty iterable is an empty array."""
+        assert b"".join(stream(ORJSONStreamingResponse(content))) == b"[]"
+
+    @pytest.mark.parametrize("wrap", [list, iter, agen], ids=["list", "iter", "async"])
+    def test_array(self, wrap):
+        """Test items are streamed as one JSON array."""
+        items = [{"id": i, "name": f"item {i}"} for i in range(100)]
+        chunks = stream(ORJSONStreamingResponse(wrap(items), flush_size=256))
+        assert len(chunks) > 5
+        assert orjson.loads(b"".join(chunks)) == items
+
+    def test_ndjson(self):
+        """Test items are streamed one JSON document per line."""
+        items = [{"id": i} for i in range(10)]
+        response = ORJSONStreamingResponse(agen(items), format="ndjson")
+        assert response.media_type == "application/x-ndjson"
+        body = b"".join(stream(response))
+        assert [orjson.loads(line) for line in body.splitlines()] == items
+        assert body.endswith(b"\n")
+
+    def test_chunks_are_bounded_by_flush_size(self):
+        """Test no chunk holds much more than flush_size bytes."""
+        items = ({"payload": "x" * 100} for _ in range(1000))
+        chunks = stream(ORJSONStreamingResponse(items, flush_size=1024))
+        assert max(len(chunk) for chunk in chunks) < 1024 + 120
+
+    def test_sync_iterators_run_in_threads(self):
+        """Test blocking iterators are not pulled on the event loop."""
+        threads = set()
+        loop_threads = set()
+
+        def items():
+            for i in range(3):
+                threads.add(threading.get_ident())
+                yield i
+
+        async def endpoint(request):
+            loop_threads.add(threading.get_ident())
+            return ORJSONStreamingResponse(items())
+
+        client = TestClient(Starlette(routes=[Route("/", endpoint)]))
+        assert client.get("/").json() == [0, 1, 2]
+        assert threads and not threads & loop_threads
+
+    def test_invalid_format(self):
+        """Test unknown formats are rejected."""
+        with pytest.raises(ValueError):
+            ORJSONStreamingResponse([], format="csv")
+
+
+class TestStaticJSONResponse:
+    """Test cases for pre-rendered constant responses."""
+
+    def test_replayed_unchanged(self):
+        """Test every request gets the same prebuilt messages."""
+        response = StaticJSONResponse({"status": "healthy"}, headers={"X-A": "1"})
+        first = send_messages(response)
+        # Middleware may add headers to the messages it forwards
+        MutableHeaders(scope=first[0]).append("x-added", "1")
+        second = send_messages(response)
+
+        assert second[0]["status"] == 200
+        assert second[1]["body"] == b'{"status":"healthy"}'
+        assert (b"x-added", b"1") not in second[0]["headers"]
+        assert second[0]["headers"] == response.raw_headers
+        assert (b"x-a", b"1") in response.raw_headers
+
+    def test_etag(self):
+        """Test a matching If-None-Match gets a prebuilt 304."""
+        response = StaticJSONResponse({"status": "healthy"}, etag=True)
+        etag = response.headers["etag"].encode()
+        start, body = send_messages(response, [(b"if-none-match", etag)])
+        assert start["status"] == 304
+        assert (b"etag", etag) in start["headers"]
+        assert b"content-type" not in dict(start["headers"])
+        assert body["body"] == b""
+        assert send_messages(response)[0]["status"] == 200
+
+    def test_from_response(self):
+        """Test rendered responses are copied, and others rejected."""
+        response = ORJSONResponse({"a": 1}, status_code=201, etag=True)
+        static = StaticJSONResponse.from_response(response)
+        assert static.status_code == 201
+        assert static.body == response.body
+        assert static.raw_headers == response.raw_headers
+        assert static.etag == response.etag
+        with pytest.raises(TypeError):
+            StaticJSONResponse.from_response(
+                ORJSONStreamingResponse(iter([1]), media_type="application/json")
+            )
+
+    async def test_static_endpoint_stores_success_only(self):
+        """Test error responses are not replayed, and concurrent first
+        requests share one call."""
+        calls = []
+
+        async def health(request):
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            status_code = 503 if len(calls) == 1 else 200
+            return ORJSONResponse({"calls": len(calls)}, status_code=status_code)
+
+        endpoint = static_endpoint(health)
+        first = await endpoint(None)
+        assert first.status_code == 503
+
+        responses = await asyncio.gather(*(endpoint(None) for _ in range(5)))
+        assert [response.status_code for response in responses] == [200] * 5
+        assert all(isinstance(r, StaticJSONResponse) for r in responses)
+        assert len({id(response) for response in responses}) == 1
+        assert (await endpoint(None)).body == b'{"calls":2}'
+        assert len(calls) == 2
+
+    def test_static_routes(self):
+        """Test static routes call their handler for the first request only."""
+        calls = []
+
+        async def health(request):
+            calls.append(1)
+            return ORJSONResponse({"status": "healthy"})
+
+        settings = Settings()
+        settings.jwt_secret = "test-secret"
+        app_instance = ZestAPI(settings=settings)
+        app_instance.add_route("/health", health, static=True)
+        app_instance.add_route("/root", route("/root", static=True)(health))
+        assert app_instance.route("/decorated", static=True)(health) is health
+
+        client = TestClient(app_instance.create_app())
+        for path in ("/health", "/health", "/root", "/root", "/decorated"):
+            response = client.get(path)
+            assert response.json() == {"status": "healthy"}
+        assert client.get("/health").headers["content-type"] == "application/json"
+        assert len(calls) == 3
@@ -0,0 +1,155 @@
+"""
+Tests for the ZestAPI compiled router.
+"""
+
+import uuid
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route, Router, WebSocketRoute
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI
+from zestapi.core.router import RadixRouter
+from zestapi.core.settings import Settings
+
+
+async def echo(request):
+    return ORJSONResponse(
+        {
+            "route": request.scope["route"].path,
+            "params": {k: repr(v) for k, v in request.path_params.items()},
+        }
+    )
+
+
+async def websocket_echo(websocket):
+    await websocket.accept()
+    await websocket.send_json(dict(websocket.path_params))
+    await websocket.close()
+
+
+TREE_ROUTES = [
+    Route("/", echo),
+    Route("/users", echo, methods=["GET", "POST"]),
+    Route("/users/{user_id:int}", echo),
+    Route("/users/{user_id:int}/posts/{slug}", echo),
+    Route("/users/{name}", echo, methods=["GET", "DELETE"]),
+    Route("/users/me", echo),
+    Route("/items/{item_id:uuid}", echo),
+    Route("/prices/{amount:float}", echo),
+    Route("/files/{file_path:path}", echo),
+    Route("/trailing/", echo),
+    WebSocketRoute("/ws/{room}", websocket_echo),
+]
+
+# Routes the tree can't represent
+ROUTES = TREE_ROUTES + [
+    Route("/reports/{year:int}.csv", echo),
+    Mount("/static", app=PlainTextResponse("static")),
+]
+
+PATHS = [
+    "/",
+    "/users",
+    "/users/",
+    "/users/42",
+    "/users/42/posts/hello",
+    "/users/alice",
+    "/users/me",
+    "/users/%C3%A9",
+    "/users/42/posts",
+    f"/items/{uuid.UUID(int=7)}",
+    "/items/not-a-uuid",
+    "/prices/9.99",
+    "/prices/3",
+    "/files/",
+    "/files/a/b/c.txt",
+    "/files",
+    "/reports/2024.csv",
+    "/trailing",
+    "/static/app.js",
+    "/missing",
+]
+
+
+def make_client(router_class, routes=ROUTES):
+    app = Starlette(routes=routes)
+    app.router = router_class(routes)
+    return TestClient(app)
+
+
+class TestRadixRouter:
+    """Test cases for the radix tree router."""
+
+    @pytest.mark.parametrize("routes", [ROUTES, TREE_ROUTES])
+    @pytest.mark.parametrize("method", ["GET", "POST", "DELETE", "HEAD"])
+    def test_matches_starlette(self, method, routes):
+        """Test routing matches Starlette's, except static-first priority."""
+        radix = make_client(RadixRouter, routes)
+        linear = make_client(Router, routes)
+
+        for path in PATHS:
+            expected = linear.request(method, path, follow_redirects=False)
+            response = radix.request(method, path, follow_redirects=False)
+            if path == "/users/me" and method in ("GET", "POST"):
+                # Starlette picks the earlier /users/{name}; static wins here
+                if method == "GET":
+                    assert response.json()["route"] == "/users/me"
+                continue
+            assert response.status_code == expected.status_code, path
+            assert response.content == expected.content, path
+            assert response.headers.get("allow") == expected.headers.get("allow")
+            assert response.headers.get("location") == expected.headers.get("location")
+
+    def test_typed_parameters(self):
+        """Test parameters are converted and tried most specific first."""
+        client = make_client(RadixRouter)
+
+        assert client.get("/users/42").json() == {
+            "route": "/users/{user_id:int}",
+            "params": {"user_id": "42"},
+        }
+        assert client.get("/users/42/posts/hi").json()["params"] == {
+            "user_id": "42",
+            "slug": "'hi'",
+        }
+        assert client.get("/prices/9.5").json()["params"] == {"amount": "9.5"}
+        assert client.get("/files/a/b").json()["params"] == {"file_path": "'a/b'"}
+
+    def test_unsupported_routes_fall_back(self):
+        """Test mounts and mixed segments are matched linearly."""
+        router = RadixRouter(ROUTES)
+        assert router.fallback_routes == 2
+
+        client = make_client(RadixRouter)
+        assert client.get("/reports/2024.csv").json()["params"] == {"year": "2024"}
+        assert client.get("/static/app.js").text == "static"
+
+    def test_websocket_route(self):
+        """Test WebSocket routes are matched through the tree."""
+        client = make_client(RadixRouter)
+        with client.websocket_connect("/ws/lobby") as websocket:
+            assert websocket.receive_json() == {"room": "lobby"}
+
+    def test_routes_added_later(self):
+        """Test the tree is rebuilt when routes are added after compiling."""
+        app = Starlette()
+        app.router = RadixRouter()
+        app.add_route("/late/{n:int}", echo)
+        client = TestClient(app)
+        assert client.get("/late/3").json()["params"] == {"n": "3"}
+
+    def test_create_app(self):
+        """Test ZestAPI uses the compiled router when enabled."""
+        settings = Settings()
+        settings.compiled_router = True
+        app_instance = ZestAPI(settings=settings)
+        app_instance.add_route("/things/{thing_id:int}", echo)
+        app = app_instance.create_app()
+
+        assert isinstance(app.router, RadixRouter)
+        client = TestClient(app)
+        assert client.get("/things/5").json()["params"] == {"thing_id": "5"}
+        assert client.get("/things/x").status_code == 404
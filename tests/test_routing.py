@@ -0,0 +1,209 @@
+"""
+Tests for ZestAPI route discovery.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from starlette.testclient import TestClient
+
+from zestapi import ZestAPI
+from zestapi.core.routing import (
+    LazyEndpoint,
+    discover_lazy_routes,
+    discover_routes,
+    import_times,
+    load_route_module,
+    scan_route_source,
+)
+from zestapi.core.settings import Settings
+
+ROUTE_MODULE = """
+import zestapi as z
+from zestapi import ORJSONResponse, route, websocket_route as ws
+
+with open({log!r}, "a") as f:
+    f.write(__name__ + "\\n")
+
+LIMIT = "5/minute"
+
+
+@route("/{name}/{{item_id:int}}", methods=["GET", "POST"])
+async def get_item(request):
+    return ORJSONResponse({{"item": request.path_params["item_id"]}})
+
+
+@z.route("/{name}", rate_limit={{"default": "10/minute"}})
+async def list_items(request):
+    return ORJSONResponse({{"items": []}})
+
+
+@ws("/{name}/live")
+async def live(websocket):
+    await websocket.accept()
+    await websocket.close()
+"""
+
+
+def write_module(directory, name):
+    log = directory / "imports.log"
+    (directory / f"{name}.py").write_text(ROUTE_MODULE.format(name=name, log=str(log)))
+
+
+def imports(directory):
+    log = directory / "imports.log"
+    return log.read_text().split() if log.exists() else []
+
+
+def lazy_settings(warmup=False):
+    settings = Settings()
+    settings.lazy_routes = True
+    settings.lazy_routes_warmup = warmup
+    return settings
+
+
+class TestLazyRoutes:
+    """Test cases for discovering routes without importing modules."""
+
+    def test_scan_matches_import(self, tmp_path):
+        """Test scanned route metadata matches what importing produces."""
+        write_module(tmp_path, "items")
+        eager = discover_routes(str(tmp_path))
+        lazy = discover_lazy_routes(str(tmp_path))
+
+        assert [(r.path, r.name) for r in lazy] == [(r.path, r.name) for r in eager]
+        assert [r.endpoint.__route__ for r in lazy] == [
+            r.endpoint.__route__ for r in eager
+        ]
+        assert all(isinstance(r.endpoint, LazyEndpoint) for r in lazy)
+
+    def test_dynamic_decorators_are_imported(self):
+        """Test modules with non-literal decorator arguments are imported."""
+        source = ROUTE_MODULE.format(name="items", log="x").replace(
+            'rate_limit={"default": "10/minute"}', "rate_limit=LIMIT"
+        )
+        assert scan_route_source(source) is None
+        # Functions decorated by something else are not routes
+        assert scan_route_source("@app.route('/x')\nasync def x(r): pass") == []
+
+    def test_unrecognised_decorators_are_imported(self, tmp_path):
+        """Test modules whose decorators the scan misses are imported."""
+        (tmp_path / "aliased.py").write_text(
+            "import zestapi.core.routing as r\n\n\n"
+            "@r.route('/x')\n"
+            "async def x(request):\n"
+            "    pass\n"
+        )
+        assert scan_route_source((tmp_path / "aliased.py").read_text()) == []
+        eager = discover_routes(str(tmp_path))
+        assert [r.path for r in eager] == ["/x"]
+        assert [r.path for r in discover_lazy_routes(str(tmp_path))] == ["/x"]
+        assert [r.path for r in discover_lazy_routes(str(tmp_path), workers=2)] == [
+            "/x"
+        ]
+
+    def test_import_on_first_request(self, tmp_path):
+        """Test a module is imported once, when one of its routes is hit."""
+        write_module(tmp_path, "items")
+        app_instance = ZestAPI(settings=lazy_settings(), routes_dir=str(tmp_path))
+        client = TestClient(app_instance.create_app())
+        assert imports(tmp_path) == []
+
+        assert client.get("/items/3").json() == {"item": 3}
+        assert client.get("/items").json() == {"items": []}
+        assert imports(tmp_path) == ["items"]
+        assert str(tmp_path / "items.py") in import_times
+
+    async def test_slow_import_does_not_block(self, tmp_path):
+        """Test a slow import holds up neither other modules nor the loop."""
+        (tmp_path / "slow.py").write_text("import time\ntime.sleep(0.5)\n")
+        write_module(tmp_path, "items")
+        warmup = threading.Thread(
+            target=load_route_module, args=(str(tmp_path / "slow.py"),)
+        )
+        warmup.start()
+        time.sleep(0.05)
+
+        items = [
+            r.endpoint
+            for r in discover_lazy_routes(str(tmp_path))
+            if r.path == "/items"
+        ][0]
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/items",
+            "headers": [],
+            "query_string": b"",
+        }
+        start = time.monotonic()
+        ticks = 0
+        request = asyncio.ensure_future(items(scope, receive, send))
+        while not request.done():
+            ticks += 1
+            await asyncio.sleep(0)
+        assert time.monotonic() - start < 0.4
+        assert ticks > 1
+        assert sent[0]["status"] == 200
+        warmup.join()
+
+    def test_background_warmup(self, tmp_path, caplog):
+        """Test modules are imported after startup without a request."""
+        write_module(tmp_path, "items")
+        write_module(tmp_path, "orders")
+        app_instance = ZestAPI(
+            settings=lazy_settings(warmup=True), routes_dir=str(tmp_path)
+        )
+        app = app_instance.create_app()
+        assert imports(tmp_path) == []
+
+        with caplog.at_level(logging.INFO, logger="zestapi.core.routing"):
+            with TestClient(app):
+                deadline = time.monotonic() + 5
+                while len(imports(tmp_path)) < 2 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+
+        assert sorted(imports(tmp_path)) == ["items", "orders"]
+        assert "Imported 2 route modules" in caplog.text
+
+
+class TestParallelDiscovery:
+    """Test cases for preparing route modules in a thread pool."""
+
+    def test_matches_sequential(self, tmp_path):
+        """Test parallel discovery finds the same routes in the same order."""
+        for name in ["users", "orders", "items"]:
+            write_module(tmp_path, name)
+        (tmp_path / "shop").mkdir()
+        write_module(tmp_path / "shop", "carts")
+
+        sequential = discover_routes(str(tmp_path))
+        parallel = discover_routes(str(tmp_path), workers=4)
+        lazy = discover_lazy_routes(str(tmp_path), workers=4)
+
+        expected = [(r.path, r.name) for r in sequential]
+        assert len(expected) == 12
+        assert [(r.path, r.name) for r in parallel] == expected
+        assert [(r.path, r.name) for r in lazy] == expected
+
+    def test_helper_modules_are_skipped(self, tmp_path):
+        """Test helper modules without routes are compiled but not run."""
+        write_module(tmp_path, "items")
+        (tmp_path / "helpers.py").write_text(
+            f"open({str(tmp_path / 'imports.log')!r}, 'a').write('helpers\\n')\n"
+        )
+        (tmp_path / "broken.py").write_text("def broken(:\n")
+
+        routes = discover_routes(str(tmp_path), workers=2)
+        assert len(routes) == 3
+        assert imports(tmp_path) == ["items"]
@@ -2,7 +2,15 @@
 Tests for ZestAPI security features.
 """
 
+import time
+from datetime import timedelta
+
+import pytest
+from starlette.requests import HTTPConnection
+
+from zestapi.core import security
 from zestapi.core.security import JWTAuthBackend, create_access_token
+from zestapi.core.settings import settings
 
 
 class TestSecurity:
@@ -19,3 +27,80 @@ class TestSecurity:
         """Test JWT authentication backend."""
         backend = JWTAuthBackend()
         assert backend is not None
+
+
+def make_connection(token):
+    return HTTPConnection(
+        {
+            "type": "http",
+            "headers": [(b"authorization", f"Bearer {token}".encode())],
+        }
+    )
+
+
+class TestJWTCache:
+    """Test cases for caching verified tokens."""
+
+    @pytest.fixture(autouse=True)
+    def jwt_settings(self, monkeypatch, jwt_secret):
+        monkeypatch.setattr(settings, "jwt_secret", jwt_secret)
+
+    async def test_hits_and_misses(self):
+        """Test repeated tokens are served from the cache."""
+        backend = JWTAuthBackend()
+        token = create_access_token({"sub": "alice"})
+
+        for _ in range(3):
+            credentials, user = await backend.authenticate(make_connection(token))
+            assert user.username == "alice"
+            assert credentials.scopes == ["authenticated"]
+
+        assert backend.cache_info() == {
+            "hits": 2,
+            "misses": 1,
+            "size": 1,
+            "max_size": 10_000,
+        }
+
+    async def test_invalid_tokens_not_cached(self):
+        """Test failed verifications are not cached."""
+        backend = JWTAuthBackend()
+        for token in ["not-a-jwt", create_access_token({"role": "admin"})]:
+            assert await backend.authenticate(make_connection(token)) is None
+        assert backend.cache_info()["size"] == 0
+
+    async def test_expires_at_exp(self, monkeypatch):
+        """Test entries expire with the token's exp claim."""
+        backend = JWTAuthBackend()
+        token = create_access_token({"sub": "alice"}, timedelta(seconds=60))
+        await backend.authenticate(make_connection(token))
+
+        now = time.time()
+        monkeypatch.setattr(security.time, "time", lambda: now + 59)
+        await backend.authenticate(make_connection(token))
+        assert backend.cache_hits == 1
+
+        # python-jose still uses the real clock, so the token re-verifies
+        monkeypatch.setattr(security.time, "time", lambda: now + 61)
+        await backend.authenticate(make_connection(token))
+        assert backend.cache_misses == 2
+
+    async def test_size_cap(self):
+        """Test the least recently used tokens are evicted."""
+        backend = JWTAuthBackend(cache_size=2)
+        tokens = [create_access_token({"sub": name}) for name in "abc"]
+        for token in tokens:
+            await backend.authenticate(make_connection(token))
+
+        assert backend.cache_info()["size"] == 2
+        await backend.authenticate(make_connection(tokens[0]))
+        assert backend.cache_misses == 4
+
+    async def test_secret_rotation_clears_cache(self, monkeypatch):
+        """Test tokens signed with a previous secret stop authenticating."""
+        backend = JWTAuthBackend()
+        token = create_access_token({"sub": "alice"})
+        assert await backend.authenticate(make_connection(token)) is not None
+
+        monkeypatch.setattr(settings, "jwt_secret", "rotated-secret")
+        assert await backend.authenticate(make_connection(token)) is None
@@ -0,0 +1,255 @@
+"""
+Tests for W3C trace context propagation and span export.
+"""
+
+import sys
+import threading
+
+import orjson
+import pytest
+from starlette.testclient import TestClient
+
+from zestapi import ORJSONResponse, ZestAPI
+from zestapi.core.settings import Settings
+from zestapi.core.tracing import (
+    FileSpanExporter,
+    InMemorySpanExporter,
+    Tracer,
+    current_span,
+    format_traceparent,
+    parse_traceparent,
+    trace_headers,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+def make_app(exporter, **options):
+    settings = Settings()
+    settings.jwt_secret = "test-secret"
+    for name, value in options.items():
+        setattr(settings, name, value)
+    app_instance = ZestAPI(settings=settings)
+    app_instance.set_span_exporter(exporter)
+
+    @app_instance.route("/items/{item_id:int}")
+    async def item(request):
+        with app_instance.tracer.span("load item", item_id=1) as span:
+            headers = trace_headers()
+        assert current_span() is not span
+        return ORJSONResponse({"headers": headers, "span": span.span_id})
+
+    @app_instance.route("/fail")
+    async def fail(request):
+        raise RuntimeError("boom")
+
+    return app_instance
+
+
+def finished_spans(app_instance):
+    app_instance.tracer.flush()
+    return {span["name"]: span for span in app_instance.span_exporter.spans}
+
+
+class TestTraceparent:
+    """Test cases for parsing and formatting traceparent headers."""
+
+    def test_round_trip(self):
+        """Test a valid header is parsed into its fields."""
+        header = format_traceparent(TRACE_ID, PARENT_ID, True)
+        assert header == f"00-{TRACE_ID}-{PARENT_ID}-01"
+        assert parse_traceparent(header) == (TRACE_ID, PARENT_ID, True)
+        assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00")[2] is False
+
+    @pytest.mark.parametrize(
+        "header",
+        [
+            "",
+            "garbage",
+            f"ff-{TRACE_ID}-{PARENT_ID}-01",
+            f"00-{'0' * 32}-{PARENT_ID}-01",
+            f"00-{TRACE_ID}-{'0' * 16}-01",
+            f"00-{TRACE_ID.upper()}-{PARENT_ID}-01",
+            f"00-{TRACE_ID}-{PARENT_ID}-01-extra",
+            f"00-{TRACE_ID[:-1]}-{PARENT_ID}-01",
+        ],
+    )
+    def test_invalid(self, header):
+        """Test malformed headers are ignored."""
+        assert parse_traceparent(header) is None
+
+    def test_future_version(self):
+        """Test later versions are read by their first four fields."""
+        header = f"01-{TRACE_ID}-{PARENT_ID}-01-extra"
+        assert parse_traceparent(header) == (TRACE_ID, PARENT_ID, True)
+
+
+class TestTracer:
+    """Test cases for span creation, batching and pooling."""
+
+    def test_batches_and_pooling(self):
+        """Test spans are exported in batches and reused afterwards."""
+        exporter = InMemorySpanExporter()
+        tracer = Tracer(exporter, batch_size=2)
+        root = tracer.start_span("root")
+        child = tracer.start_span("child", root)
+        assert child.trace_id == root.trace_id
+        assert child.parent_id == root.span_id
+        tracer.end_span(child)
+        tracer.end_span(root)
+        tracer.flush()
+
+        assert [span["name"] for span in exporter.spans] == ["child", "root"]
+        # Exported spans go back to the pool
+        assert tracer.start_span("next") in (root, child)
+        tracer.shutdown()
+
+    def test_pool_shared_between_threads(self):
+        """Test concurrent threads never get the same recycled span."""
+        tracer = Tracer(
+            InMemorySpanExporter(), sample_rate=0.5, batch_size=4, pool_size=1
+        )
+        owners = {}
+        owners_lock = threading.Lock()
+        errors = []
+
+        def work(worker):
+            try:
+                for _ in range(2000):
+                    span = tracer.start_span("work")
+                    with owners_lock:
+                        assert id(span) not in owners
+                        owners[id(span)] = worker
+                    with owners_lock:
+                        del owners[id(span)]
+                    tracer.end_span(span)
+            except BaseException as exc:
+                errors.append(exc)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        tracer.shutdown()
+        assert errors == []
+
+    def test_unsampled_traces_are_not_exported(self):
+        """Test sampling decisions are made per trace and inherited."""
+        exporter = InMemorySpanExporter()
+        tracer = Tracer(exporter, sample_rate=0.0)
+        root = tracer.start_span("root")
+        child = tracer.start_span("child", root)
+        assert not child.sampled
+        remote = tracer.start_span(
+            "remote", traceparent=format_traceparent(TRACE_ID, PARENT_ID, True)
+        )
+        assert remote.sampled
+        for span in (child, root, remote):
+            tracer.end_span(span)
+        tracer.flush()
+        assert [span["name"] for span in exporter.spans] == ["remote"]
+        tracer.shutdown()
+
+    def test_file_exporter(self, tmp_path):
+        """Test spans are written as JSON lines."""
+        path = tmp_path / "spans.jsonl"
+        tracer = Tracer(FileSpanExporter(str(path), service_name="shop"))
+        with tracer.span("work", items=3):
+            pass
+        tracer.shutdown()
+
+        (line,) = path.read_bytes().splitlines()
+        span = orjson.loads(line)
+        assert span["name"] == "work"
+        assert span["attributes"] == {"items": 3}
+        assert span["resource"] == {"service.name": "shop"}
+        assert span["endTimeUnixNano"] >= span["startTimeUnixNano"]
+
+
+class TestRequestTracing:
+    """Test cases for spans created while handling requests."""
+
+    def test_continues_incoming_trace(self):
+        """Test the server span joins the caller's trace and propagates it."""
+        app_instance = make_app(InMemorySpanExporter())
+        client = TestClient(app_instance.create_app())
+        response = client.get(
+            "/items/1",
+            headers={
+                "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01",
+                "tracestate": "vendor=abc",
+            },
+        )
+        assert response.status_code == 200
+        assert response.headers["x-request-id"] == TRACE_ID
+
+        spans = finished_spans(app_instance)
+        server = spans["GET /items/{item_id:int}"]
+        assert server["kind"] == "server"
+        assert server["parentSpanId"] == PARENT_ID
+        assert server["attributes"]["http.route"] == "/items/{item_id:int}"
+        assert server["attributes"]["http.response.status_code"] == 200
+
+        # Each middleware layer and the handler nest under the server span
+        chain = [
+            "cors",
+            "authentication",
+            "rate_limit",
+            "handler /items/{item_id:int}",
+        ]
+        parent = server
+        for name in chain:
+            assert spans[name]["parentSpanId"] == parent["spanId"]
+            assert spans[name]["traceId"] == TRACE_ID
+            parent = spans[name]
+
+        custom = spans["load item"]
+        assert custom["parentSpanId"] == parent["spanId"]
+        assert custom["attributes"] == {"item_id": 1}
+        headers = response.json()["headers"]
+        assert headers == {
+            "traceparent": f"00-{TRACE_ID}-{response.json()['span']}-01",
+            "tracestate": "vendor=abc",
+        }
+
+    def test_new_trace(self):
+        """Test requests without a traceparent start a trace with a full
+        length request ID."""
+        app_instance = make_app(InMemorySpanExporter())
+        client = TestClient(app_instance.create_app())
+        request_id = client.get("/items/1").headers["x-request-id"]
+        assert len(request_id) == 32
+
+        server = finished_spans(app_instance)["GET /items/{item_id:int}"]
+        assert server["traceId"] == request_id
+        assert server["parentSpanId"] == ""
+
+    def test_errors(self):
+        """Test failed requests mark their spans as errors."""
+        app_instance = make_app(InMemorySpanExporter())
+        client = TestClient(app_instance.create_app())
+        response = client.get("/fail")
+        assert response.status_code == 500
+        assert response.json()["error"]["request_id"] == (
+            response.headers["x-request-id"]
+        )
+
+        spans = finished_spans(app_instance)
+        assert spans["GET /fail"]["status"] == {"code": "ERROR"}
+        assert spans["handler /fail"]["attributes"] == {
+            "exception.type": "RuntimeError",
+            "exception.message": "boom",
+        }
+
+    def test_disabled_by_default(self):
+        """Test no tracer is created unless enabled."""
+        app_instance = ZestAPI(settings=Settings())
+        app_instance.create_app()
+        assert app_instance.tracer is None
@@ -18,9 +18,20 @@ Key Features:
 from starlette.responses import HTMLResponse
 
 from .core.application import ZestAPI
-from .core.middleware import ErrorHandlingMiddleware, RequestLoggingMiddleware
+from .core.cache import cached, invalidate_cache
+from .core.conditional import not_modified, version_etag
+from .core.executor import CPUExecutor, ExecutorBusy, run_cpu_bound
+from .core.middleware import (
+    CoreMiddleware,
+    ErrorHandlingMiddleware,
+    RequestLoggingMiddleware,
+)
 from .core.ratelimit import RateLimitMiddleware
-from .core.responses import ORJSONResponse
+from .core.responses import (
+    ORJSONResponse,
+    ORJSONStreamingResponse,
+    StaticJSONResponse,
+)
 from .core.routing import route, websocket_route
 from .core.security import JWTAuthBackend, create_access_token
 from .core.settings import Settings
@@ -38,11 +49,21 @@ __all__ = [
     "route",
     "websocket_route",
     "ORJSONResponse",
+    "ORJSONStreamingResponse",
+    "StaticJSONResponse",
+    "not_modified",
+    "cached",
+    "invalidate_cache",
+    "version_etag",
     "HTMLResponse",
     "Settings",
     "create_access_token",
     "JWTAuthBackend",
+    "CoreMiddleware",
     "ErrorHandlingMiddleware",
     "RequestLoggingMiddleware",
     "RateLimitMiddleware",
+    "CPUExecutor",
+    "ExecutorBusy",
+    "run_cpu_bound",
 ]
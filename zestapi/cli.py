@@ -6,6 +6,7 @@ This module provides command-line interface tools for ZestAPI projects.
 import argparse
 import os
 import sys
+from typing import Optional
 
 
 def init_project() -> None:
@@ -126,6 +127,19 @@ def view_route_map() -> None:
         print(f"  Error discovering routes: {e}")
 
 
+def build_route_manifest(routes_dir: str, output: Optional[str] = None) -> None:
+    """Write the route manifest for a routes directory"""
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from zestapi.core.manifest import write_manifest
+
+    if not os.path.exists(routes_dir):
+        print(f"  Routes directory not found: {routes_dir}")
+        return
+    output = write_manifest(routes_dir, output)
+    print(f"Route manifest written to {output}")
+    print(f"Set ROUTES_MANIFEST={output} to use it")
+
+
 def generate_plugin(name: str) -> None:
     """Generate a new plugin"""
     print(f"Generating plugin: {name}.py")
@@ -198,6 +212,17 @@ def main() -> None:
     # route-map command
     subparsers.add_parser("route-map", help="View the ZestAPI route map")
 
+    # manifest command
+    manifest_parser = subparsers.add_parser(
+        "manifest", help="Write the route manifest used for lazy route loading"
+    )
+    manifest_parser.add_argument(
+        "--routes-dir", default=os.path.join("app", "routes"), help="Routes directory"
+    )
+    manifest_parser.add_argument(
+        "--output", help="Manifest file (default: <routes-dir>/manifest.json)"
+    )
+
     # version command
     subparsers.add_parser("version", help="Show ZestAPI version")
 
@@ -214,6 +239,8 @@ def main() -> None:
             generate_parser.print_help()
     elif args.command == "route-map":
         view_route_map()
+    elif args.command == "manifest":
+        build_route_manifest(args.routes_dir, args.output)
     elif args.command == "version":
         from zestapi import __version__
 
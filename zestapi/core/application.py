@@ -1,19 +1,73 @@
+import asyncio
+import contextlib
 import importlib.util
 import logging
 import sys
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
 from starlette.applications import Starlette
 from starlette.middleware.authentication import AuthenticationMiddleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.routing import BaseRoute, Route, WebSocketRoute
 
-from .middleware import ErrorHandlingMiddleware, RequestLoggingMiddleware
-from .ratelimit import RateLimitMiddleware
-from .routing import discover_routes
-from .security import JWTAuthBackend
+from .cache import ResponseCache, create_response_cache, set_response_cache
+from .compression import CompressionMiddleware
+from .conditional import ConditionalMiddleware
+from .executor import (
+    CPUExecutor,
+    cpu_executor_installed,
+    get_cpu_executor,
+    set_cpu_executor,
+)
+from .jwks import JWKSKeySet
+from .logs import (
+    LOG_FORMAT,
+    BatchRotatingFileHandler,
+    BatchStreamHandler,
+    JSONFormatter,
+    QueueLogHandler,
+)
+from .manifest import manifest_routes, read_manifest
+from .metrics import MetricsRegistry, instrument_routes, metrics_endpoint
+from .middleware import CoreMiddleware
+from .profiling import (
+    LogTimingHook,
+    MetricsTimingHook,
+    PhaseMiddleware,
+    TimingHook,
+    TimingMiddleware,
+    profiler_endpoint,
+    time_routes,
+)
+from .ratelimit import (
+    RateLimitMiddleware,
+    RateLimitSpec,
+    apply_route_rate_limits,
+    rate_limit_rejections,
+)
+from .ratelimit_stores import create_store
+from .request_id import create_request_id_generator
+from .responses import static_endpoint
+from .router import RadixRouter
+from .routing import (
+    discover_lazy_routes,
+    discover_routes,
+    import_times,
+    log_import_times,
+    warm_up_routes,
+)
+from .security import JWTAuthBackend, create_auth_backend
 from .settings import Settings
+from .tracing import (
+    FileSpanExporter,
+    InMemorySpanExporter,
+    SpanExporter,
+    SpanMiddleware,
+    Tracer,
+    trace_routes,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +92,20 @@ class ZestAPI:
         self._routes: List[BaseRoute] = []
         self._app: Optional[Starlette] = None
         self._error_handlers: Dict[Any, Callable] = {}
+        # id(route) -> rate limit given to add_route()
+        self._route_rate_limits: Dict[int, RateLimitSpec] = {}
+        self.auth_backend: Optional[JWTAuthBackend] = None
+        self.jwks: Optional[JWKSKeySet] = None
+        self.cpu_executor: Optional[CPUExecutor] = None
+        self._owns_cpu_executor = False
+        self.response_cache: Optional[ResponseCache] = None
+        self.metrics: Optional[MetricsRegistry] = None
+        self._timing_hooks: List[TimingHook] = []
+        self.span_exporter: Optional[SpanExporter] = None
+        self.tracer: Optional[Tracer] = None
 
         # Configure logging
+        self.log_handler: Optional[QueueLogHandler] = None
         self._setup_logging()
 
         # Validate settings
@@ -49,18 +115,18 @@ class ZestAPI:
         """Setup logging configuration"""
         try:
             log_level = getattr(logging, self.settings.log_level.upper())
+            handlers = self._log_handlers()
             logging.basicConfig(
                 level=log_level,
-                format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-                handlers=[
-                    logging.StreamHandler(sys.stdout),
-                    (
-                        logging.FileHandler("zestapi.log")
-                        if not self.settings.debug
-                        else logging.NullHandler()
-                    ),
-                ],
+                format=LOG_FORMAT,
+                handlers=handlers,
             )
+            if self.log_handler is not None and (
+                self.log_handler not in logging.getLogger().handlers
+            ):
+                # Logging was already configured; don't leave the writer idle
+                self.log_handler.close()
+                self.log_handler = None
             logger.info(
                 f"Logging configured at {self.settings.log_level.upper()} " f"level"
             )
@@ -68,9 +134,52 @@ class ZestAPI:
             logger.warning(f"Failed to setup logging: {e}")
             logging.basicConfig(level=logging.INFO)
 
+    def _log_handlers(self) -> List[logging.Handler]:
+        """Console and (outside debug mode) file handlers, behind a
+        background writer when ``log_queue`` is enabled"""
+        queued = self.settings.log_queue
+        handlers: List[logging.Handler] = [
+            (
+                BatchStreamHandler(sys.stdout)
+                if queued
+                else logging.StreamHandler(sys.stdout)
+            )
+        ]
+        if self.settings.debug:
+            handlers.append(logging.NullHandler())
+        elif self.settings.log_file_max_bytes > 0 or queued:
+            file_handler_class = (
+                BatchRotatingFileHandler if queued else RotatingFileHandler
+            )
+            handlers.append(
+                file_handler_class(
+                    self.settings.log_file,
+                    maxBytes=self.settings.log_file_max_bytes,
+                    backupCount=self.settings.log_file_backup_count,
+                )
+            )
+        else:
+            handlers.append(logging.FileHandler(self.settings.log_file))
+
+        formatter = (
+            JSONFormatter()
+            if self.settings.log_format == "json"
+            else logging.Formatter(LOG_FORMAT)
+        )
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        if not queued:
+            return handlers
+        self.log_handler = QueueLogHandler(
+            handlers,
+            queue_size=self.settings.log_queue_size,
+            drop=self.settings.log_queue_drop,
+        )
+        return [self.log_handler]
+
     def _validate_settings(self) -> None:
         """Validate application settings"""
-        if (
+        if not self.settings.jwt_jwks and (
             not self.settings.jwt_secret
             or self.settings.jwt_secret == "your-secret-key"
         ):
@@ -89,14 +198,26 @@ class ZestAPI:
         endpoint: Callable,
         methods: Optional[List[str]] = None,
         name: Optional[str] = None,
+        rate_limit: Optional[RateLimitSpec] = None,
+        static: bool = False,
     ) -> None:
-        """Add a route to the application"""
+        """
+        Add a route to the application
+
+        With ``static``, the endpoint still runs on the first request, and its
+        first 2xx response is replayed to all later requests (see
+        ``static_endpoint``).
+        """
         if methods is None:
             methods = ["GET"]
+        if static:
+            endpoint = static_endpoint(endpoint)
 
         try:
             route = Route(path, endpoint, methods=methods, name=name)
             self._routes.append(route)
+            if rate_limit:
+                self._route_rate_limits[id(route)] = rate_limit
             logger.debug(f"Route added: {methods} {path}")
         except Exception as e:
             logger.error(f"Failed to add route {path}: {e}")
@@ -119,11 +240,20 @@ class ZestAPI:
         path: str,
         methods: Optional[List[str]] = None,
         name: Optional[str] = None,
+        rate_limit: Optional[RateLimitSpec] = None,
+        static: bool = False,
     ) -> Callable:
         """Decorator for adding routes to the application"""
 
         def decorator(func: Callable) -> Callable:
-            self.add_route(path, func, methods=methods, name=name)
+            self.add_route(
+                path,
+                func,
+                methods=methods,
+                name=name,
+                rate_limit=rate_limit,
+                static=static,
+            )
             return func
 
         return decorator
@@ -163,6 +293,15 @@ class ZestAPI:
         else:
             logger.warning("Cannot add middleware - app not created yet")
 
+    def add_timing_hook(self, hook: TimingHook) -> None:
+        """Call ``hook`` with the phase timings of every request, enabling
+        phase timing"""
+        self._timing_hooks.append(hook)
+
+    def set_span_exporter(self, exporter: SpanExporter) -> None:
+        """Export spans to ``exporter``, enabling tracing"""
+        self.span_exporter = exporter
+
     def add_exception_handler(self, exc_class: Any, handler: Callable) -> None:
         """Add custom exception handler"""
         self._error_handlers[exc_class] = handler
@@ -182,7 +321,24 @@ class ZestAPI:
             return
 
         try:
-            discovered_routes = discover_routes(self.routes_dir)
+            manifest = None
+            if self.settings.routes_manifest:
+                manifest = read_manifest(self.settings.routes_manifest)
+                if manifest is None:
+                    logger.warning(
+                        f"Route manifest not found: {self.settings.routes_manifest}"
+                    )
+            if manifest is not None:
+                discovered_routes = manifest_routes(self.routes_dir, manifest)
+            elif self.settings.lazy_routes:
+                discovered_routes = discover_lazy_routes(
+                    self.routes_dir, workers=self.settings.route_discovery_workers
+                )
+            else:
+                discovered_routes = discover_routes(
+                    self.routes_dir, workers=self.settings.route_discovery_workers
+                )
+            log_import_times(import_times)
             self._routes.extend(discovered_routes)
             logger.info(
                 f"Discovered {len(discovered_routes)} routes from " f"{self.routes_dir}"
@@ -221,6 +377,30 @@ class ZestAPI:
             if not self.settings.debug:
                 raise RuntimeError(f"Plugin loading failed: {e}")
 
+    @contextlib.asynccontextmanager
+    async def _lifespan(self, app: Starlette) -> AsyncIterator[None]:
+        """Start background tasks on startup and stop them on shutdown"""
+        warmup = None
+        if self.settings.lazy_routes_warmup:
+            warmup = asyncio.create_task(warm_up_routes(self._routes))
+        jwks_refresh = None
+        if self.jwks is not None:
+            jwks_refresh = asyncio.create_task(self.jwks.run())
+        try:
+            yield
+        finally:
+            for task in (warmup, jwks_refresh):
+                if task is not None:
+                    task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await task
+            if self.cpu_executor is not None and self._owns_cpu_executor:
+                self.cpu_executor.shutdown(wait=False)
+            if self.tracer is not None:
+                self.tracer.shutdown()
+            if self.response_cache is not None:
+                await self.response_cache.close()
+
     def create_app(self) -> Starlette:
         """Create and configure the Starlette application"""
         try:
@@ -230,21 +410,172 @@ class ZestAPI:
             # Load plugins
             self._load_plugins()
 
+            # Compile rate limit policies: per-route limits wrap each route's
+            # app, the global limit runs as middleware. Both share one store.
+            rate_limit_store = create_store(
+                self.settings.rate_limit_storage,
+                max_keys=self.settings.rate_limit_max_keys,
+            )
+            rate_limit_options: Dict[str, Any] = {
+                "algorithm": self.settings.rate_limit_algorithm,
+                "key": self.settings.rate_limit_key,
+                "api_key_header": self.settings.rate_limit_api_key_header,
+            }
+            if self.settings.metrics:
+                self.metrics = MetricsRegistry(
+                    self.settings.metrics_dir,
+                    capacity=self.settings.metrics_capacity,
+                )
+            # Run route handlers in spans
+            self.tracer = self._create_tracer()
+            if self.tracer is not None:
+                traced = trace_routes(self._routes, self.tracer)
+                logger.info(f"Tracing enabled for {traced} routes")
+
+            limited_routes = apply_route_rate_limits(
+                self._routes,
+                self._route_rate_limits,
+                rate_limit_store,
+                metrics=self.metrics,
+                **rate_limit_options,
+            )
+            if limited_routes:
+                logger.info(f"Rate limits applied to {limited_routes} routes")
+
+            # Mark the handler phase inside route-level wrappers
+            timing_hooks = self._timing_hooks_for_app()
+            if timing_hooks is not None:
+                timed = time_routes(self._routes)
+                logger.info(f"Phase timing enabled for {timed} routes")
+
+            # Record per-route request counts, latency and in-flight requests
+            # around everything route level, including rate limits
+            if self.metrics is not None:
+                instrumented = instrument_routes(self._routes, self.metrics)
+                self._routes.append(
+                    Route(
+                        self.settings.metrics_path,
+                        metrics_endpoint(self.metrics),
+                        name="metrics",
+                    )
+                )
+                logger.info(
+                    f"Metrics enabled for {instrumented} routes at "
+                    f"{self.settings.metrics_path}"
+                )
+
+            if self.settings.profiler_token:
+                self._routes.append(
+                    Route(
+                        self.settings.profiler_path,
+                        profiler_endpoint(
+                            self.settings.profiler_token,
+                            max_seconds=self.settings.profiler_max_seconds,
+                            interval=self.settings.profiler_interval,
+                        ),
+                        name="profiler",
+                    )
+                )
+                logger.info(f"Profiler enabled at {self.settings.profiler_path}")
+
+            # Pool for CPU-bound calls made with run_cpu_bound(). It is shared
+            # by the process, so an executor installed by another application
+            # is only replaced when these settings configure one.
+            configured = any(
+                name.startswith("cpu_executor_")
+                for name in self.settings.model_fields_set
+            )
+            if configured or not cpu_executor_installed():
+                self.cpu_executor = CPUExecutor(
+                    max_workers=self.settings.cpu_executor_workers or None,
+                    max_queue=self.settings.cpu_executor_max_queue,
+                    kind=self.settings.cpu_executor_kind,
+                    queue_timeout=self.settings.cpu_executor_queue_timeout,
+                    metrics=self.metrics,
+                )
+                set_cpu_executor(self.cpu_executor)
+                self._owns_cpu_executor = True
+            else:
+                self.cpu_executor = get_cpu_executor()
+                if self.metrics is not None:
+                    self.cpu_executor.instrument(self.metrics)
+                logger.info("Using the CPU executor installed by another application")
+
+            # Shared by @cached routes
+            self.response_cache = create_response_cache(
+                self.settings.response_cache_storage,
+                max_bytes=self.settings.response_cache_bytes,
+            )
+            set_response_cache(self.response_cache)
+
             # Create Starlette app
             self._app = Starlette(
                 routes=self._routes,
                 debug=self.settings.debug,
+                lifespan=self._lifespan,
             )
+            if self.settings.compiled_router:
+                self._app.router = RadixRouter(self._routes, lifespan=self._lifespan)
+                logger.info(
+                    f"Compiled router enabled ({self._app.router.fallback_routes} "
+                    f"routes matched linearly)"
+                )
+
+            if timing_hooks is not None:
+                self._app.add_middleware(PhaseMiddleware, phase="routing")
+
+            # Add rate limiting middleware. It runs after authentication so
+            # clients can be identified by their JWT subject.
+            if self.settings.rate_limit:
+                self._app.add_middleware(
+                    RateLimitMiddleware,
+                    rate_limit=self.settings.rate_limit,
+                    store=rate_limit_store,
+                    policies=self.settings.rate_limit_policies,
+                    rejections=(
+                        rate_limit_rejections(self.metrics) if self.metrics else None
+                    ),
+                    **rate_limit_options,
+                )
+                if self.tracer is not None:
+                    self._app.add_middleware(
+                        SpanMiddleware, tracer=self.tracer, name="rate_limit"
+                    )
+                if timing_hooks is not None:
+                    self._app.add_middleware(PhaseMiddleware, phase="rate_limit")
+                logger.info("Rate limiting middleware enabled")
 
-            # Add authentication middleware if JWT secret is configured
-            if (
+            # Add authentication middleware if a JWT secret or key set is
+            # configured
+            if self.settings.jwt_jwks:
+                self.jwks = JWKSKeySet(
+                    self.settings.jwt_jwks,
+                    refresh_interval=self.settings.jwt_jwks_refresh_interval,
+                )
+                try:
+                    self.jwks.load()
+                except Exception as e:
+                    # Keep starting; the background refresh retries
+                    logger.error(f"Failed to load JWKS {self.settings.jwt_jwks}: {e}")
+            if self.jwks is not None or (
                 self.settings.jwt_secret
                 and self.settings.jwt_secret != "your-secret-key"
             ):
+                self.auth_backend = create_auth_backend(
+                    self.settings.jwt_algorithm,
+                    key_set=self.jwks,
+                    cache_size=self.settings.jwt_cache_size,
+                )
                 self._app.add_middleware(
                     AuthenticationMiddleware,
-                    backend=JWTAuthBackend(),
+                    backend=self.auth_backend,
                 )
+                if self.tracer is not None:
+                    self._app.add_middleware(
+                        SpanMiddleware, tracer=self.tracer, name="authentication"
+                    )
+                if timing_hooks is not None:
+                    self._app.add_middleware(PhaseMiddleware, phase="auth")
                 logger.info("JWT authentication middleware enabled")
             else:
                 logger.warning(
@@ -261,18 +592,45 @@ class ZestAPI:
                     allow_methods=self.settings.cors_allow_methods,
                     allow_headers=self.settings.cors_allow_headers,
                 )
+                if self.tracer is not None:
+                    self._app.add_middleware(
+                        SpanMiddleware, tracer=self.tracer, name="cors"
+                    )
                 logger.info("CORS middleware enabled")
 
-            # Add rate limiting middleware
-            if self.settings.rate_limit:
-                self._app.add_middleware(RateLimitMiddleware)
-                logger.info("Rate limiting middleware enabled")
-
-            # Add error handling middleware
-            self._app.add_middleware(ErrorHandlingMiddleware)
+            # Inside compression, so compressed responses reuse the ETag and
+            # 304s are never compressed
+            if self.settings.etags:
+                self._app.add_middleware(ConditionalMiddleware)
+                logger.info("ETag middleware enabled")
 
-            # Add request logging middleware
-            self._app.add_middleware(RequestLoggingMiddleware)
+            if self.settings.compression:
+                self._app.add_middleware(
+                    CompressionMiddleware,
+                    minimum_size=self.settings.compression_minimum_size,
+                    levels=self.settings.compression_levels,
+                    encodings=self.settings.compression_encodings,
+                    cache_bytes=self.settings.compression_cache_bytes,
+                    metrics=self.metrics,
+                )
+                logger.info("Compression middleware enabled")
+
+            # Start the request timer inside the request ID and error handling
+            # middleware, so failed requests are timed too
+            if timing_hooks is not None:
+                self._app.add_middleware(TimingMiddleware, hooks=timing_hooks)
+
+            # Add request ID, timing, error handling and access log middleware
+            self._app.add_middleware(
+                CoreMiddleware,
+                sample_rate=self.settings.access_log_sample_rate,
+                slow_threshold=self.settings.access_log_slow_threshold,
+                tracer=self.tracer,
+                request_ids=create_request_id_generator(
+                    self.settings.request_id_mode,
+                    trust_header=self.settings.request_id_trust_header,
+                ),
+            )
 
             # Add custom exception handlers
             for exc_class, handler in self._error_handlers.items():
@@ -285,6 +643,33 @@ class ZestAPI:
             logger.error(f"Failed to create application: {e}")
             raise RuntimeError(f"Application creation failed: {e}")
 
+    def _create_tracer(self) -> Optional[Tracer]:
+        """The tracer for the app, or ``None`` when tracing is disabled"""
+        exporter = self.span_exporter
+        if exporter is None:
+            if not self.settings.tracing:
+                return None
+            if self.settings.tracing_file:
+                exporter = FileSpanExporter(
+                    self.settings.tracing_file,
+                    service_name=self.settings.tracing_service_name,
+                )
+            else:
+                exporter = InMemorySpanExporter()
+            self.span_exporter = exporter
+        return Tracer(exporter, sample_rate=self.settings.tracing_sample_rate)
+
+    def _timing_hooks_for_app(self) -> Optional[List[TimingHook]]:
+        """Hooks for phase timing, or ``None`` when it is disabled"""
+        if not (self.settings.profiling or self._timing_hooks):
+            return None
+        hooks: List[TimingHook] = []
+        if self.settings.profiling_log_threshold is not None:
+            hooks.append(LogTimingHook(self.settings.profiling_log_threshold))
+        if self.metrics is not None:
+            hooks.append(MetricsTimingHook(self.metrics))
+        return hooks + self._timing_hooks
+
     @property
     def app(self) -> Starlette:
         """Get the Starlette application instance"""
@@ -0,0 +1,548 @@
+"""
+Server-side response cache
+
+``@cached`` stores the rendered body, status and headers of a route's
+``200`` responses and replays them until ``ttl`` seconds have passed::
+
+    @route("/products")
+    @cached(ttl=30, tags=["products"], vary=["accept"])
+    async def list_products(request):
+        ...
+
+    # in a write endpoint
+    await invalidate_cache("products")
+
+- Concurrent misses for the same key are coalesced: one request runs the
+  handler and the others wait for its result.
+- With ``stale_while_revalidate``, an expired response is still served for
+  that many seconds while one request refreshes it in the background.
+- Entries are tagged, and ``invalidate_cache(*tags)`` drops every entry with
+  one of the tags.
+
+Responses are kept in the shared cache set with ``set_response_cache``: an
+in-process ``MemoryResponseCache`` bounded by the total size of its entries
+by default, or a ``RedisResponseCache`` shared by all workers.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from urllib.parse import parse_qs, urlparse
+
+import orjson
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from .conditional import etag_matches, not_modified_headers, request_if_none_match
+from .ratelimit_stores import RedisConnection, RedisError
+
+logger = logging.getLogger(__name__)
+
+Headers = List[Tuple[bytes, bytes]]
+KeyFunction = Callable[[Request], str]
+TagsSpec = Union[Iterable[str], Callable[[Request], Iterable[str]]]
+
+# Rough per-entry bookkeeping cost counted against max_bytes
+_ENTRY_OVERHEAD = 200
+
+
+class CachedResponse:
+    """A stored response, fresh until ``expires`` and usable while
+    revalidating until ``stale_until`` (both Unix times)"""
+
+    __slots__ = ("status", "headers", "body", "expires", "stale_until", "tags")
+
+    def __init__(
+        self,
+        status: int,
+        headers: Headers,
+        body: bytes,
+        expires: float,
+        stale_until: float,
+        tags: Tuple[str, ...] = (),
+    ) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        self.stale_until = stale_until
+        self.tags = tags
+
+    @property
+    def size(self) -> int:
+        return (
+            len(self.body)
+            + sum(len(name) + len(value) for name, value in self.headers)
+            + _ENTRY_OVERHEAD
+        )
+
+    def response(self, state: str = "HIT") -> Response:
+        """A response replaying the stored one, with an ``X-Cache`` header"""
+        return _ReplayResponse(self, state)
+
+    def dumps(self) -> bytes:
+        meta = orjson.dumps(
+            {
+                "status": self.status,
+                "headers": [
+                    [name.decode("latin-1"), value.decode("latin-1")]
+                    for name, value in self.headers
+                ],
+                "expires": self.expires,
+                "stale_until": self.stale_until,
+                "tags": self.tags,
+            }
+        )
+        # orjson escapes newlines, so the first one ends the metadata
+        return meta + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CachedResponse":
+        meta, _, body = data.partition(b"\n")
+        fields = orjson.loads(meta)
+        return cls(
+            fields["status"],
+            [
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in fields["headers"]
+            ],
+            body,
+            fields["expires"],
+            fields["stale_until"],
+            tuple(fields["tags"]),
+        )
+
+
+class _ReplayResponse(Response):
+    """Response sending a ``CachedResponse``, answering a matching
+    ``If-None-Match`` with 304"""
+
+    def __init__(self, entry: CachedResponse, state: str) -> None:
+        self.status_code = entry.status
+        self.body = entry.body
+        self.background = None
+        self.raw_headers = [*entry.headers, (b"x-cache", state.encode("latin-1"))]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if_none_match = request_if_none_match(scope)
+        if if_none_match is not None:
+            for name, value in self.raw_headers:
+                if name == b"etag" and etag_matches(
+                    if_none_match, value.decode("latin-1")
+                ):
+                    await send(
+                        {
+                            "type": "http.response.start",
+                            "status": 304,
+                            "headers": not_modified_headers(self.raw_headers),
+                        }
+                    )
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+        await super().__call__(scope, receive, send)
+
+
+class ResponseCache:
+    """
+    Base class of response cache backends
+
+    ``generation`` counts invalidations, so responses computed while an
+    invalidation ran are not stored.
+    """
+
+    generation = 0
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        raise NotImplementedError
+
+    async def invalidate(self, *tags: str) -> int:
+        """Drop the entries with any of ``tags``, returning how many were
+        dropped"""
+        self.generation += 1
+        return await self._invalidate(tags)
+
+    async def _invalidate(self, tags: Tuple[str, ...]) -> int:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU cache holding at most ``max_bytes`` of responses"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        # tag -> keys of the entries with it
+        self._tags: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.stale_until <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        size = entry.size
+        if size > self.max_bytes // 4:
+            # Leave room for several entries rather than one huge response
+            return
+        self._remove(key)
+        self._entries[key] = entry
+        self.size += size
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    async def _invalidate(self, tags: Tuple[str, ...]) -> int:
+        count = 0
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                count += 1
+        return count
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+        self.size = 0
+
+
+# Scripts of the Redis cache.
+# set: KEYS = entry key, tag set keys; ARGV = payload, lifetime in ms. Tag
+#   sets live as long as their longest-lived entry.
+# invalidate: KEYS = tag set keys; deletes their entries and the sets.
+CACHE_SCRIPTS: Dict[str, str] = {
+    "set": """
+redis.call("SET", KEYS[1], ARGV[1], "PX", ARGV[2])
+for i = 2, #KEYS do
+  redis.call("SADD", KEYS[i], KEYS[1])
+  if redis.call("PTTL", KEYS[i]) < tonumber(ARGV[2]) then
+    redis.call("PEXPIRE", KEYS[i], ARGV[2])
+  end
+end
+return 1
+""",
+    "invalidate": """
+local count = 0
+for i = 1, #KEYS do
+  for _, key in ipairs(redis.call("SMEMBERS", KEYS[i])) do
+    count = count + redis.call("DEL", key)
+  end
+  redis.call("DEL", KEYS[i])
+end
+return count
+""",
+}
+
+
+class RedisResponseCache(ResponseCache):
+    """
+    Cache shared by all workers through a Redis-protocol server
+
+    Entries expire on the server when they become too stale to serve. The
+    cache fails open: if the server is unreachable, requests are handled as
+    misses and a warning is logged.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "zestapi:cache:",
+        timeout: float = 1.0,
+    ) -> None:
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Invalid Redis URL: {url}")
+
+        self.url = url
+        self.prefix = prefix
+        self.timeout = timeout
+        self._connection = RedisConnection(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+        )
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._available = True
+
+    async def _execute(self, *args: Any) -> Any:
+        if not self._connection.connected:
+            if self._connect_lock is None:
+                self._connect_lock = asyncio.Lock()
+            async with self._connect_lock:
+                if not self._connection.connected:
+                    await self._connection.connect()
+        reply = await asyncio.wait_for(self._connection.execute(*args), self.timeout)
+        self._available = True
+        return reply
+
+    def _mark_unavailable(self, exc: Exception) -> None:
+        if self._available:
+            logger.warning(f"Response cache {self.url} unavailable: {exc}")
+        self._available = False
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            data = await self._execute("GET", self.prefix + key)
+        except (OSError, asyncio.TimeoutError, RedisError) as exc:
+            self._mark_unavailable(exc)
+            return None
+        if data is None:
+            return None
+        try:
+            return CachedResponse.loads(data)
+        except (ValueError, KeyError, TypeError) as exc:
+            # Written by another version or corrupted: handle as a miss, the
+            # next response replaces it
+            logger.warning(f"Ignoring malformed response cache entry {key}: {exc}")
+            return None
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        lifetime = max(1, int((entry.stale_until - time.time()) * 1000))
+        keys = [self.prefix + key] + [f"{self.prefix}tag:{tag}" for tag in entry.tags]
+        try:
+            await self._execute(
+                "EVAL", CACHE_SCRIPTS["set"], len(keys), *keys, entry.dumps(), lifetime
+            )
+        except (OSError, asyncio.TimeoutError, RedisError) as exc:
+            self._mark_unavailable(exc)
+
+    async def _invalidate(self, tags: Tuple[str, ...]) -> int:
+        if not tags:
+            return 0
+        keys = [f"{self.prefix}tag:{tag}" for tag in tags]
+        try:
+            count: int = await self._execute(
+                "EVAL", CACHE_SCRIPTS["invalidate"], len(keys), *keys
+            )
+        except (OSError, asyncio.TimeoutError, RedisError) as exc:
+            self._mark_unavailable(exc)
+            return 0
+        return count
+
+    async def clear(self) -> None:
+        cursor = b"0"
+        while True:
+            cursor, keys = await self._execute(
+                "SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 1000
+            )
+            if keys:
+                await self._execute("DEL", *keys)
+            if cursor == b"0":
+                break
+
+    async def close(self) -> None:
+        await self._connection.close()
+
+
+def create_response_cache(
+    url: str = "memory://", max_bytes: int = 64 * 1024 * 1024
+) -> ResponseCache:
+    """
+    Create a response cache from a URL
+
+    - ``memory://`` -- per-process LRU holding up to ``max_bytes`` (default)
+    - ``redis://[:password@]host[:port][/db][?prefix=zestapi:cache:]``
+    """
+    parsed = urlparse(url or "memory://")
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+    if parsed.scheme == "memory":
+        return MemoryResponseCache(max_bytes=max_bytes)
+    if parsed.scheme == "redis":
+        return RedisResponseCache(
+            parsed._replace(query="").geturl(),
+            prefix=options.get("prefix", "zestapi:cache:"),
+        )
+    raise ValueError(f"Unsupported response cache storage: {url}")
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """The shared cache used by ``@cached`` routes"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = MemoryResponseCache()
+    return _default_cache
+
+
+def set_response_cache(cache: Optional[ResponseCache]) -> None:
+    """Replace the shared cache"""
+    global _default_cache
+    _default_cache = cache
+
+
+async def invalidate_cache(*tags: str) -> int:
+    """Drop the shared cache's entries with any of ``tags``"""
+    return await get_response_cache().invalidate(*tags)
+
+
+def default_cache_key(request: Request) -> str:
+    """Method, path and query string of the request"""
+    query = request.scope.get("query_string", b"").decode("latin-1")
+    return f"{request.method} {request.url.path}?{query}"
+
+
+def cached(
+    ttl: float,
+    key: Optional[KeyFunction] = None,
+    tags: TagsSpec = (),
+    vary: Iterable[str] = (),
+    stale_while_revalidate: float = 0.0,
+    cache: Optional[ResponseCache] = None,
+) -> Callable[[Any], Any]:
+    """
+    Cache a route's ``200`` responses to ``GET`` and ``HEAD`` requests
+
+    ``key`` maps a request to its cache key (method, path and query string
+    by default), extended with the values of the ``vary`` request headers.
+    Keys are scoped to the endpoint. Include anything the response depends
+    on, such as the user for personalised responses. ``tags`` is a list of
+    tags or a function of the request returning them. Streaming responses
+    and responses setting cookies are never stored.
+    """
+    vary_headers = [name.lower() for name in vary]
+
+    def decorator(func: Callable[[Request], Awaitable[Response]]) -> Any:
+        prefix = f"{func.__module__}.{func.__qualname__}:"
+        # key -> task computing the response for it in this process
+        inflight: Dict[str, "asyncio.Task[Tuple[Response, Optional[CachedResponse]]]"]
+        inflight = {}
+
+        async def fill(
+            request: Request, cache_key: str, store: ResponseCache
+        ) -> Tuple[Response, Optional[CachedResponse]]:
+            generation = store.generation
+            response = await func(request)
+            entry = _entry_for(response, request, ttl, stale_while_revalidate, tags)
+            if entry is not None and store.generation == generation:
+                await store.set(cache_key, entry)
+            return response, entry
+
+        def start_fill(
+            request: Request, cache_key: str, store: ResponseCache
+        ) -> "asyncio.Task[Tuple[Response, Optional[CachedResponse]]]":
+            task = inflight.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(fill(request, cache_key, store))
+                inflight[cache_key] = task
+                task.add_done_callback(lambda _: inflight.pop(cache_key, None))
+            return task
+
+        @functools.wraps(func)
+        async def wrapper(request: Request) -> Response:
+            if request.method not in ("GET", "HEAD"):
+                return await func(request)
+
+            store = cache if cache is not None else get_response_cache()
+            cache_key = prefix + (key or default_cache_key)(request)
+            for name in vary_headers:
+                cache_key += f"|{request.headers.get(name, '')}"
+
+            entry = await store.get(cache_key)
+            if entry is not None:
+                now = time.time()
+                if now < entry.expires:
+                    return entry.response("HIT")
+                if now < entry.stale_until:
+                    task = start_fill(request, cache_key, store)
+                    task.add_done_callback(_log_revalidation_error)
+                    return entry.response("STALE")
+
+            leader = cache_key not in inflight
+            task = start_fill(request, cache_key, store)
+            response, entry = await asyncio.shield(task)
+            if leader:
+                # The original response, which may carry a background task
+                response.headers["x-cache"] = "MISS"
+                return response
+            if entry is None:
+                # Not cacheable: render our own
+                return await func(request)
+            return entry.response("MISS")
+
+        wrapper.__cached__ = {  # type: ignore[attr-defined]
+            "ttl": ttl,
+            "stale_while_revalidate": stale_while_revalidate,
+        }
+        return wrapper
+
+    return decorator
+
+
+def _entry_for(
+    response: Response,
+    request: Request,
+    ttl: float,
+    stale_while_revalidate: float,
+    tags: TagsSpec,
+) -> Optional[CachedResponse]:
+    """The cache entry for a response, if it can be cached"""
+    body = getattr(response, "body", None)
+    if response.status_code != 200 or not isinstance(body, bytes):
+        return None
+    if any(name == b"set-cookie" for name, _ in response.raw_headers):
+        return None
+    now = time.time()
+    return CachedResponse(
+        response.status_code,
+        list(response.raw_headers),
+        body,
+        now + ttl,
+        now + ttl + stale_while_revalidate,
+        tuple(tags(request) if callable(tags) else tags),
+    )
+
+
+def _log_revalidation_error(
+    task: "asyncio.Task[Tuple[Response, Optional[CachedResponse]]]",
+) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Failed to revalidate cached response: {task.exception()}")
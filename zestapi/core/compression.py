@@ -0,0 +1,439 @@
+"""
+Response compression
+
+``CompressionMiddleware`` compresses response bodies with the best encoding
+the client accepts: zstd and brotli when their optional packages are
+installed (``pip install zestapi[compression]``), and gzip. Complete bodies
+are compressed in one call; streaming responses are compressed chunk by
+chunk and flushed after each chunk so clients see data as it is produced.
+
+Compressed bodies of responses with an ``ETag`` are kept in an LRU cache
+keyed by path, query string, the request headers named in ``Vary``, ETag and
+encoding, so a payload that doesn't change is only compressed once. The ETag
+of a compressed response is made weak, since the compressed bytes differ from
+the identity representation.
+"""
+
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import Counter, MetricsRegistry
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Server preference, best first
+ENCODINGS = ("zstd", "br", "gzip")
+
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+# Bodies at least this large are compressed in the thread pool
+THREADPOOL_MIN_SIZE = 256 * 1024
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Supported encodings whose compression library is installed"""
+    installed = {"zstd": zstandard is not None, "br": brotli is not None}
+    return tuple(name for name in ENCODINGS if installed.get(name, True))
+
+
+def negotiate(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """
+    Pick an encoding for an ``Accept-Encoding`` header
+
+    Returns the encoding with the highest quality value, preferring earlier
+    ``encodings`` on ties, or ``None`` if the client accepts none of them.
+    """
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+
+    default = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, default)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    """Compress a complete body"""
+    if encoding == "gzip":
+        # No timestamp in the header, so equal bodies compress to equal bytes
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    if encoding == "br":
+        return bytes(brotli.compress(body, quality=level))
+    if encoding == "zstd":
+        return bytes(zstandard.ZstdCompressor(level=level).compress(body))
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class StreamCompressor:
+    """Compress a body chunk by chunk, flushing the output of each chunk"""
+
+    def __init__(self, encoding: str, level: int) -> None:
+        self.encoding = encoding
+        self._compressor: Any
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = self._compressor
+        if self.encoding == "gzip":
+            return bytes(
+                compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            )
+        if self.encoding == "br":
+            return bytes(compressor.process(data) + compressor.flush())
+        return bytes(
+            compressor.compress(data)
+            + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        )
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return bytes(self._compressor.finish())
+        return bytes(self._compressor.flush())
+
+
+# (path, query string, varied request header values, ETag, encoding)
+CacheKey = Tuple[str, bytes, Tuple[Optional[str], ...], str, str]
+
+
+def cache_key(
+    scope: Scope, headers: MutableHeaders, etag: str, encoding: str
+) -> Optional[CacheKey]:
+    """
+    Key of a response's compressed body, or None if it can't be cached
+
+    A handler may use one ETag (e.g. from ``version_etag``) for every
+    variant of a resource, so the key also holds everything the request can
+    select a variant with: the query string and the headers named in
+    ``Vary``.
+    """
+    vary = [
+        name.strip().lower()
+        for value in headers.getlist("vary")
+        for name in value.split(",")
+        if name.strip()
+    ]
+    if "*" in vary:
+        return None
+    request_headers = Headers(scope=scope)
+    varied = tuple(
+        request_headers.get(name)
+        for name in sorted(set(vary))
+        if name != "accept-encoding"
+    )
+    return (
+        scope.get("path", ""),
+        scope.get("query_string", b""),
+        varied,
+        etag,
+        encoding,
+    )
+
+
+class CompressedCache:
+    """LRU of compressed bodies, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: "CacheKey") -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, key: "CacheKey", body: bytes) -> None:
+        # Leave room for several entries rather than one huge body
+        if len(body) > self.max_bytes // 4:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with zstd, brotli or gzip
+
+    Responses are compressed when their content type starts with one of
+    ``content_types`` and, unless streamed, their body is at least
+    ``minimum_size`` bytes. ``levels`` overrides the compression level per
+    encoding. With ``metrics``, compression time (CPU time of the
+    compressing thread), bytes in and out, and cache hits are counted per
+    encoding.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        levels: Optional[Mapping[str, int]] = None,
+        encodings: Iterable[str] = ENCODINGS,
+        content_types: Iterable[str] = DEFAULT_CONTENT_TYPES,
+        cache_bytes: int = 16 * 1024 * 1024,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        available = available_encodings()
+        requested = tuple(encodings)
+        missing = [name for name in requested if name not in available]
+        if missing:
+            logger.info(
+                f"Compression encodings unavailable (library not installed): "
+                f"{', '.join(missing)}"
+            )
+        self.encodings = tuple(name for name in requested if name in available)
+        self.content_types = tuple(content_types)
+        self.cache = CompressedCache(cache_bytes) if cache_bytes > 0 else None
+        # Accept-Encoding header -> negotiated encoding
+        self._negotiated: Dict[bytes, Optional[str]] = {}
+        self._counters: Dict[str, Tuple[Counter, Counter, Counter, Counter]] = {}
+        if metrics is not None:
+            for encoding in self.encodings:
+                labels = {"encoding": encoding}
+                self._counters[encoding] = (
+                    metrics.counter(
+                        "zestapi_compression_seconds_total",
+                        "CPU time spent compressing responses",
+                        labels,
+                    ),
+                    metrics.counter(
+                        "zestapi_compression_input_bytes_total",
+                        "Response bytes before compression",
+                        labels,
+                    ),
+                    metrics.counter(
+                        "zestapi_compression_output_bytes_total",
+                        "Response bytes after compression",
+                        labels,
+                    ),
+                    metrics.counter(
+                        "zestapi_compression_cache_hits_total",
+                        "Responses served from the compressed body cache",
+                        labels,
+                    ),
+                )
+            metrics.sync()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = b""
+        for name, value in scope.get("headers", ()):
+            if name == b"accept-encoding":
+                accept_encoding = value
+                break
+        responder = _CompressionResponder(
+            self, scope, self._negotiate(accept_encoding), send
+        )
+        await self.app(scope, receive, responder.send)
+
+    def _negotiate(self, accept_encoding: bytes) -> Optional[str]:
+        negotiated = self._negotiated
+        if accept_encoding in negotiated:
+            return negotiated[accept_encoding]
+        encoding = negotiate(accept_encoding.decode("latin-1"), self.encodings)
+        if len(negotiated) < 256:
+            negotiated[accept_encoding] = encoding
+        return encoding
+
+    def compressible(self, content_type: str) -> bool:
+        return content_type.startswith(self.content_types)
+
+    def record(
+        self, encoding: str, seconds: float, size_in: int, size_out: int
+    ) -> None:
+        counters = self._counters.get(encoding)
+        if counters is not None:
+            counters[0].inc(seconds)
+            counters[1].inc(size_in)
+            counters[2].inc(size_out)
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        start = time.thread_time()
+        data = compress(body, encoding, self.levels[encoding])
+        self.record(encoding, time.thread_time() - start, len(body), len(data))
+        return data
+
+    async def compress_body(
+        self, key: Optional[CacheKey], body: bytes, encoding: str
+    ) -> bytes:
+        """Compress a complete body, reusing the cached result for ``key``"""
+        if key is not None and self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                counters = self._counters.get(encoding)
+                if counters is not None:
+                    counters[3].inc()
+                return cached
+
+        if len(body) >= THREADPOOL_MIN_SIZE:
+            data = await run_in_threadpool(self._compress, body, encoding)
+        else:
+            data = self._compress(body, encoding)
+        if key is not None and self.cache is not None:
+            self.cache.put(key, data)
+        return data
+
+
+class _CompressionResponder:
+    """Send wrapper compressing one response"""
+
+    def __init__(
+        self,
+        middleware: CompressionMiddleware,
+        scope: Scope,
+        encoding: Optional[str],
+        send: Send,
+    ) -> None:
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self.app_send = send
+        self.start: Optional[Message] = None
+        self.compressor: Optional[StreamCompressor] = None
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first body message shows how to respond
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            if self.start is not None:
+                await self.app_send(self.start)
+                self.start = None
+            await self.app_send(message)
+            return
+
+        if self.start is not None:
+            start, self.start = self.start, None
+            await self._begin(start, message)
+            return
+
+        compressor = self.compressor
+        if compressor is None:
+            await self.app_send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        start_time = time.thread_time()
+        data = compressor.compress(body) if body else b""
+        if not more_body:
+            data += compressor.finish()
+        self.middleware.record(
+            compressor.encoding, time.thread_time() - start_time, len(body), len(data)
+        )
+        await self.app_send(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
+
+    async def _begin(self, start: Message, message: Message) -> None:
+        middleware = self.middleware
+        headers = MutableHeaders(scope=start)
+        status = start["status"]
+        if (
+            status < 200
+            or status in (204, 206, 304)
+            or "content-encoding" in headers
+            or not middleware.compressible(headers.get("content-type", ""))
+        ):
+            await self.app_send(start)
+            await self.app_send(message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        encoding = self.encoding
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if (
+            encoding is None
+            or self.scope.get("method") == "HEAD"
+            or (not more_body and len(body) < middleware.minimum_size)
+        ):
+            await self.app_send(start)
+            await self.app_send(message)
+            return
+
+        etag = headers.get("etag")
+        headers["content-encoding"] = encoding
+        if etag is not None and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+
+        if not more_body:
+            key = None
+            if etag is not None and middleware.cache is not None:
+                key = cache_key(self.scope, headers, etag, encoding)
+            data = await middleware.compress_body(key, body, encoding)
+            headers["content-length"] = str(len(data))
+            await self.app_send(start)
+            await self.app_send({"type": "http.response.body", "body": data})
+            return
+
+        if "content-length" in headers:
+            del headers["content-length"]
+        self.compressor = StreamCompressor(encoding, middleware.levels[encoding])
+        await self.app_send(start)
+        await self.send(message)
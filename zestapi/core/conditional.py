@@ -0,0 +1,184 @@
+"""
+ETags and conditional requests
+
+``ConditionalMiddleware`` gives complete ``200`` responses to ``GET``
+requests an ETag hashed from their body (BLAKE2b, 64 bits) and answers a
+matching ``If-None-Match`` with an empty ``304 Not Modified``. Responses
+that already carry an ETag are compared as they are, including streaming
+responses; the 304 is sent as soon as the headers are, and the body the
+application goes on to send is discarded.
+
+Handlers that know a cheap version of their data can skip rendering
+altogether::
+
+    etag = version_etag(product["id"], product["updated_at"])
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    return ORJSONResponse(product, headers={"ETag": etag})
+"""
+
+import hashlib
+from typing import Any, List, Optional, Tuple, Union
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Headers describing the representation itself, left out of 304 responses
+# (RFC 9110, section 15.4.5)
+_REPRESENTATION_HEADERS = (
+    b"content-type",
+    b"content-length",
+    b"content-encoding",
+    b"content-language",
+    b"content-range",
+)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def compute_etag(body: Union[bytes, memoryview]) -> str:
+    """Strong ETag for a response body"""
+    return f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def version_etag(*parts: Any) -> str:
+    """Strong ETag for a version of some data, e.g. an ID and update time"""
+    version = "\x00".join(str(part) for part in parts).encode()
+    return f'"v{hashlib.blake2b(version, digest_size=8).hexdigest()}"'
+
+
+def _opaque(etag: str) -> str:
+    """An ETag without its weakness indicator"""
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Whether an ``If-None-Match`` header matches ``etag``
+
+    Uses weak comparison, so ``W/"x"`` (e.g. from a compressing proxy or
+    ``CompressionMiddleware``) matches ``"x"``.
+    """
+    if_none_match = if_none_match.strip()
+    if if_none_match == "*":
+        return True
+    opaque = _opaque(etag)
+    return any(
+        _opaque(candidate.strip()) == opaque for candidate in if_none_match.split(",")
+    )
+
+
+def request_if_none_match(scope: Scope) -> Optional[str]:
+    """The request's ``If-None-Match`` header, for ``GET`` and ``HEAD``"""
+    if scope.get("method") not in ("GET", "HEAD"):
+        return None
+    for name, value in scope.get("headers", ()):
+        if name == b"if-none-match":
+            header: str = value.decode("latin-1")
+            return header
+    return None
+
+
+def not_modified_headers(headers: Headers) -> Headers:
+    """Raw headers of a response, as sent with a 304 for it"""
+    return [
+        (name, value) for name, value in headers if name not in _REPRESENTATION_HEADERS
+    ]
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """An empty 304 response if the request's ``If-None-Match`` matches
+    ``etag``, otherwise ``None``"""
+    if_none_match = request_if_none_match(request.scope)
+    if if_none_match is None or not etag_matches(if_none_match, etag):
+        return None
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+class ConditionalMiddleware:
+    """Add ETags to ``GET`` responses and answer ``If-None-Match`` with 304"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get("method") not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        responder = _ConditionalResponder(scope, request_if_none_match(scope), send)
+        await self.app(scope, receive, responder.send)
+
+
+class _ConditionalResponder:
+    """Send wrapper adding an ETag to one response"""
+
+    def __init__(self, scope: Scope, if_none_match: Optional[str], send: Send):
+        self.hash_body = scope.get("method") == "GET"
+        self.if_none_match = if_none_match
+        self.app_send = send
+        self.start: Optional[Message] = None
+        # Set once a 304 has been sent; later body messages are discarded
+        self.done = False
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            await self._start(message)
+            return
+        if self.done:
+            return
+        if self.start is None:
+            await self.app_send(message)
+            return
+
+        start, self.start = self.start, None
+        if message_type != "http.response.body" or message.get("more_body", False):
+            # Streaming: the body can't be hashed without buffering it all
+            await self.app_send(start)
+            await self.app_send(message)
+            return
+
+        etag = compute_etag(message.get("body", b""))
+        start["headers"] = [*start.get("headers", ()), (b"etag", etag.encode())]
+        if self.if_none_match is not None and etag_matches(self.if_none_match, etag):
+            await self._send_not_modified(start)
+            return
+        await self.app_send(start)
+        await self.app_send(message)
+
+    async def _start(self, message: Message) -> None:
+        if message["status"] != 200:
+            await self.app_send(message)
+            return
+
+        etag = None
+        for name, value in message.get("headers", ()):
+            if name == b"etag":
+                etag = value.decode("latin-1")
+                break
+        if etag is None:
+            if self.hash_body:
+                # Held back until the body has been hashed
+                self.start = message
+            else:
+                await self.app_send(message)
+            return
+
+        if self.if_none_match is not None and etag_matches(self.if_none_match, etag):
+            await self._send_not_modified(message)
+            return
+        await self.app_send(message)
+
+    async def _send_not_modified(self, start: Message) -> None:
+        await self.app_send(
+            {
+                "type": "http.response.start",
+                "status": 304,
+                "headers": not_modified_headers(start.get("headers", [])),
+            }
+        )
+        await self.app_send({"type": "http.response.body", "body": b""})
+        self.done = True
@@ -0,0 +1,215 @@
+"""
+Bounded executor for CPU-bound work
+
+Password hashing, image encoding and similar work blocks the event loop for
+every other request on the worker when called from a handler. ``CPUExecutor``
+runs it in a fixed-size thread or process pool instead, limits how many calls
+may wait for a worker and keeps queue-depth and timing counters, optionally
+exported as metrics.
+
+Threads suit work that releases the GIL (``bcrypt``, ``hashlib``, Pillow,
+zlib); processes suit pure-Python work, at the cost of pickling arguments
+and results.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from starlette.exceptions import HTTPException
+
+from .metrics import Gauge, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EXECUTOR_KINDS = ("thread", "process")
+
+
+class ExecutorBusy(HTTPException):
+    """Raised when the executor queue is full; served as 503 Service
+    Unavailable with a ``Retry-After`` header"""
+
+    def __init__(self, retry_after: int = 1) -> None:
+        super().__init__(
+            status_code=503,
+            detail="Server busy, please retry",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class CPUExecutor:
+    """
+    Sized pool for CPU-bound calls with backpressure
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    wait for a worker. Calls beyond that raise ``ExecutorBusy`` straight
+    away, or after waiting ``queue_timeout`` seconds for a slot, rather than
+    letting the backlog (and request latency) grow without bound.
+    ``max_queue=None`` never rejects. With ``metrics``, the numbers of
+    running and queued calls are exported as gauges.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        kind: str = "thread",
+        queue_timeout: float = 0.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(
+                f"Unknown executor kind: {kind} (expected one of {EXECUTOR_KINDS})"
+            )
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Calls submitted to the pool, running or waiting for a worker
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.run_time = 0.0
+        self._running_gauge: Optional[Gauge] = None
+        self._queued_gauge: Optional[Gauge] = None
+        if metrics is not None:
+            self.instrument(metrics)
+
+    def instrument(self, metrics: MetricsRegistry) -> None:
+        """Export the numbers of running and queued calls to ``metrics``,
+        instead of any registry given before"""
+        self._running_gauge = metrics.gauge(
+            "zestapi_cpu_executor_running_tasks",
+            "CPU-bound calls running in the executor",
+        )
+        self._queued_gauge = metrics.gauge(
+            "zestapi_cpu_executor_queued_tasks",
+            "CPU-bound calls waiting for an executor worker",
+        )
+        metrics.sync()
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        if self._running_gauge is not None and self._queued_gauge is not None:
+            self._running_gauge.set(min(self.in_flight, self.max_workers))
+            self._queued_gauge.set(max(0, self.in_flight - self.max_workers))
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="zestapi-cpu"
+                )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run ``func(*args, **kwargs)`` in the pool and return its result"""
+        await self._acquire()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            call = functools.partial(func, *args, **kwargs) if kwargs else func
+            loop = asyncio.get_running_loop()
+            result: T = await loop.run_in_executor(
+                self.executor, call, *(() if kwargs else args)
+            )
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            self.run_time += time.perf_counter() - start
+            self.in_flight -= 1
+            self._update_gauges()
+            if self._slots is not None:
+                self._slots.release()
+
+    async def _acquire(self) -> None:
+        if self.max_queue is None:
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        if self.queue_timeout > 0:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+                return
+            except asyncio.TimeoutError:
+                pass
+        self.rejected += 1
+        logger.warning(
+            f"CPU executor full ({self.in_flight} calls in flight), rejecting call"
+        )
+        raise ExecutorBusy()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and counters"""
+        return {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "active": min(self.in_flight, self.max_workers),
+            "queued": max(0, self.in_flight - self.max_workers),
+            "max_queue": self.max_queue,
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "run_time": self.run_time,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+_default_executor: Optional[CPUExecutor] = None
+# Whether _default_executor was installed, rather than created on first use
+_installed = False
+
+
+def get_cpu_executor() -> CPUExecutor:
+    """The shared executor used by ``run_cpu_bound``"""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = CPUExecutor()
+    return _default_executor
+
+
+def set_cpu_executor(executor: Optional[CPUExecutor]) -> None:
+    """Replace the shared executor, shutting down the previous one"""
+    global _default_executor, _installed
+    if _default_executor is not None and _default_executor is not executor:
+        _default_executor.shutdown(wait=False)
+    _default_executor = executor
+    _installed = executor is not None
+
+
+def cpu_executor_installed() -> bool:
+    """Whether a shared executor was installed with ``set_cpu_executor``"""
+    return _installed
+
+
+async def run_cpu_bound(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a CPU-bound call on the shared executor without blocking the
+    event loop"""
+    return await get_cpu_executor().run(func, *args, **kwargs)
@@ -0,0 +1,139 @@
+"""
+HS256/HS384/HS512 JSON Web Tokens without python-jose
+
+Signs and verifies tokens with ``hmac`` using a keyed HMAC object prepared
+once per secret, parses claims with ``orjson`` and checks the registered
+time claims with integer math. Validation follows python-jose's defaults
+(no audience, issuer or subject expected) and raises the same exception
+types, so callers can use either implementation.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+from calendar import timegm
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
+
+HMAC_ALGORITHMS: Dict[str, Callable[..., Any]] = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+
+def base64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def base64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class HMACKey:
+    """A secret prepared for signing with one HMAC algorithm"""
+
+    __slots__ = ("algorithm", "header", "_mac")
+
+    def __init__(self, secret: str, algorithm: str = "HS256") -> None:
+        try:
+            digestmod = HMAC_ALGORITHMS[algorithm]
+        except KeyError:
+            raise ValueError(f"Unsupported HMAC algorithm: {algorithm}")
+        self.algorithm = algorithm
+        # Header used for new tokens, in python-jose's sorted compact form
+        self.header = base64url_encode(
+            orjson.dumps({"alg": algorithm, "typ": "JWT"}, option=orjson.OPT_SORT_KEYS)
+        )
+        # The key schedule is computed once; each signature copies it
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=digestmod)
+
+    def sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+
+@lru_cache(maxsize=16)
+def get_key(secret: str, algorithm: str) -> HMACKey:
+    """Prepared key for a secret, shared until the secret changes"""
+    return HMACKey(secret, algorithm)
+
+
+def _int_claim(claims: Dict[str, Any], name: str, label: str) -> Optional[int]:
+    if name not in claims:
+        return None
+    value = claims[name]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise JWTClaimsError(f"{label} claim ({name}) must be an integer.")
+    return int(value)
+
+
+def parse_token(token: str) -> Tuple[bytes, Dict[str, Any], Any, bytes]:
+    """Split a compact JWS into signing input, header, claims and signature"""
+    try:
+        signing_input, signature = token.rsplit(".", 1)
+        header_segment, claims_segment = signing_input.split(".")
+        header = orjson.loads(base64url_decode(header_segment))
+        claims = orjson.loads(base64url_decode(claims_segment))
+        signature_bytes = base64url_decode(signature)
+    except (ValueError, TypeError):
+        # binascii.Error and orjson.JSONDecodeError are ValueErrors
+        raise JWTError("Error decoding token")
+    if not isinstance(header, dict):
+        raise JWTError("Invalid header string: must be a json object")
+    return signing_input.encode("ascii", "replace"), header, claims, signature_bytes
+
+
+def validate_claims(claims: Any, now: Optional[int] = None) -> Dict[str, Any]:
+    """Check the registered claims of a verified token"""
+    if not isinstance(claims, dict):
+        raise JWTError("Invalid payload string: must be a json object")
+
+    if now is None:
+        now = int(time.time())
+    _int_claim(claims, "iat", "Issued At")
+    nbf = _int_claim(claims, "nbf", "Not Before")
+    if nbf is not None and nbf > now:
+        raise JWTClaimsError("The token is not yet valid (nbf)")
+    exp = _int_claim(claims, "exp", "Expiration Time")
+    if exp is not None and exp < now:
+        raise ExpiredSignatureError("Signature has expired.")
+    if "aud" in claims:
+        # No audience is configured, so tokens restricted to one are refused
+        raise JWTClaimsError("Invalid audience")
+    if "sub" in claims and not isinstance(claims["sub"], str):
+        raise JWTClaimsError("Subject must be a string.")
+    if "jti" in claims and not isinstance(claims["jti"], str):
+        raise JWTClaimsError("JWT ID must be a string.")
+    if "at_hash" in claims:
+        raise JWTClaimsError(
+            "No access_token provided to compare against at_hash claim."
+        )
+    return claims
+
+
+def decode(token: str, key: HMACKey, now: Optional[int] = None) -> Dict[str, Any]:
+    """Verify a token and return its claims"""
+    signing_input, header, claims, signature = parse_token(token)
+    if header.get("alg") != key.algorithm:
+        raise JWTError("The specified alg value is not allowed")
+    if not hmac.compare_digest(key.sign(signing_input), signature):
+        raise JWTError("Signature verification failed.")
+    return validate_claims(claims, now)
+
+
+def encode(claims: Dict[str, Any], key: HMACKey) -> str:
+    """Sign claims, converting datetime time claims to NumericDate"""
+    for name in ("exp", "iat", "nbf"):
+        value = claims.get(name)
+        if isinstance(value, datetime):
+            claims = {**claims, name: timegm(value.utctimetuple())}
+    signing_input = key.header + b"." + base64url_encode(orjson.dumps(claims))
+    signature = base64url_encode(key.sign(signing_input))
+    return (signing_input + b"." + signature).decode("ascii")
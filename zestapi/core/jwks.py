@@ -0,0 +1,199 @@
+"""
+JSON Web Key Sets for verifying RS*/ES*/PS* signed tokens
+
+A ``JWKSKeySet`` loads a key set from a local file or an HTTP(S) URL and
+keeps the parsed public keys in memory, indexed by ``kid``. Keys are parsed
+once when the set is loaded and reused for every request; a refresh only
+parses keys that changed. Refreshes run in the background: requests keep
+using the current keys while a new set is fetched, and a failed fetch keeps
+the stale keys until the next attempt succeeds.
+"""
+
+import asyncio
+import logging
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from jose import jwk
+
+logger = logging.getLogger(__name__)
+
+# Algorithms accepted from a key set. Symmetric (oct) keys are never trusted
+# from a JWKS, so an HMAC token cannot be forged with a public key.
+ASYMMETRIC_ALGORITHMS = {
+    "RS256",
+    "RS384",
+    "RS512",
+    "PS256",
+    "PS384",
+    "PS512",
+    "ES256",
+    "ES384",
+    "ES512",
+}
+
+# Algorithm for keys that don't name one
+_DEFAULT_ALGORITHMS: Dict[Tuple[Any, Any], str] = {
+    ("RSA", None): "RS256",
+    ("EC", "P-256"): "ES256",
+    ("EC", "P-384"): "ES384",
+    ("EC", "P-521"): "ES512",
+}
+
+
+class JWKSKey:
+    """A parsed public key and the algorithm it verifies"""
+
+    __slots__ = ("kid", "algorithm", "_key")
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.kid: Optional[str] = data.get("kid")
+        algorithm = data.get("alg") or _DEFAULT_ALGORITHMS.get(
+            (data.get("kty"), data.get("crv"))
+        )
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported JWK algorithm: {algorithm}")
+        self.algorithm: str = algorithm
+        self._key = jwk.construct(data, algorithm)
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        return bool(self._key.verify(signing_input, signature))
+
+
+def fetch_jwks(source: str, timeout: float = 5.0) -> bytes:
+    """Read a key set from a file path, ``file://`` URL or ``http(s)://`` URL"""
+    if source.startswith(("http://", "https://", "file://")):
+        request = urllib.request.Request(source, headers={"Accept": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body: bytes = response.read()
+            return body
+    with open(source, "rb") as f:
+        return f.read()
+
+
+class JWKSKeySet:
+    """
+    In-memory cache of a JSON Web Key Set, indexed by ``kid``
+
+    ``load()`` fetches the set synchronously (at startup); ``run()`` keeps
+    it fresh every ``refresh_interval`` seconds. A token naming an unknown
+    ``kid`` schedules an early refresh, at most once every
+    ``min_refresh_interval`` seconds, so keys rotated in by the issuer are
+    picked up without waiting for the next scheduled refresh.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        refresh_interval: float = 300.0,
+        min_refresh_interval: float = 30.0,
+        timeout: float = 5.0,
+    ) -> None:
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        # Incremented whenever the keys change, so cached verifications made
+        # with a removed key can be dropped
+        self.version = 0
+        self.loaded_at = 0.0
+        self._keys: Dict[str, JWKSKey] = {}
+        # Raw JWK (canonical JSON) -> parsed key, reused across refreshes
+        self._parsed: Dict[bytes, JWKSKey] = {}
+        self._last_attempt = 0.0
+        self._refresh_task: Optional["asyncio.Task[bool]"] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def kids(self) -> List[str]:
+        return list(self._keys)
+
+    def get(self, kid: Optional[str]) -> Optional[JWKSKey]:
+        """Key for a token's ``kid``, scheduling a refresh if it is unknown"""
+        keys = self._keys
+        if kid is None:
+            # Tokens without a kid are only accepted from single-key sets
+            if len(keys) == 1:
+                return next(iter(keys.values()))
+            return None
+        key = keys.get(kid)
+        if key is None:
+            self._refresh_for(kid)
+        return key
+
+    def load(self) -> None:
+        """Fetch and parse the key set, replacing the current keys"""
+        self._last_attempt = time.monotonic()
+        self._swap(self._parse(fetch_jwks(self.source, self.timeout)))
+
+    async def refresh(self) -> bool:
+        """Reload the key set in a worker thread, keeping the current keys
+        if the fetch fails"""
+        loop = asyncio.get_running_loop()
+        self._last_attempt = time.monotonic()
+        try:
+            body = await loop.run_in_executor(
+                None, fetch_jwks, self.source, self.timeout
+            )
+            self._swap(self._parse(body))
+        except Exception as e:
+            logger.warning(
+                f"Failed to refresh JWKS from {self.source}, "
+                f"keeping {len(self._keys)} cached keys: {e}"
+            )
+            return False
+        return True
+
+    async def run(self) -> None:
+        """Refresh the key set every ``refresh_interval`` seconds"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def _refresh_for(self, kid: str) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        if time.monotonic() - self._last_attempt < self.min_refresh_interval:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        logger.info(f"Unknown JWKS kid {kid!r}, refreshing key set")
+        self._refresh_task = loop.create_task(self.refresh())
+
+    def _parse(self, body: bytes) -> Tuple[Dict[str, JWKSKey], Dict[bytes, JWKSKey]]:
+        document = orjson.loads(body)
+        if not isinstance(document, dict) or not isinstance(document.get("keys"), list):
+            raise ValueError("JWKS document must be an object with a keys list")
+
+        keys: Dict[str, JWKSKey] = {}
+        parsed: Dict[bytes, JWKSKey] = {}
+        for data in document["keys"]:
+            if not isinstance(data, dict) or data.get("use", "sig") != "sig":
+                continue
+            raw = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+            key = self._parsed.get(raw)
+            if key is None:
+                try:
+                    key = JWKSKey(data)
+                except Exception as e:
+                    logger.warning(f"Skipping JWK {data.get('kid')!r}: {e}")
+                    continue
+            parsed[raw] = key
+            keys[key.kid or ""] = key
+        return keys, parsed
+
+    def _swap(self, result: Tuple[Dict[str, JWKSKey], Dict[bytes, JWKSKey]]) -> None:
+        keys, parsed = result
+        changed = set(parsed) != set(self._parsed)
+        # Replace both dicts at once; readers see the old or the new set
+        self._keys, self._parsed = keys, parsed
+        self.loaded_at = time.time()
+        if changed:
+            self.version += 1
+            logger.info(f"Loaded {len(keys)} JWKS keys from {self.source}")
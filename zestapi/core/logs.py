@@ -0,0 +1,256 @@
+"""
+Non-blocking log handlers and JSON log formatting
+
+``QueueLogHandler`` takes records off the calling thread: emitting a record
+only puts it on a bounded queue, and a background thread formats and writes
+queued records in batches, flushing each handler once per batch. When the
+queue is full, records are dropped rather than blocking the event loop, and
+the number dropped is counted and reported in the log.
+
+``JSONFormatter`` renders records as one JSON object per line with a fixed
+set of fields, serialized by ``orjson`` in a single call.
+"""
+
+import copy
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+DROP_POLICIES = ("new", "oldest")
+
+_STOP = logging.makeLogRecord({"msg": "stop"})
+
+# Request metadata attached to records with ``extra=``, in output order
+ACCESS_LOG_FIELDS = (
+    "request_id",
+    "method",
+    "path",
+    "url",
+    "status_code",
+    "duration_ms",
+    "process_time",
+    "client_ip",
+    "user_agent",
+    "content_length",
+    "response_size",
+    "body_preview",
+    "body_size",
+)
+
+
+class LazyValue:
+    """
+    A log field computed only when the record is formatted
+
+    Pass as an ``extra=`` value for fields that are costly to build
+    (``str(request.url)``) and often not needed: records that are filtered
+    out or dropped never compute it, and with ``log_queue`` it is computed on
+    the writer thread.
+    """
+
+    __slots__ = ("func",)
+
+    def __init__(self, func: Callable[[], Any]) -> None:
+        self.func = func
+
+    def __str__(self) -> str:
+        return str(self.func())
+
+    def __repr__(self) -> str:
+        return repr(self.func())
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format records as single-line JSON objects
+
+    Every record has ``timestamp``, ``level``, ``logger`` and ``message``,
+    followed by the ``fields`` present on the record (request metadata from
+    the access log by default) and ``exception`` when there is one. Fields
+    holding a ``LazyValue`` are evaluated here; other values ``orjson``
+    cannot serialize are rendered with ``str``.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[str] = ACCESS_LOG_FIELDS,
+        rename: Optional[Dict[str, str]] = None,
+    ) -> None:
+        super().__init__()
+        rename = rename or {}
+        # (record attribute, output key), computed once
+        self._fields: Tuple[Tuple[str, str], ...] = tuple(
+            (name, rename.get(name, name)) for name in fields
+        )
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        attributes = record.__dict__
+        for name, key in self._fields:
+            if name in attributes:
+                value = attributes[name]
+                if isinstance(value, LazyValue):
+                    value = value.func()
+                payload[key] = value
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+        return orjson.dumps(payload, default=str).decode()
+
+
+class BatchFlushMixin:
+    """Leave flushing to ``QueueLogHandler``, which flushes once per batch
+    instead of once per record"""
+
+    def flush(self) -> None:
+        pass
+
+    def flush_batch(self) -> None:
+        super().flush()  # type: ignore[misc]
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class BatchRotatingFileHandler(BatchFlushMixin, RotatingFileHandler):
+    pass
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Hand records to a background writer through a bounded queue
+
+    ``handlers`` are only called from the writer thread. With ``drop="new"``
+    a record arriving at a full queue is discarded; with ``drop="oldest"``
+    the oldest queued record makes room for it. ``dropped`` counts discarded
+    records.
+    """
+
+    def __init__(
+        self,
+        handlers: List[logging.Handler],
+        queue_size: int = 10_000,
+        drop: str = "new",
+        batch_size: int = 500,
+    ) -> None:
+        if drop not in DROP_POLICIES:
+            raise ValueError(
+                f"Unknown drop policy: {drop} (expected one of {DROP_POLICIES})"
+            )
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(queue_size)
+        super().__init__(self._queue)
+        self.handlers = handlers
+        self.drop = drop
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._reported = 0
+        self._thread: Optional[threading.Thread] = None
+        self.start()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="zestapi-log-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Write the queued records and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+        super().close()
+
+    def prepare(self, record: logging.LogRecord) -> Any:
+        # Merge the arguments now, while they have the values being logged;
+        # formatting is left to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        log_queue = self._queue
+        try:
+            log_queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.drop == "oldest":
+            try:
+                log_queue.get_nowait()
+                log_queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+
+    def _run(self) -> None:
+        log_queue = self._queue
+        while True:
+            batch = [log_queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            for record in batch:
+                if record is _STOP:
+                    stop = True
+                else:
+                    self._write(record)
+            if self.dropped != self._reported:
+                self._report_dropped()
+            for handler in self.handlers:
+                flush = getattr(handler, "flush_batch", handler.flush)
+                try:
+                    flush()
+                except Exception:
+                    pass
+            if stop:
+                return
+
+    def _write(self, record: logging.LogRecord) -> None:
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                try:
+                    handler.handle(record)
+                except Exception:
+                    # Keep the writer alive whatever a handler does
+                    handler.handleError(record)
+
+    def _report_dropped(self) -> None:
+        dropped, self._reported = self.dropped - self._reported, self.dropped
+        self._write(
+            logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Log queue full, dropped {dropped} records "
+                    f"({self.dropped} in total)",
+                }
+            )
+        )
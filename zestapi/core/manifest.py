@@ -0,0 +1,141 @@
+"""
+Route manifests: a record of the routes declared by each route module, so an
+application can register its routes without executing the modules.
+
+A manifest is written by ``zest manifest`` and keyed by each file's mtime,
+size and SHA-256 hash. Files that changed since the manifest was written are
+imported as usual, the rest are served through ``LazyEndpoint`` proxies that
+import their module on first use.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from starlette.routing import BaseRoute
+
+from .routing import (
+    iter_route_files,
+    lazy_file_routes,
+    load_route_file,
+    load_route_module,
+    module_routes,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+
+
+def file_hash(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _file_entry(file_path: str) -> Dict[str, Any]:
+    """Import a route module and record its routes"""
+    stat = os.stat(file_path)
+    module = load_route_module(file_path, fresh=True)
+    routes = []
+    for attr_name, attr in module_routes(module):
+        route_info = dict(attr.__route__)
+        route_info["function"] = attr_name
+        routes.append(route_info)
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_hash(file_path),
+        "routes": routes,
+    }
+
+
+def build_manifest(routes_dir: str) -> Dict[str, Any]:
+    """Import every route module under ``routes_dir`` and describe its
+    routes"""
+    files: Dict[str, Any] = {}
+    for file_path, _ in iter_route_files(routes_dir):
+        relative_path = os.path.relpath(file_path, routes_dir).replace(os.sep, "/")
+        try:
+            files[relative_path] = _file_entry(file_path)
+        except Exception as e:
+            logger.warning(f"Failed to load route file {file_path}: {e}")
+    return {"version": MANIFEST_VERSION, "files": files}
+
+
+def write_manifest(routes_dir: str, output: Optional[str] = None) -> str:
+    """Build the manifest for ``routes_dir`` and write it as JSON"""
+    output = output or os.path.join(routes_dir, MANIFEST_FILENAME)
+    manifest = build_manifest(routes_dir)
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, output)
+    return output
+
+
+def read_manifest(manifest_path: str) -> Optional[Dict[str, Any]]:
+    """Read a manifest, returning None if it is missing or unusable"""
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable route manifest {manifest_path}: {e}")
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        logger.warning(f"Ignoring route manifest {manifest_path}: unknown version")
+        return None
+    return manifest
+
+
+def is_fresh(entry: Optional[Dict[str, Any]], file_path: str) -> bool:
+    """Check a manifest entry still describes ``file_path``"""
+    if entry is None:
+        return False
+    stat = os.stat(file_path)
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    # Touched but not modified, e.g. by a checkout
+    return file_hash(file_path) == str(entry["sha256"])
+
+
+def manifest_routes(routes_dir: str, manifest: Dict[str, Any]) -> List[BaseRoute]:
+    """
+    Create routes for ``routes_dir`` from a manifest
+
+    Modules described by a fresh manifest entry are not imported; their
+    routes get ``LazyEndpoint`` proxies. New or modified modules are
+    imported like ``discover_routes`` does.
+    """
+    files = manifest["files"]
+    routes: List[BaseRoute] = []
+    stale = 0
+    for file_path, path_prefix in iter_route_files(routes_dir):
+        relative_path = os.path.relpath(file_path, routes_dir).replace(os.sep, "/")
+        try:
+            entry = files.get(relative_path)
+            if not is_fresh(entry, file_path):
+                stale += 1
+                routes.extend(load_route_file(file_path, path_prefix))
+                continue
+            endpoints = []
+            for route_info in entry["routes"]:  # type: ignore[index]
+                route_info = dict(route_info)
+                endpoints.append((route_info.pop("function"), route_info))
+            routes.extend(lazy_file_routes(file_path, path_prefix, endpoints))
+        except Exception as e:
+            logger.warning(f"Failed to load route file {file_path}: {e}")
+            continue
+
+    if stale:
+        logger.warning(
+            f"Route manifest is stale for {stale} files in {routes_dir}; "
+            f"run 'zest manifest' to update it"
+        )
+    return routes
@@ -0,0 +1,464 @@
+"""
+Prometheus metrics
+
+A ``MetricsRegistry`` keeps every metric value in one flat array of doubles.
+Counters, gauges and histograms are allocated slots in that array (and have
+their label strings rendered) when they are registered, so recording a value
+is an index update with no label lookup or formatting per request.
+
+In multiprocess mode each worker process maps its array onto its own file in
+``directory``, next to a JSON file describing the series in it. The metrics
+endpoint of any worker reads every file and sums the series, so a scrape sees
+the whole host. Gauges are only summed over live processes; counters and
+histograms of exited workers are kept so totals never go backwards.
+"""
+
+import array
+import bisect
+import logging
+import mmap
+import os
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import orjson
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name -> (type, help)
+Family = Tuple[str, str]
+# (name, rendered labels, offset, bucket upper bounds for histograms)
+SeriesInfo = Tuple[str, str, int, Tuple[float, ...]]
+
+
+def render_labels(labels: Mapping[str, str]) -> str:
+    """Prometheus label set, e.g. ``{method="GET",route="/users"}``"""
+    if not labels:
+        return ""
+    pairs = (
+        f'{name}="{_escape(str(value))}"' for name, value in sorted(labels.items())
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic counter stored in a registry slot"""
+
+    __slots__ = ("_registry", "_index")
+
+    def __init__(self, registry: "MetricsRegistry", index: int) -> None:
+        self._registry = registry
+        self._index = index
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._registry.values[self._index] += amount
+
+    @property
+    def value(self) -> float:
+        return float(self._registry.values[self._index])
+
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._registry.values[self._index] -= amount
+
+    def set(self, value: float) -> None:
+        self._registry.values[self._index] = value
+
+
+class Histogram:
+    """
+    Histogram with a preallocated slot per bucket
+
+    Slots hold the per-bucket (non-cumulative) counts, the ``+Inf`` bucket
+    and the sum of observations; cumulative counts are computed on export.
+    """
+
+    __slots__ = ("_registry", "_index", "_sum_index", "bounds")
+
+    def __init__(
+        self, registry: "MetricsRegistry", index: int, bounds: Tuple[float, ...]
+    ) -> None:
+        self._registry = registry
+        self._index = index
+        self._sum_index = index + len(bounds) + 1
+        self.bounds = bounds
+
+    def observe(self, value: float) -> None:
+        values = self._registry.values
+        values[self._index + bisect.bisect_left(self.bounds, value)] += 1
+        values[self._sum_index] += value
+
+    @property
+    def count(self) -> float:
+        values = self._registry.values
+        return float(sum(values[self._index : self._sum_index]))
+
+    @property
+    def sum(self) -> float:
+        return float(self._registry.values[self._sum_index])
+
+
+class MetricsRegistry:
+    """
+    Metric families and the flat value array backing them
+
+    ``directory`` enables multiprocess mode, holding at most ``capacity``
+    values per process.
+    """
+
+    def __init__(self, directory: Optional[str] = None, capacity: int = 65536):
+        self.directory = directory
+        self.capacity = capacity
+        self.families: Dict[str, Family] = {}
+        self.series: List[SeriesInfo] = []
+        # (name, labels) -> registered metric
+        self._metrics: Dict[Tuple[str, str], Any] = {}
+        self._size = 0
+        self._dirty = False
+        self._mmap: Optional[mmap.mmap] = None
+        self.values: Any = array.array("d")
+        self._pid = os.getpid()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._open()
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(
+        self, name: str, help: str, labels: Optional[Mapping[str, str]] = None
+    ) -> Counter:
+        metric: Counter = self._metric(name, "counter", help, labels)
+        return metric
+
+    def gauge(
+        self, name: str, help: str, labels: Optional[Mapping[str, str]] = None
+    ) -> Gauge:
+        metric: Gauge = self._metric(name, "gauge", help, labels)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Optional[Mapping[str, str]] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        bounds = tuple(sorted(float(b) for b in buckets if b != float("inf")))
+        metric: Histogram = self._metric(name, "histogram", help, labels, bounds)
+        return metric
+
+    def _metric(
+        self,
+        name: str,
+        kind: str,
+        help: str,
+        labels: Optional[Mapping[str, str]],
+        bounds: Tuple[float, ...] = (),
+    ) -> Any:
+        """The registered series for a label set, allocating it if new"""
+        family = self.families.setdefault(name, (kind, help))
+        if family[0] != kind:
+            raise ValueError(f"Metric {name} is already registered as a {family[0]}")
+        rendered = render_labels(labels or {})
+        metric = self._metrics.get((name, rendered))
+        if metric is not None:
+            return metric
+
+        index = self._size
+        size = len(bounds) + 2 if kind == "histogram" else 1
+        if self._mmap is not None:
+            if index + size > self.capacity:
+                raise ValueError(
+                    f"Metrics capacity of {self.capacity} values exceeded; "
+                    f"raise metrics_capacity"
+                )
+        else:
+            self.values.extend([0.0] * size)
+        self._size += size
+        self.series.append((name, rendered, index, bounds))
+
+        if kind == "histogram":
+            metric = Histogram(self, index, bounds)
+        else:
+            metric = (Gauge if kind == "gauge" else Counter)(self, index)
+        self._metrics[(name, rendered)] = metric
+        self._dirty = True
+        return metric
+
+    def sync(self) -> None:
+        """Publish series registered since the last call to other processes"""
+        if self._mmap is not None and self._dirty:
+            self._write_series()
+
+    # Multiprocess mode
+
+    def _paths(self, pid: int) -> Tuple[str, str]:
+        assert self.directory is not None
+        base = os.path.join(self.directory, f"metrics-{pid}")
+        return base + ".db", base + ".json"
+
+    def _open(self) -> None:
+        db_path, _ = self._paths(self._pid)
+        fd = os.open(db_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, self.capacity * 8)
+            self._mmap = mmap.mmap(fd, self.capacity * 8)
+        finally:
+            os.close(fd)
+        self.values = memoryview(self._mmap).cast("d")
+        self._write_series()
+
+    def _after_fork(self) -> None:
+        # A forked worker gets its own, zeroed, file with the same series
+        self._pid = os.getpid()
+        self.values = None
+        self._mmap = None
+        self._open()
+
+    def _write_series(self) -> None:
+        _, json_path = self._paths(self._pid)
+        data = orjson.dumps({"families": self.families, "series": self.series})
+        temp_path = f"{json_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, json_path)
+        self._dirty = False
+
+    def _read_process(self, pid: int) -> Optional[Tuple[Dict[str, Any], Any]]:
+        db_path, json_path = self._paths(pid)
+        try:
+            with open(json_path, "rb") as f:
+                layout = orjson.loads(f.read())
+            values = array.array("d")
+            with open(db_path, "rb") as f:
+                values.frombytes(f.read())
+        except (OSError, ValueError) as e:
+            logger.debug(f"Skipping metrics of process {pid}: {e}")
+            return None
+        return layout, values
+
+    def _processes(self) -> List[int]:
+        assert self.directory is not None
+        pids = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith("metrics-") and filename.endswith(".json"):
+                try:
+                    pids.append(int(filename[8:-5]))
+                except ValueError:
+                    continue
+        return pids
+
+    # Export
+
+    def collect(self) -> Tuple[Dict[str, Family], Dict[Tuple[str, str], Any]]:
+        """Families and summed values by (name, labels). Histogram values are
+        (bucket bounds, per-bucket counts, sum)."""
+        self.sync()
+        if self._mmap is None:
+            sources: Iterable[Tuple[int, Dict[str, Any], Any]] = [
+                (
+                    self._pid,
+                    {"families": self.families, "series": self.series},
+                    self.values,
+                )
+            ]
+        else:
+            sources = []
+            for pid in self._processes():
+                process = self._read_process(pid)
+                if process is not None:
+                    sources.append((pid, *process))
+
+        families: Dict[str, Family] = {}
+        totals: Dict[Tuple[str, str], Any] = {}
+        for pid, layout, values in sources:
+            alive = pid == self._pid or _is_alive(pid)
+            for name, family in layout["families"].items():
+                families.setdefault(name, tuple(family))  # type: ignore[arg-type]
+            for name, labels, index, bounds in layout["series"]:
+                kind = families[name][0]
+                if kind == "gauge" and not alive:
+                    continue
+                key = (name, labels)
+                if kind == "histogram":
+                    bounds = tuple(bounds)
+                    counts = list(values[index : index + len(bounds) + 1])
+                    total = values[index + len(bounds) + 1]
+                    if key in totals:
+                        _, previous, previous_total = totals[key]
+                        counts = [a + b for a, b in zip(previous, counts)]
+                        total += previous_total
+                    totals[key] = (bounds, counts, total)
+                else:
+                    totals[key] = totals.get(key, 0.0) + values[index]
+        return families, totals
+
+    def exposition(self) -> bytes:
+        """Metrics in the Prometheus text format"""
+        families, totals = self.collect()
+        by_family: Dict[str, List[Tuple[str, Any]]] = {}
+        for (name, labels), value in totals.items():
+            by_family.setdefault(name, []).append((labels, value))
+
+        lines: List[str] = []
+        for name in sorted(by_family):
+            kind, help = families[name]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(by_family[name]):
+                if kind != "histogram":
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+                    continue
+                bounds, counts, total = value
+                inner = labels[1:-1] + "," if labels else ""
+                cumulative = 0.0
+                for bound, count in zip(bounds + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(
+                        f'{name}_bucket{{{inner}le="{le}"}} '
+                        f"{_format_value(cumulative)}"
+                    )
+                lines.append(f"{name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{name}_count{labels} {_format_value(cumulative)}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def close(self) -> None:
+        """Unmap this process's file; its values stay on disk"""
+        if self._mmap is not None:
+            self.values.release()
+            self._mmap.close()
+            self._mmap = None
+            self.values = array.array("d")
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RouteMetricsApp:
+    """
+    ASGI wrapper recording requests, latency and in-flight requests for one
+    route
+
+    Series for each of the route's methods are registered up front; a
+    request only looks up its method and updates preallocated slots.
+    """
+
+    def __init__(
+        self, app: ASGIApp, registry: MetricsRegistry, path: str, methods: Any
+    ) -> None:
+        self.app = app
+        self._series: Dict[str, Tuple[List[Counter], Histogram, Gauge]] = {}
+        for method in sorted(methods or ["*"]):
+            labels = {"route": path, "method": method}
+            requests = [
+                registry.counter(
+                    "zestapi_http_requests_total",
+                    "HTTP requests by route, method and status class",
+                    {**labels, "status": f"{status}xx"},
+                )
+                for status in range(1, 6)
+            ]
+            latency = registry.histogram(
+                "zestapi_http_request_duration_seconds",
+                "HTTP request latency by route and method",
+                labels,
+            )
+            in_flight = registry.gauge(
+                "zestapi_http_requests_in_progress",
+                "HTTP requests being handled by route and method",
+                labels,
+            )
+            self._series[method] = (requests, latency, in_flight)
+        self._default = self._series.get("*")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        series = self._series.get(scope.get("method", ""), self._default)
+        if scope["type"] != "http" or series is None:
+            await self.app(scope, receive, send)
+            return
+
+        requests, latency, in_flight = series
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency.observe(time.perf_counter() - start)
+            in_flight.dec()
+            requests[min(max(status // 100, 1), 5) - 1].inc()
+
+
+def instrument_routes(routes: List[BaseRoute], registry: MetricsRegistry) -> int:
+    """Wrap the ASGI app of every HTTP route to record its metrics, returning
+    the number of instrumented routes"""
+    count = 0
+    for route in routes:
+        if not isinstance(route, Route) or isinstance(route.app, RouteMetricsApp):
+            continue
+        route.app = RouteMetricsApp(route.app, registry, route.path, route.methods)
+        count += 1
+    registry.sync()
+    return count
+
+
+def metrics_endpoint(registry: MetricsRegistry) -> Any:
+    """Endpoint serving ``registry`` in the Prometheus text format"""
+
+    async def metrics(request: Request) -> Response:
+        return Response(registry.exposition(), media_type=CONTENT_TYPE)
+
+    return metrics
@@ -1,122 +1,178 @@
 import logging
 import time
 import traceback
-import uuid
-from typing import Any, Dict, Optional
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
 
+from starlette.datastructures import Headers
 from starlette.exceptions import HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .logs import LazyValue
+from .request_id import RequestIdGenerator, default_request_ids
+from .tracing import Span, Tracer, _current_span
 
 logger = logging.getLogger(__name__)
 
 
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
+def set_response_headers(message: Message, headers: List[Tuple[bytes, bytes]]) -> None:
+    """Set raw headers on an ``http.response.start`` message, replacing any
+    existing values with the same (lower-case) name"""
+    names = {name for name, _ in headers}
+    raw = [item for item in message.get("headers", ()) if item[0].lower() not in names]
+    raw.extend(headers)
+    message["headers"] = raw
+
+
+def is_sampled(request_id: str, sample_rate: float) -> bool:
+    """Whether a request's access log is kept at ``sample_rate``
+
+    Decided by a hash of the request ID, so every log line of a request (and
+    of other services seeing the same ID) shares the decision.
+    """
+    if sample_rate >= 1.0:
+        return True
+    if sample_rate <= 0.0:
+        return False
+    return zlib.crc32(request_id.encode()) < sample_rate * 0x100000000
+
+
+class ErrorHandlingMiddleware:
     """
     Comprehensive error handling middleware for production use
+
+    Implemented as a raw ASGI middleware so that responses (including
+    streaming responses) pass straight through without extra task hops.
+    Request IDs come from ``request_ids`` (counter IDs by default).
     """
 
-    def __init__(self, app: Any, debug: bool = False) -> None:
-        super().__init__(app)
+    def __init__(
+        self,
+        app: ASGIApp,
+        debug: bool = False,
+        request_ids: Optional[RequestIdGenerator] = None,
+    ) -> None:
+        self.app = app
         self.debug = debug
+        self.request_ids = request_ids or default_request_ids
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next: Any) -> Response:
         start_time = time.time()
-        request_id = str(uuid.uuid4())[:8]
+        request_id = self.request_ids(scope)
+        response_started = False
+
+        # Add request ID to request state
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                # Add performance headers
+                process_time = time.time() - start_time
+                set_response_headers(
+                    message,
+                    [
+                        (b"x-process-time", f"{process_time:.4f}".encode("latin-1")),
+                        (b"x-request-id", request_id.encode("latin-1")),
+                    ],
+                )
+            await send(message)
 
         try:
-            # Add request ID to request state
-            request.state.request_id = request_id
-
-            response = await call_next(request)
-
-            # Add performance headers
-            process_time = time.time() - start_time
-            response.headers["X-Process-Time"] = f"{process_time:.4f}"
-            response.headers["X-Request-ID"] = request_id
-
-            return response  # type: ignore
-
-        except HTTPException as exc:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            if response_started:
+                # Too late to replace the response, let the server handle it
+                raise
+            request = Request(scope, receive)
+            error_response = self._handle_exception(exc, request_id, request)
+            await error_response(scope, receive, send)
+
+    def _handle_exception(
+        self, exc: Exception, request_id: str, request: Request
+    ) -> JSONResponse:
+        """Map an exception raised downstream to an error response"""
+        if isinstance(exc, HTTPException):
             # Handle HTTP exceptions (4xx, 5xx)
-            error_response = self._create_error_response(
-                status_code=exc.status_code,
-                message=exc.detail,
-                error_type="HTTPException",
-                request_id=request_id,
-                request=request,
-            )
             logger.warning(
                 "HTTP Exception %s: %s (Request: %s)",
                 exc.status_code,
                 exc.detail,
                 request_id,
             )
-            return error_response
+            return self._create_error_response(
+                status_code=exc.status_code,
+                message=exc.detail,
+                error_type="HTTPException",
+                request_id=request_id,
+                request=request,
+            )
 
-        except ValueError as exc:
+        if isinstance(exc, ValueError):
             # Handle validation errors (400)
-            error_response = self._create_error_response(
+            logger.warning("Validation Error: %s (Request: %s)", exc, request_id)
+            return self._create_error_response(
                 status_code=400,
                 message=str(exc),
                 error_type="ValidationError",
                 request_id=request_id,
                 request=request,
             )
-            logger.warning("Validation Error: %s (Request: %s)", exc, request_id)
-            return error_response
 
-        except PermissionError as exc:
+        if isinstance(exc, PermissionError):
             # Handle permission errors (403)
-            error_response = self._create_error_response(
+            logger.warning("Permission Error: %s (Request: %s)", exc, request_id)
+            return self._create_error_response(
                 status_code=403,
                 message="Access forbidden",
                 error_type="PermissionError",
                 request_id=request_id,
                 request=request,
             )
-            logger.warning("Permission Error: %s (Request: %s)", exc, request_id)
-            return error_response
 
-        except FileNotFoundError as exc:
+        if isinstance(exc, FileNotFoundError):
             # Handle file not found errors (404)
-            error_response = self._create_error_response(
+            logger.warning("Not Found Error: %s (Request: %s)", exc, request_id)
+            return self._create_error_response(
                 status_code=404,
                 message="Resource not found",
                 error_type="NotFoundError",
                 request_id=request_id,
                 request=request,
             )
-            logger.warning("Not Found Error: %s (Request: %s)", exc, request_id)
-            return error_response
 
-        except Exception as exc:
-            # Handle all other exceptions (500)
-            error_response = self._create_error_response(
-                status_code=500,
-                message="Internal server error",
-                error_type="InternalServerError",
-                request_id=request_id,
-                request=request,
-                exception=exc,
-            )
+        # Handle all other exceptions (500)
+        error_response = self._create_error_response(
+            status_code=500,
+            message="Internal server error",
+            error_type="InternalServerError",
+            request_id=request_id,
+            request=request,
+            exception=exc,
+        )
 
-            # Log the full exception with traceback
-            logger.error(
-                "Unhandled exception in request %s: %s",
-                request_id,
-                exc,
-                exc_info=True,
-                extra={
-                    "request_id": request_id,
-                    "method": request.method,
-                    "url": str(request.url),
-                    "user_agent": request.headers.get("user-agent"),
-                    "client_ip": (request.client.host if request.client else None),
-                },
-            )
-            return error_response
+        # Log the full exception with traceback
+        logger.error(
+            "Unhandled exception in request %s: %s",
+            request_id,
+            exc,
+            exc_info=True,
+            extra={
+                "request_id": request_id,
+                "method": request.method,
+                "url": str(request.url),
+                "user_agent": request.headers.get("user-agent"),
+                "client_ip": (request.client.host if request.client else None),
+            },
+        )
+        return error_response
 
     def _create_error_response(
         self,
@@ -180,29 +236,42 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
         )
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """
     Enhanced request logging middleware
     """
 
     def __init__(
-        self, app: Any, log_body: bool = False, max_body_size: int = 1024
+        self,
+        app: ASGIApp,
+        log_body: bool = False,
+        max_body_size: int = 1024,
+        sample_rate: float = 1.0,
+        slow_threshold: Optional[float] = None,
     ) -> None:
-        super().__init__(app)
+        self.app = app
         self.log_body = log_body
         self.max_body_size = max_body_size
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next: Any) -> Response:
         start_time = time.time()
+        request = Request(scope)
 
         # Get request ID from state (set by ErrorHandlingMiddleware)
-        request_id = getattr(request.state, "request_id", "unknown")
+        request_id = scope.get("state", {}).get("request_id", "unknown")
 
         # Log request details
-        log_data = {
+        log_data: Dict[str, Any] = {
             "request_id": request_id,
             "method": request.method,
-            "url": str(request.url),
+            "path": scope["path"],
+            "url": LazyValue(lambda: str(request.url)),
             "user_agent": request.headers.get("user-agent"),
             "client_ip": request.client.host if request.client else None,
             "content_length": request.headers.get("content-length"),
@@ -210,8 +279,8 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
 
         # Optionally log request body (be careful with sensitive data)
         if self.log_body and request.method in ["POST", "PUT", "PATCH"]:
+            body, receive = await self._buffer_body(receive)
             try:
-                body = await request.body()
                 if len(body) <= self.max_body_size:
                     log_data["body_preview"] = body.decode("utf-8")[
                         : self.max_body_size
@@ -221,10 +290,24 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             except Exception:
                 log_data["body"] = "Could not read body"
 
-        logger.info("Request started", extra=log_data)
+        sampled = is_sampled(request_id, self.sample_rate)
+        if sampled:
+            logger.info("Request started", extra=log_data)
+
+        status_code = 500
+        response_size: Optional[str] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_size = Headers(raw=message.get("headers", [])).get(
+                    "content-length"
+                )
+            await send(message)
 
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
             # Log the exception before re-raising
             logger.error("Request failed: %s", e, extra=log_data, exc_info=True)
@@ -232,21 +315,236 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
 
         # Log response details
         process_time = time.time() - start_time
-        response_log_data = {
-            **log_data,
-            "status_code": response.status_code,
-            "process_time": f"{process_time:.4f}s",
-            "response_size": response.headers.get("content-length"),
-        }
-
-        if response.status_code >= 400:
+        if status_code >= 400:
+            response_log_data = {
+                **log_data,
+                "status_code": status_code,
+                "process_time": f"{process_time:.4f}s",
+                "response_size": response_size,
+            }
             logger.warning("Request completed with error", extra=response_log_data)
-        else:
+        elif (
+            self.slow_threshold is not None
+            and process_time * 1000 >= self.slow_threshold
+        ):
+            logger.warning(
+                "Slow request %s %s completed in %.2fms",
+                request.method,
+                scope["path"],
+                process_time * 1000,
+                extra={
+                    **log_data,
+                    "status_code": status_code,
+                    "duration_ms": round(process_time * 1000, 3),
+                },
+            )
+        elif sampled:
             logger.info(
                 "Request %s %s completed in %.2fms",
                 request.method,
-                request.url.path,
+                scope["path"],
                 process_time * 1000,
+                extra={
+                    **log_data,
+                    "status_code": status_code,
+                    "duration_ms": round(process_time * 1000, 3),
+                },
             )
 
-        return response  # type: ignore
+    async def _buffer_body(self, receive: Receive) -> Tuple[bytes, Receive]:
+        """Read the whole request body and return it together with a receive
+        callable that replays it to the downstream application"""
+        chunks = []
+        message: Message = {"type": "http.request", "more_body": True}
+        while message["type"] == "http.request" and message.get("more_body", False):
+            message = await receive()
+            chunks.append(message.get("body", b""))
+
+        body = b"".join(chunks)
+        # Replay the body, or the disconnect message if the client went away
+        pending: Optional[Message] = (
+            {"type": "http.request", "body": body, "more_body": False}
+            if message["type"] == "http.request"
+            else message
+        )
+
+        async def replay() -> Message:
+            nonlocal pending
+            if pending is not None:
+                message, pending = pending, None
+                return message
+            return await receive()
+
+        return body, replay
+
+
+class CoreMiddleware(ErrorHandlingMiddleware):
+    """
+    Fused request ID, timing, error handling and access log middleware
+
+    Does the work of ``ErrorHandlingMiddleware`` and
+    ``RequestLoggingMiddleware`` in a single ASGI layer. Request metadata for
+    the access log is only built when a log record is actually emitted.
+
+    Successful requests are logged at ``sample_rate`` (decided by request
+    ID); errors, and requests taking at least ``slow_threshold``
+    milliseconds, are always logged.
+
+    With a ``tracer``, each request runs in a server span continuing the
+    caller's ``traceparent``, and the trace ID is the request ID instead of
+    one from ``request_ids``.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        debug: bool = False,
+        sample_rate: float = 1.0,
+        slow_threshold: Optional[float] = None,
+        tracer: Optional[Tracer] = None,
+        request_ids: Optional[RequestIdGenerator] = None,
+    ) -> None:
+        super().__init__(app, debug=debug, request_ids=request_ids)
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.tracer = tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        state = scope.setdefault("state", {})
+        tracer = self.tracer
+        span: Optional[Span] = None
+        if tracer is not None:
+            span = tracer.start_request_span(scope)
+            state["span"] = span
+            span_token = _current_span.set(span)
+            request_id = span.trace_id
+        else:
+            request_id = self.request_ids(scope)
+        sampled = is_sampled(request_id, self.sample_rate)
+        state["request_id"] = request_id
+        state["log_sampled"] = sampled
+        status_code = 500
+        response_headers: Any = ()
+        response_started = False
+
+        if sampled and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request started", extra=self._log_fields(scope, request_id))
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_headers, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                response_headers = message.get("headers", ())
+                process_time = time.perf_counter() - start_time
+                set_response_headers(
+                    message,
+                    [
+                        (b"x-process-time", f"{process_time:.4f}".encode("latin-1")),
+                        (b"x-request-id", request_id.encode("latin-1")),
+                    ],
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            if span is not None:
+                span.record_exception(exc)
+            if response_started:
+                logger.error(
+                    "Request failed: %s",
+                    exc,
+                    extra=self._log_fields(scope, request_id),
+                    exc_info=True,
+                )
+                raise
+            request = Request(scope, receive)
+            error_response = self._handle_exception(exc, request_id, request)
+            status_code = error_response.status_code
+            await error_response(scope, receive, send)
+        finally:
+            if tracer is not None and span is not None:
+                _current_span.reset(span_token)
+                del state["span"]
+                span.set_attribute("http.response.status_code", status_code)
+                if status_code >= 500:
+                    span.status = "ERROR"
+                tracer.end_span(span)
+
+        self._log_access(
+            scope, request_id, status_code, response_headers, start_time, sampled
+        )
+
+    def _log_access(
+        self,
+        scope: Scope,
+        request_id: str,
+        status_code: int,
+        response_headers: Any,
+        start_time: float,
+        sampled: bool = True,
+    ) -> None:
+        """Emit the access log record for a completed request"""
+        process_time = time.perf_counter() - start_time
+        slow = (
+            self.slow_threshold is not None
+            and process_time * 1000 >= self.slow_threshold
+        )
+        if status_code < 400 and not slow and not sampled:
+            return
+        level = logging.WARNING if status_code >= 400 or slow else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+
+        if status_code >= 400:
+            log_data = self._log_fields(scope, request_id)
+            log_data["status_code"] = status_code
+            log_data["process_time"] = f"{process_time:.4f}s"
+            log_data["response_size"] = Headers(raw=list(response_headers)).get(
+                "content-length"
+            )
+            logger.warning("Request completed with error", extra=log_data)
+        elif slow:
+            log_data = self._log_fields(scope, request_id)
+            log_data["status_code"] = status_code
+            log_data["duration_ms"] = round(process_time * 1000, 3)
+            logger.warning(
+                "Slow request %s %s completed in %.2fms",
+                scope["method"],
+                scope["path"],
+                process_time * 1000,
+                extra=log_data,
+            )
+        else:
+            logger.info(
+                "Request %s %s completed in %.2fms",
+                scope["method"],
+                scope["path"],
+                process_time * 1000,
+                extra={
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "duration_ms": round(process_time * 1000, 3),
+                },
+            )
+
+    def _log_fields(self, scope: Scope, request_id: str) -> Dict[str, Any]:
+        """Build the request metadata attached to log records"""
+        request = Request(scope)
+        return {
+            "request_id": request_id,
+            "method": request.method,
+            "path": scope["path"],
+            "url": LazyValue(lambda: str(request.url)),
+            "user_agent": request.headers.get("user-agent"),
+            "client_ip": request.client.host if request.client else None,
+            "content_length": request.headers.get("content-length"),
+        }
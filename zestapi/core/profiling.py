@@ -0,0 +1,404 @@
+"""
+Request phase timing and a sampling profiler
+
+With phase timing enabled, each request gets a ``RequestTimer`` that the
+middleware stack, the route and ``ORJSONResponse`` move from phase to phase:
+
+    middleware -> auth -> rate_limit -> routing -> handler
+        -> serialization -> handler -> send -> handler ...
+
+Time is attributed to the phase in progress, so the phases of a request add
+up to its total. When the response is finished the timer is passed to every
+registered hook. None of this is installed unless enabled, so a disabled
+application only pays for one context variable lookup per ``ORJSONResponse``.
+
+``StackSampler`` samples the stacks of running threads at a fixed interval
+from a background thread, and renders them as collapsed stacks (for
+flamegraph.pl, speedscope and similar tools) or speedscope JSON.
+``profiler_endpoint`` runs it on demand behind a shared token.
+"""
+
+import asyncio
+import hmac
+import logging
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from types import CodeType, FrameType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import Histogram, MetricsRegistry
+from .ratelimit import RateLimitMiddleware
+
+logger = logging.getLogger(__name__)
+
+PHASES = (
+    "middleware",
+    "auth",
+    "rate_limit",
+    "routing",
+    "handler",
+    "serialization",
+    "send",
+)
+
+PROFILE_FORMATS = ("collapsed", "speedscope")
+
+TIMER_KEY = "zestapi.timer"
+
+_current_timer: ContextVar[Optional["RequestTimer"]] = ContextVar(
+    "zestapi_request_timer", default=None
+)
+
+
+def current_timer() -> Optional["RequestTimer"]:
+    """The timer of the request being handled, if phase timing is enabled"""
+    return _current_timer.get()
+
+
+class RequestTimer:
+    """
+    Phase timings of one request
+
+    ``phases`` maps phase names to seconds spent in them; ``total`` is set
+    when the request finishes. ``route`` is the path template of the matched
+    route, or ``None`` when no route was reached.
+    """
+
+    __slots__ = (
+        "method",
+        "path",
+        "route",
+        "status_code",
+        "phase",
+        "phases",
+        "start",
+        "total",
+        "_mark",
+    )
+
+    def __init__(self, method: str, path: str) -> None:
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status_code = 500
+        self.phase = "middleware"
+        self.phases: Dict[str, float] = {}
+        self.start = self._mark = time.perf_counter()
+        self.total = 0.0
+
+    def enter(self, phase: str) -> str:
+        """Close the current phase and start ``phase``, returning the phase
+        that was closed so the caller can go back to it"""
+        now = time.perf_counter()
+        previous = self.phase
+        self.phases[previous] = self.phases.get(previous, 0.0) + now - self._mark
+        self._mark = now
+        self.phase = phase
+        return previous
+
+    def finish(self) -> None:
+        self.enter(self.phase)
+        self.total = self._mark - self.start
+
+
+TimingHook = Callable[[RequestTimer], None]
+
+
+class LogTimingHook:
+    """Log the phase breakdown of requests slower than ``threshold``
+    milliseconds (of every request when ``None``)"""
+
+    def __init__(self, threshold: Optional[float] = None) -> None:
+        self.threshold = threshold / 1000 if threshold is not None else 0.0
+
+    def __call__(self, timer: RequestTimer) -> None:
+        if timer.total < self.threshold:
+            return
+        phases = ", ".join(
+            f"{phase}={seconds * 1000:.2f}ms" for phase, seconds in timer.phases.items()
+        )
+        logger.warning(
+            f"Request phases: {timer.method} {timer.route or timer.path} "
+            f"{timer.total * 1000:.2f}ms ({phases})",
+            extra={
+                "method": timer.method,
+                "path": timer.path,
+                "status_code": timer.status_code,
+                "duration_ms": round(timer.total * 1000, 3),
+            },
+        )
+
+
+class MetricsTimingHook:
+    """Record phase durations as the ``zestapi_http_request_phase_seconds``
+    histogram, labelled by route and phase"""
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.registry = registry
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def __call__(self, timer: RequestTimer) -> None:
+        route = timer.route or "unmatched"
+        for phase, seconds in timer.phases.items():
+            histogram = self._histograms.get((route, phase))
+            if histogram is None:
+                histogram = self._histograms[route, phase] = self.registry.histogram(
+                    "zestapi_http_request_phase_seconds",
+                    "Time spent in each phase of handling a request",
+                    {"route": route, "phase": phase},
+                )
+                self.registry.sync()
+            histogram.observe(seconds)
+
+
+class TimingMiddleware:
+    """
+    Start a ``RequestTimer`` for each HTTP request and hand it to ``hooks``
+    once the response is finished
+
+    Time spent sending response messages is the ``send`` phase. A hook that
+    raises is logged and does not affect the response.
+    """
+
+    def __init__(self, app: ASGIApp, hooks: Sequence[TimingHook] = ()) -> None:
+        self.app = app
+        self.hooks = list(hooks)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer(scope.get("method", ""), scope.get("path", ""))
+        scope[TIMER_KEY] = timer
+        token = _current_timer.set(timer)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timer.status_code = message["status"]
+            previous = timer.enter("send")
+            try:
+                await send(message)
+            finally:
+                timer.enter(previous)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timer.reset(token)
+            timer.finish()
+            for hook in self.hooks:
+                try:
+                    hook(timer)
+                except Exception as e:
+                    logger.error(f"Timing hook {hook!r} failed: {e}")
+
+
+class PhaseMiddleware:
+    """Move the request timer to ``phase`` before calling ``app``, recording
+    ``route`` as the matched route when given"""
+
+    def __init__(self, app: ASGIApp, phase: str, route: Optional[str] = None):
+        self.app = app
+        self.phase = phase
+        self.route = route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        timer = scope.get(TIMER_KEY)
+        if timer is not None:
+            timer.enter(self.phase)
+            if self.route is not None:
+                timer.route = self.route
+        await self.app(scope, receive, send)
+
+
+def time_routes(routes: List[BaseRoute]) -> int:
+    """Mark the start of the handler (and of per-route rate limiting) in the
+    ASGI app of every HTTP route, returning the number of routes timed"""
+    count = 0
+    for route in routes:
+        if not isinstance(route, Route) or isinstance(route.app, PhaseMiddleware):
+            continue
+        if isinstance(route.app, RateLimitMiddleware):
+            route.app.app = PhaseMiddleware(route.app.app, "handler")
+            route.app = PhaseMiddleware(route.app, "rate_limit", route.path)
+        else:
+            route.app = PhaseMiddleware(route.app, "handler", route.path)
+        count += 1
+    return count
+
+
+# (name, file, first line) of a sampled function
+Frame = Tuple[str, str, int]
+
+
+class StackSampler:
+    """
+    Statistical profiler sampling thread stacks every ``interval`` seconds
+
+    Only threads in ``thread_ids`` are sampled, or every thread but the
+    sampler's own when it is ``None``. Each sample is weighted by the time
+    since the previous one, so late wake-ups under load don't skew the
+    profile.
+    """
+
+    def __init__(
+        self, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None
+    ) -> None:
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.frames: List[Frame] = []
+        # thread ID -> stacks (frame indexes, outermost first) and weights
+        self.samples: Dict[int, List[Tuple[int, ...]]] = {}
+        self.weights: Dict[int, List[float]] = {}
+        self.duration = 0.0
+        self._frame_index: Dict[CodeType, int] = {}
+
+    def run(self, seconds: float) -> None:
+        """Sample for ``seconds``, blocking the calling thread"""
+        own = threading.get_ident()
+        start = last = time.perf_counter()
+        deadline = start + seconds
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            weight = (now - last) or self.interval
+            last = now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (
+                    self.thread_ids is not None and thread_id not in self.thread_ids
+                ):
+                    continue
+                self.samples.setdefault(thread_id, []).append(self._stack(frame))
+                self.weights.setdefault(thread_id, []).append(weight)
+            time.sleep(self.interval)
+        self.duration = time.perf_counter() - start
+
+    def _stack(self, frame: Optional[FrameType]) -> Tuple[int, ...]:
+        stack = []
+        frame_index = self._frame_index
+        while frame is not None:
+            code = frame.f_code
+            index = frame_index.get(code)
+            if index is None:
+                index = frame_index[code] = len(self.frames)
+                name = getattr(code, "co_qualname", code.co_name)
+                self.frames.append((name, code.co_filename, code.co_firstlineno))
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _thread_names(self) -> Dict[int, str]:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        return {
+            thread_id: names.get(thread_id, f"thread-{thread_id}")
+            for thread_id in self.samples
+        }
+
+    def collapsed(self) -> str:
+        """Samples as collapsed stacks: ``outer;...;inner count`` per line,
+        prefixed with the thread name when sampling every thread"""
+        names = [f"{name} ({path}:{line})" for name, path, line in self.frames]
+        thread_names = self._thread_names()
+        counts: Dict[str, int] = {}
+        for thread_id, stacks in self.samples.items():
+            prefix = [thread_names[thread_id]] if self.thread_ids is None else []
+            for stack in stacks:
+                key = ";".join(prefix + [names[index] for index in stack])
+                counts[key] = counts.get(key, 0) + 1
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+    def speedscope(self) -> Dict[str, Any]:
+        """Samples in the speedscope file format, one profile per thread"""
+        thread_names = self._thread_names()
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "zestapi",
+            "name": "ZestAPI profile",
+            "shared": {
+                "frames": [
+                    {"name": name, "file": path, "line": line}
+                    for name, path, line in self.frames
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_names[thread_id],
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(self.weights[thread_id]),
+                    "samples": [list(stack) for stack in stacks],
+                    "weights": self.weights[thread_id],
+                }
+                for thread_id, stacks in self.samples.items()
+            ],
+        }
+
+
+def profiler_endpoint(
+    token: str, max_seconds: float = 60.0, interval: float = 0.005
+) -> Any:
+    """
+    Endpoint running a ``StackSampler`` for the duration of the request
+
+    Requires the ``X-Profiler-Token`` header to match ``token``. Query
+    parameters: ``seconds`` (default 5, at most ``max_seconds``), ``format``
+    (``collapsed`` or ``speedscope``) and ``threads`` (``loop``, the event
+    loop thread serving the request, or ``all``). One profile runs at a time.
+    """
+    expected = token.encode()
+    running = asyncio.Lock()
+
+    async def profile(request: Request) -> Response:
+        given = request.headers.get("x-profiler-token", "").encode()
+        if not hmac.compare_digest(given, expected):
+            raise HTTPException(status_code=403, detail="Invalid profiler token")
+
+        params = request.query_params
+        try:
+            seconds = float(params.get("seconds", 5))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid seconds")
+        if not 0 < seconds <= max_seconds:
+            raise HTTPException(
+                status_code=400,
+                detail=f"seconds must be between 0 and {max_seconds}",
+            )
+        profile_format = params.get("format", "collapsed")
+        if profile_format not in PROFILE_FORMATS:
+            raise HTTPException(
+                status_code=400, detail=f"format must be one of {PROFILE_FORMATS}"
+            )
+        threads = params.get("threads", "loop")
+        if threads not in ("loop", "all"):
+            raise HTTPException(status_code=400, detail="threads must be loop or all")
+        if running.locked():
+            raise HTTPException(status_code=409, detail="A profile is already running")
+
+        async with running:
+            sampler = StackSampler(
+                interval, [threading.get_ident()] if threads == "loop" else None
+            )
+            logger.info(f"Profiling {threads} threads for {seconds}s")
+            await run_in_threadpool(sampler.run, seconds)
+
+        if profile_format == "speedscope":
+            return Response(
+                orjson.dumps(sampler.speedscope()), media_type="application/json"
+            )
+        return Response(sampler.collapsed(), media_type="text/plain")
+
+    return profile
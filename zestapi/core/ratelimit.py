@@ -1,70 +1,370 @@
+import math
 import re
 import time
-from collections import defaultdict
-from typing import Any, Dict, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from .middleware import set_response_headers
+from .ratelimit_stores import Decision, MemoryStore, RateLimitStore
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: Any, rate_limit: str = "100/minute") -> None:
-        super().__init__(app)
+if TYPE_CHECKING:
+    from .metrics import Counter, MetricsRegistry
+
+# Per-key limiter state. Every algorithm keeps a fixed-size tuple of floats,
+# so memory per client is constant regardless of the configured limit.
+State = Tuple[float, ...]
+
+# (allowed, new_state, remaining, retry_after_seconds)
+HitResult = Tuple[bool, State, int, float]
+
+
+class RateLimitAlgorithm:
+    """
+    Base class for rate limiting algorithms
+
+    Algorithms are stateless: ``hit`` takes the previous state of a key (or
+    ``None``) and returns the new state, which the caller stores.
+    """
+
+    name = ""
+    # Number of floats in this algorithm's state tuple
+    state_size = 0
+
+    def __init__(self, limit: int, window: int) -> None:
+        if limit < 1 or window < 1:
+            raise ValueError("Rate limit and window must be positive")
+        self.limit = limit
+        self.window = window
+        # Header values are rendered once, not per response
+        self.limit_header = str(limit).encode("latin-1")
+        self.window_header = str(window).encode("latin-1")
+
+    def hit(self, state: Optional[State], now: float) -> HitResult:
+        """Record one request for a key and decide whether it is allowed"""
+        raise NotImplementedError
+
+    def expires_at(self, state: State) -> float:
+        """Time after which the state is equivalent to an unseen key"""
+        raise NotImplementedError
+
+
+class SlidingWindowCounter(RateLimitAlgorithm):
+    """
+    Sliding window approximated from the current and previous fixed window
+
+    State: ``(window_start, previous_count, current_count)``
+    """
+
+    name = "sliding_window"
+    state_size = 3
+
+    def hit(self, state: Optional[State], now: float) -> HitResult:
+        window = self.window
+        # Integral window starts compare exactly across processes and stores
+        window_start = float(int(now // window) * window)
+        previous = current = 0.0
+        if state is not None:
+            if state[0] == window_start:
+                previous, current = state[1], state[2]
+            elif state[0] == window_start - window:
+                previous = state[2]
+
+        elapsed = now - window_start
+        weight = 1.0 - elapsed / window
+        estimated = previous * weight + current
+        if estimated >= self.limit:
+            if current >= self.limit or previous <= 0:
+                retry_after = window - elapsed
+            else:
+                # Wait until the previous window's share has decayed enough
+                retry_after = window * (1.0 - (self.limit - current) / previous)
+                retry_after = max(0.0, retry_after - elapsed)
+            return False, (window_start, previous, current), 0, retry_after
+
+        current += 1
+        remaining = max(0, int(self.limit - (estimated + 1)))
+        return True, (window_start, previous, current), remaining, 0.0
+
+    def expires_at(self, state: State) -> float:
+        return state[0] + 2 * self.window
+
+
+class TokenBucket(RateLimitAlgorithm):
+    """
+    Token bucket holding ``limit`` tokens, refilled over ``window`` seconds
+
+    State: ``(tokens, last_refill)``
+    """
+
+    name = "token_bucket"
+    state_size = 2
+
+    def __init__(self, limit: int, window: int) -> None:
+        super().__init__(limit, window)
+        self.rate = limit / window
+
+    def hit(self, state: Optional[State], now: float) -> HitResult:
+        if state is None:
+            tokens = float(self.limit)
+        else:
+            tokens = min(float(self.limit), state[0] + (now - state[1]) * self.rate)
+
+        if tokens < 1.0:
+            return False, (tokens, now), 0, (1.0 - tokens) / self.rate
+
+        tokens -= 1.0
+        return True, (tokens, now), int(tokens), 0.0
+
+    def expires_at(self, state: State) -> float:
+        # The bucket is full again after at most one window
+        return state[1] + self.window
+
+
+class GCRA(RateLimitAlgorithm):
+    """
+    Generic cell rate algorithm allowing bursts of up to ``limit`` requests
+
+    State: ``(theoretical_arrival_time,)``
+    """
+
+    name = "gcra"
+    state_size = 1
+
+    def __init__(self, limit: int, window: int) -> None:
+        super().__init__(limit, window)
+        self.interval = window / limit
+
+    def hit(self, state: Optional[State], now: float) -> HitResult:
+        tat = now if state is None else max(state[0], now)
+        new_tat = tat + self.interval
+        allow_at = new_tat - self.window
+        if now < allow_at:
+            return False, (tat,), 0, allow_at - now
+
+        remaining = int((self.window - (new_tat - now)) / self.interval + 1e-9)
+        return True, (new_tat,), max(0, remaining), 0.0
+
+    def expires_at(self, state: State) -> float:
+        return state[0]
+
+
+WINDOWS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+RATE_LIMIT_PATTERN = re.compile(r"(\d+)/(second|minute|hour|day)")
+
+# A single limit such as "10/second", or identity overrides keyed by
+# "ip:<address>", "user:<subject>" or "api_key:<key>" plus a "default"
+RateLimitSpec = Union[str, Mapping[str, str]]
+
+
+def parse_rate_limit(rate_limit: str) -> Tuple[int, int]:
+    """Parse rate limit string like '100/minute' into
+    (limit, window_seconds)"""
+    match = RATE_LIMIT_PATTERN.match(rate_limit.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit format: {rate_limit}")
+    return int(match.group(1)), WINDOWS[match.group(2)]
+
+
+ALGORITHMS: Dict[str, Type[RateLimitAlgorithm]] = {
+    algorithm.name: algorithm for algorithm in (SlidingWindowCounter, TokenBucket, GCRA)
+}
+
+
+def get_algorithm(name: str, limit: int, window: int) -> RateLimitAlgorithm:
+    """Instantiate a rate limiting algorithm by name"""
+    try:
+        algorithm_class = ALGORITHMS[name.lower().replace("-", "_")]
+    except KeyError:
+        raise ValueError(
+            f"Unknown rate limit algorithm: {name} "
+            f"(expected one of {', '.join(ALGORITHMS)})"
+        )
+    return algorithm_class(limit, window)
+
+
+IDENTITIES = ("ip", "user", "api_key")
+
+
+class RateLimitPolicy:
+    """
+    Compiled rate limits for the whole application or a single route
+
+    Identity overrides are resolved with one dict lookup, so rate limit
+    strings are never parsed on the request path.
+    """
+
+    __slots__ = ("default", "overrides")
+
+    def __init__(
+        self,
+        default: RateLimitAlgorithm,
+        overrides: Optional[Dict[str, RateLimitAlgorithm]] = None,
+    ) -> None:
+        self.default = default
+        self.overrides = overrides or {}
+
+    @classmethod
+    def compile(
+        cls,
+        spec: RateLimitSpec,
+        algorithm: str = "sliding_window",
+        overrides: Optional[Mapping[str, str]] = None,
+    ) -> "RateLimitPolicy":
+        """Build a policy from a rate limit string or identity table"""
+        limits = {"default": spec} if isinstance(spec, str) else dict(spec)
+        limits.update(overrides or {})
+        if "default" not in limits:
+            raise ValueError("Rate limit policy table needs a 'default' entry")
+
+        compiled: Dict[str, RateLimitAlgorithm] = {}
+        for identity, rate_limit in limits.items():
+            if identity != "default" and identity.split(":", 1)[0] not in IDENTITIES:
+                raise ValueError(
+                    f"Invalid rate limit identity: {identity} "
+                    f"(expected ip:..., user:... or api_key:...)"
+                )
+            compiled[identity] = get_algorithm(algorithm, *parse_rate_limit(rate_limit))
+        return cls(compiled.pop("default"), compiled)
+
+    def resolve(self, identity: str) -> RateLimitAlgorithm:
+        return self.overrides.get(identity, self.default)
+
+
+class RateLimitMiddleware:
+    """
+    Rate limiting middleware
+
+    Clients are identified by ``key``: ``ip`` (default), ``user`` (the
+    authenticated JWT subject), ``api_key`` (the ``api_key_header`` value) or
+    ``auto`` (user, then API key). Unidentified clients fall back to their IP.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        rate_limit: RateLimitSpec = "100/minute",
+        algorithm: str = "sliding_window",
+        max_keys: int = 100_000,
+        store: Optional[RateLimitStore] = None,
+        key: str = "ip",
+        policies: Optional[Mapping[str, str]] = None,
+        api_key_header: str = "X-API-Key",
+        namespace: str = "",
+        rejections: Optional["Counter"] = None,
+    ) -> None:
+        self.app = app
         self.rate_limit = rate_limit
-        self.requests: Dict[str, list] = defaultdict(list)
-        self.limit, self.window = self._parse_rate_limit(rate_limit)
+        self.policy = RateLimitPolicy.compile(rate_limit, algorithm, policies)
+        self.algorithm = self.policy.default
+        self.limit, self.window = self.algorithm.limit, self.algorithm.window
+        self.store = store or MemoryStore(max_keys=max_keys)
+        # Route level limiters prefix their keys and take precedence when
+        # setting the X-RateLimit-* headers
+        self.namespace = namespace
+        self.api_key_header = api_key_header.lower().encode("latin-1")
+        self._identify = self._get_identifier(key)
+        # Metrics counter incremented for every rejected request
+        self.rejections = rejections
 
     def _parse_rate_limit(self, rate_limit: str) -> Tuple[int, int]:
         """Parse rate limit string like '100/minute' into
         (limit, window_seconds)"""
-        match = re.match(r"(\d+)/(second|minute|hour|day)", rate_limit.lower())
-        if not match:
-            raise ValueError(f"Invalid rate limit format: {rate_limit}")
-
-        limit = int(match.group(1))
-        unit = match.group(2)
-
-        window_seconds = {
-            "second": 1,
-            "minute": 60,
-            "hour": 3600,
-            "day": 86400,
-        }[unit]
+        return parse_rate_limit(rate_limit)
 
-        return limit, window_seconds
-
-    def _get_client_ip(self, request: Request) -> str:
+    def _get_client_ip(self, scope: Scope) -> str:
         """Get client IP address"""
-        forwarded_for = request.headers.get("X-Forwarded-For")
+        forwarded_for = Headers(scope=scope).get("X-Forwarded-For")
         if forwarded_for:
             return forwarded_for.split(",")[0].strip()
-        return request.client.host if request.client else "unknown"
+        client = scope.get("client")
+        return client[0] if client else "unknown"
 
-    def _is_rate_limited(self, client_ip: str) -> bool:
-        """Check if client is rate limited"""
-        current_time = time.time()
+    def _get_identifier(self, key: str) -> Callable[[Scope], str]:
+        """Pick the identity function for ``key`` once, at startup"""
+        get_ip = self._get_client_ip
+
+        def by_ip(scope: Scope) -> str:
+            return "ip:" + get_ip(scope)
+
+        def by_user(scope: Scope) -> str:
+            user = scope.get("user")
+            if user is not None and user.is_authenticated:
+                return "user:" + str(user.display_name)
+            return by_ip(scope)
+
+        def by_api_key(scope: Scope) -> str:
+            header = self.api_key_header
+            for name, value in scope["headers"]:
+                if name == header:
+                    return "api_key:" + str(value.decode("latin-1"))
+            return by_ip(scope)
 
-        # Clean old requests outside the window
-        self.requests[client_ip] = [
-            req_time
-            for req_time in self.requests[client_ip]
-            if current_time - req_time < self.window
-        ]
+        def auto(scope: Scope) -> str:
+            user = scope.get("user")
+            if user is not None and user.is_authenticated:
+                return "user:" + str(user.display_name)
+            return by_api_key(scope)
+
+        identifiers = {"ip": by_ip, "user": by_user, "api_key": by_api_key}
+        identifiers["auto"] = auto
+        try:
+            return identifiers[key]
+        except KeyError:
+            raise ValueError(
+                f"Invalid rate limit key: {key} "
+                f"(expected one of {', '.join(identifiers)})"
+            )
+
+    async def _hit(self, identity: str) -> Tuple[RateLimitAlgorithm, Decision]:
+        """Record a request for an identity, returning the applied limit and
+        (allowed, remaining, retry_after)"""
+        algorithm = self.policy.resolve(identity)
+        decision = await self.store.hit(
+            self.namespace + identity, algorithm, time.time()
+        )
+        return algorithm, decision
+
+    async def _is_rate_limited(self, client_ip: str) -> bool:
+        """Check if client is rate limited"""
+        return not (await self._hit("ip:" + client_ip))[1][0]
 
-        # Check if limit exceeded
-        if len(self.requests[client_ip]) >= self.limit:
-            return True
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self.app(scope, self._lifespan_receive(receive), send)
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # Add current request
-        self.requests[client_ip].append(current_time)
-        return False
+        if self.namespace:
+            # Set before deciding, so the global limiter leaves the headers
+            # of this route's 429 alone too
+            scope["zestapi.route_rate_limit"] = True
 
-    async def dispatch(self, request: Request, call_next: Any) -> Response:
-        client_ip = self._get_client_ip(request)
+        algorithm, (allowed, remaining, retry_after) = await self._hit(
+            self._identify(scope)
+        )
 
-        if self._is_rate_limited(client_ip):
-            return JSONResponse(
+        if not allowed:
+            if self.rejections is not None:
+                self.rejections.inc()
+            response = JSONResponse(
                 status_code=429,
                 content={
                     "error": {
@@ -74,18 +374,93 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                     }
                 },
                 headers={
-                    "X-RateLimit-Limit": str(self.limit),
-                    "X-RateLimit-Window": str(self.window),
-                    "Retry-After": str(self.window),
+                    "X-RateLimit-Limit": str(algorithm.limit),
+                    "X-RateLimit-Window": str(algorithm.window),
+                    "Retry-After": str(max(1, math.ceil(retry_after))),
                 },
             )
+            await response(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and (
+                self.namespace or "zestapi.route_rate_limit" not in scope
+            ):
+                # Add rate limit headers to response
+                set_response_headers(
+                    message,
+                    [
+                        (b"x-ratelimit-limit", algorithm.limit_header),
+                        (b"x-ratelimit-remaining", str(remaining).encode("latin-1")),
+                        (b"x-ratelimit-window", algorithm.window_header),
+                    ],
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _lifespan_receive(self, receive: Receive) -> Receive:
+        """Close the store when the application shuts down"""
+
+        async def wrapped() -> Message:
+            message = await receive()
+            if message["type"] == "lifespan.shutdown":
+                await self.store.close()
+            return message
+
+        return wrapped
+
+
+def route_rate_limit(route: BaseRoute) -> Optional[RateLimitSpec]:
+    """Rate limit declared for a route with ``@route(..., rate_limit=...)``"""
+    endpoint = getattr(route, "endpoint", None)
+    route_info = getattr(endpoint, "__route__", None)
+    if isinstance(route_info, dict):
+        return route_info.get("rate_limit")
+    return None
+
+
+def apply_route_rate_limits(
+    routes: List[BaseRoute],
+    limits: Mapping[int, RateLimitSpec],
+    store: RateLimitStore,
+    metrics: Optional["MetricsRegistry"] = None,
+    **options: Any,
+) -> int:
+    """
+    Wrap the ASGI app of every rate limited route in a compiled limiter
 
-        response = await call_next(request)
+    ``limits`` maps ``id(route)`` to explicit limits; routes not listed use
+    the limit declared on their endpoint. Rejections are counted in
+    ``metrics`` when given. Returns the number of limited routes.
+    """
+    count = 0
+    for route in routes:
+        spec = limits.get(id(route)) or route_rate_limit(route)
+        if not spec or not isinstance(route, Route):
+            continue
+        # Routes sharing a path (e.g. GET and POST /items) have their own
+        # limits, so their counters are kept apart by method as well
+        methods = ",".join(sorted(route.methods or ()))
+        route.app = RateLimitMiddleware(
+            route.app,
+            rate_limit=spec,
+            store=store,
+            namespace=f"route:{methods}:{route.path}:",
+            rejections=(
+                rate_limit_rejections(metrics, route.path) if metrics else None
+            ),
+            **options,
+        )
+        count += 1
+    return count
 
-        # Add rate limit headers to response
-        remaining = max(0, self.limit - len(self.requests[client_ip]))
-        response.headers["X-RateLimit-Limit"] = str(self.limit)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Window"] = str(self.window)
 
-        return response  # type: ignore
+def rate_limit_rejections(metrics: "MetricsRegistry", route: str = "*") -> "Counter":
+    """Counter of requests rejected by the global (``route="*"``) or a
+    route's limiter"""
+    return metrics.counter(
+        "zestapi_rate_limit_rejections_total",
+        "Requests rejected by rate limiting",
+        {"route": route},
+    )
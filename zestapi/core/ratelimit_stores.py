@@ -0,0 +1,716 @@
+"""
+Storage backends for rate limiter state
+
+The in-process ``MemoryStore`` is the default. ``SharedMemoryStore`` and
+``RedisStore`` share limiter state between worker processes so the
+configured limit holds for the whole deployment instead of per worker.
+"""
+
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+if TYPE_CHECKING:
+    from .ratelimit import RateLimitAlgorithm, State
+
+logger = logging.getLogger(__name__)
+
+# (allowed, remaining, retry_after_seconds)
+Decision = Tuple[bool, int, float]
+
+
+class RateLimitStore:
+    """Base class for rate limiter state storage"""
+
+    async def hit(
+        self, key: str, algorithm: "RateLimitAlgorithm", now: float
+    ) -> Decision:
+        """Apply one request for ``key`` to the stored state"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Release resources held by the store"""
+
+
+class MemoryStore(RateLimitStore):
+    """
+    Per-process store keeping each key's state in an LRU ordered dict
+
+    Every hit evicts a bounded number of expired keys from the least recently
+    seen end, and ``max_keys`` caps the number of tracked keys.
+    """
+
+    # Maximum number of expired keys evicted per request
+    SWEEP_BATCH = 8
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        # key -> (expires_at, state), least recently seen first
+        self.states: "OrderedDict[str, Tuple[float, State]]" = OrderedDict()
+
+    async def hit(
+        self, key: str, algorithm: "RateLimitAlgorithm", now: float
+    ) -> Decision:
+        states = self.states
+        entry = states.pop(key, None)
+        allowed, state, remaining, retry_after = algorithm.hit(
+            entry[1] if entry is not None else None, now
+        )
+        states[key] = (algorithm.expires_at(state), state)
+        self._sweep(now)
+        return allowed, remaining, retry_after
+
+    def _sweep(self, now: float) -> None:
+        """Evict a bounded number of expired keys and enforce the key cap"""
+        states = self.states
+        expired = []
+        for key, (expires_at, _) in states.items():
+            if expires_at > now:
+                break
+            expired.append(key)
+            if len(expired) >= self.SWEEP_BATCH:
+                break
+        for key in expired:
+            del states[key]
+
+        while len(states) > self.max_keys:
+            states.popitem(last=False)
+
+
+def _default_table_path(name: Optional[str] = None) -> str:
+    """
+    Table path for the application ``name``
+
+    Without a name, one is derived from the working directory, so workers of
+    one deployment share a table but different applications on the host do
+    not.
+    """
+    if not name:
+        name = hashlib.blake2b(os.getcwd().encode("utf-8"), digest_size=6).hexdigest()
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"zestapi-ratelimit-{name}")
+
+
+class SharedMemoryStore(RateLimitStore):
+    """
+    Fixed-size hash table in a memory-mapped file shared by all workers on a
+    host
+
+    Each slot holds a 64-bit key hash, the state's expiry time and up to three
+    state values. Keys are placed by linear probing; when all probe slots are
+    held by live keys, the one expiring first is evicted. Access is
+    serialized between processes with ``flock``; when another process holds
+    the lock, it is waited for in a thread instead of on the event loop.
+    """
+
+    MAGIC = b"ZRLSTOR1"
+    HEADER = struct.Struct("<8sQ")
+    SLOT = struct.Struct("<Q4d")
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        slots: int = 65536,
+        max_probes: int = 8,
+        name: Optional[str] = None,
+    ) -> None:
+        try:
+            import fcntl
+        except ImportError:
+            raise ImportError(
+                "The shared memory rate limit store requires a POSIX system "
+                "with fcntl support"
+            )
+        if slots < 1:
+            raise ValueError("Shared memory rate limit table needs at least 1 slot")
+
+        self._fcntl = fcntl
+        self.path = path or _default_table_path(name)
+        self.slots = slots
+        self.max_probes = max(1, min(max_probes, slots))
+        self._fd = -1
+        self._mmap: Optional[mmap.mmap] = None
+        self._pid = -1
+        self._open()
+
+    def _open(self) -> None:
+        """Open (or create) the table file and map it into memory"""
+        fcntl = self._fcntl
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.ftruncate(fd, self.HEADER.size + self.slots * self.SLOT.size)
+                os.pwrite(fd, self.HEADER.pack(self.MAGIC, self.slots), 0)
+            else:
+                magic, slots = self.HEADER.unpack(os.pread(fd, self.HEADER.size, 0))
+                if magic != self.MAGIC:
+                    raise ValueError(f"{self.path} is not a rate limit table")
+                # Workers must agree on the layout, so adopt the existing size
+                self.slots = slots
+                self.max_probes = min(self.max_probes, slots)
+        except Exception:
+            os.close(fd)
+            raise
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+        self._fd = fd
+        self._mmap = mmap.mmap(fd, self.HEADER.size + self.slots * self.SLOT.size)
+        self._pid = os.getpid()
+        # flock is held per open file, so coroutines of this process must not
+        # share it: one could release the lock another is relying on
+        self._lock = asyncio.Lock()
+
+    async def _acquire(self) -> None:
+        """Take the table lock without blocking the event loop"""
+        fcntl = self._fcntl
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            pass
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, fcntl.flock, self._fd, fcntl.LOCK_EX)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The thread takes the lock regardless; wait for it and release
+            # it before giving up, or other workers stay blocked
+            while not future.done():
+                try:
+                    await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    continue
+            if not future.cancelled() and future.exception() is None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            raise
+
+    async def hit(
+        self, key: str, algorithm: "RateLimitAlgorithm", now: float
+    ) -> Decision:
+        if self._pid != os.getpid():
+            # flock is held per open file, so forked workers need their own
+            await self.close()
+            self._open()
+
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, "little") or 1
+        mm = self._mmap
+        assert mm is not None
+
+        async with self._lock:
+            await self._acquire()
+            try:
+                return self._hit_locked(mm, key_hash, algorithm, now)
+            finally:
+                self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _hit_locked(
+        self,
+        mm: mmap.mmap,
+        key_hash: int,
+        algorithm: "RateLimitAlgorithm",
+        now: float,
+    ) -> Decision:
+        slot = self.SLOT
+        size = algorithm.state_size
+        base = key_hash % self.slots
+        target = -1
+        target_expires = float("inf")
+        state: Optional["State"] = None
+        for probe in range(self.max_probes):
+            offset = self.HEADER.size + ((base + probe) % self.slots) * slot.size
+            slot_hash, expires_at, *values = slot.unpack_from(mm, offset)
+            if slot_hash == key_hash:
+                target = offset
+                if expires_at > now:
+                    state = tuple(values[:size])
+                break
+            if expires_at < target_expires:
+                target, target_expires = offset, expires_at
+            if slot_hash == 0:
+                # Slots are never cleared, so no key was probed past here
+                break
+
+        allowed, state, remaining, retry_after = algorithm.hit(state, now)
+        values = list(state) + [0.0] * (3 - size)
+        slot.pack_into(mm, target, key_hash, algorithm.expires_at(state), *values)
+        return allowed, remaining, retry_after
+
+    async def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class RedisError(Exception):
+    """Error reply from a Redis server"""
+
+
+class RedisConnection:
+    """
+    Minimal pipelining RESP2 client
+
+    Commands issued during the same event loop iteration are written to the
+    socket in a single batch; replies are matched to callers in order.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._buffer: List[bytes] = []
+        self._flush_scheduled = False
+        self._read_task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._read_task = asyncio.ensure_future(self._read_loop())
+        if self.password:
+            await self.execute("AUTH", self.password)
+        if self.db:
+            await self.execute("SELECT", self.db)
+
+    def send(self, *args: Any) -> "asyncio.Future[Any]":
+        """Queue a command and return a future for its reply"""
+        if not self.connected:
+            raise ConnectionError("Redis connection is closed")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._buffer.append(self._encode(args))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return future
+
+    async def execute(self, *args: Any) -> Any:
+        return await self.send(*args)
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        if self._buffer and self._writer is not None:
+            self._writer.write(b"".join(self._buffer))
+            self._buffer.clear()
+
+    @staticmethod
+    def _encode(args: Tuple[Any, ...]) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                reply = await self._read_reply()
+                future = self._waiters.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, RedisError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except Exception as exc:
+            self._fail_waiters(exc)
+        finally:
+            await self._close_transport()
+
+    async def _read_reply(self) -> Any:
+        assert self._reader is not None
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed by server")
+
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            return RedisError(payload.decode("utf-8"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def _fail_waiters(self, exc: Exception) -> None:
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(f"Redis connection lost: {exc}"))
+
+    async def _close_transport(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._read_task = None
+        await self._close_transport()
+        self._fail_waiters(ConnectionError("closed"))
+
+
+# Atomic limiter scripts. All take KEYS[1] = key and
+# ARGV = now, limit, window, increment, force, and return
+# {allowed, remaining, retry_after, ...}. Floats are returned as strings
+# because Redis truncates Lua numbers to integers.
+SCRIPTS: Dict[str, str] = {
+    "sliding_window": """
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local increment = tonumber(ARGV[4])
+local force = ARGV[5] == "1"
+local start = math.floor(now / window) * window
+local state = redis.call("HMGET", KEYS[1], "s", "p", "c")
+local previous, current = 0, 0
+local stored = tonumber(state[1])
+if stored == start then
+  previous = tonumber(state[2])
+  current = tonumber(state[3])
+elseif stored == start - window then
+  previous = tonumber(state[3])
+end
+local elapsed = now - start
+local estimated = previous * (1 - elapsed / window) + current
+local allowed, remaining, retry = 1, 0, 0
+if not force and estimated >= limit then
+  allowed = 0
+  if current >= limit or previous <= 0 then
+    retry = window - elapsed
+  else
+    retry = math.max(0, window * (1 - (limit - current) / previous) - elapsed)
+  end
+else
+  current = current + increment
+  remaining = math.max(0, math.floor(limit - (estimated + increment)))
+end
+redis.call("HSET", KEYS[1], "s", start, "p", previous, "c", current)
+redis.call("PEXPIRE", KEYS[1], math.ceil((start + 2 * window - now) * 1000))
+return {allowed, remaining, tostring(retry), tostring(start),
+        tostring(previous), tostring(current)}
+""",
+    "token_bucket": """
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local rate = limit / window
+local state = redis.call("HMGET", KEYS[1], "t", "l")
+local tokens = limit
+if state[1] then
+  tokens = math.min(limit, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+end
+local allowed, remaining, retry = 0, 0, 0
+if tokens < 1 then
+  retry = (1 - tokens) / rate
+else
+  allowed = 1
+  tokens = tokens - 1
+  remaining = math.floor(tokens)
+end
+redis.call("HSET", KEYS[1], "t", tokens, "l", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(window * 1000))
+return {allowed, remaining, tostring(retry)}
+""",
+    "gcra": """
+local now = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local interval = window / limit
+local tat = tonumber(redis.call("GET", KEYS[1])) or now
+if tat < now then
+  tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - window
+if now < allow_at then
+  return {0, 0, tostring(allow_at - now)}
+end
+redis.call("SET", KEYS[1], new_tat, "PX", math.ceil((new_tat - now) * 1000))
+return {1, math.max(0, math.floor((window - (new_tat - now)) / interval + 1e-9)), "0"}
+""",
+}
+
+SCRIPT_SHAS: Dict[str, str] = {
+    name: hashlib.sha1(source.encode("utf-8")).hexdigest()
+    for name, source in SCRIPTS.items()
+}
+
+
+class RedisStore(RateLimitStore):
+    """
+    Store backed by a Redis-protocol server using atomic Lua scripts
+
+    Script calls from concurrent requests are pipelined into a single write.
+    With ``flush_interval`` set, the sliding window algorithm decides locally
+    from the last known global counts and flushes batched increments every
+    ``flush_interval`` seconds, so most requests need no round trip at all.
+
+    The store fails open: if the server is unreachable requests are allowed
+    and a warning is logged.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "zestapi:ratelimit:",
+        flush_interval: float = 0.0,
+        timeout: float = 1.0,
+    ) -> None:
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Invalid Redis URL: {url}")
+
+        self.url = url
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self._connection = RedisConnection(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+        )
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._available = True
+        # key -> [window_start, previous, current, pending, last_seen]
+        self._local: Dict[str, List[float]] = {}
+        self._local_algorithms: Dict[str, "RateLimitAlgorithm"] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def hit(
+        self, key: str, algorithm: "RateLimitAlgorithm", now: float
+    ) -> Decision:
+        if self.flush_interval > 0 and algorithm.name == "sliding_window":
+            local = self._local.get(key)
+            if local is not None:
+                return self._hit_local(key, local, algorithm, now)
+
+        try:
+            reply = await asyncio.wait_for(
+                self._eval(algorithm, key, now, 1, False), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError, RedisError) as exc:
+            self._mark_unavailable(exc)
+            return True, algorithm.limit, 0.0
+
+        self._available = True
+        if self.flush_interval > 0 and algorithm.name == "sliding_window":
+            # Seed the local view from the authoritative counts
+            self._local[key] = [
+                float(reply[3]),
+                float(reply[4]),
+                float(reply[5]),
+                0.0,
+                now,
+            ]
+            self._local_algorithms[key] = algorithm
+            self._ensure_flush_task()
+        return bool(reply[0]), int(reply[1]), float(reply[2])
+
+    def _hit_local(
+        self,
+        key: str,
+        local: List[float],
+        algorithm: "RateLimitAlgorithm",
+        now: float,
+    ) -> Decision:
+        """Decide from the cached global counts plus unflushed local hits"""
+        window_start, previous, current, pending, _ = local
+        allowed, state, remaining, retry_after = algorithm.hit(
+            (window_start, previous, current + pending), now
+        )
+        if state[0] != window_start:
+            # Rolled into a new window; unflushed hits are counted towards it
+            # when they are flushed
+            local[0], local[1], local[2] = state[0], current if state[1] else 0.0, 0.0
+        if allowed:
+            local[3] = pending + 1
+        local[4] = now
+        return allowed, remaining, retry_after
+
+    async def _eval(
+        self,
+        algorithm: "RateLimitAlgorithm",
+        key: str,
+        now: float,
+        increment: int,
+        force: bool,
+    ) -> Any:
+        connection = await self._get_connection()
+        args = (
+            1,
+            self.prefix + key,
+            repr(now),
+            algorithm.limit,
+            algorithm.window,
+            increment,
+            int(force),
+        )
+        try:
+            return await connection.execute(
+                "EVALSHA", SCRIPT_SHAS[algorithm.name], *args
+            )
+        except RedisError as exc:
+            if not str(exc).startswith("NOSCRIPT"):
+                raise
+            # EVAL also adds the script to the server's cache
+            return await connection.execute("EVAL", SCRIPTS[algorithm.name], *args)
+
+    async def _get_connection(self) -> RedisConnection:
+        if self._connection.connected:
+            return self._connection
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if not self._connection.connected:
+                await self._connection.connect()
+        return self._connection
+
+    def _mark_unavailable(self, exc: Exception) -> None:
+        if self._available:
+            logger.warning(
+                "Rate limit store %s unavailable, allowing requests: %s",
+                self.url,
+                exc,
+            )
+        self._available = False
+
+    def _ensure_flush_task(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self._mark_unavailable(exc)
+
+    async def flush(self) -> None:
+        """Send batched local increments and refresh the cached counts"""
+        now = time.time()
+        keys = []
+        calls = []
+        for key, local in list(self._local.items()):
+            algorithm = self._local_algorithms[key]
+            pending = int(local[3])
+            if pending == 0:
+                if now - local[4] > 2 * algorithm.window:
+                    # Idle key: forget the local view
+                    del self._local[key]
+                    del self._local_algorithms[key]
+                continue
+            keys.append((key, pending))
+            calls.append(self._eval(algorithm, key, now, pending, True))
+
+        if not calls:
+            return
+
+        replies = await asyncio.wait_for(
+            asyncio.gather(*calls, return_exceptions=True), self.timeout
+        )
+        for (key, pending), reply in zip(keys, replies):
+            current = self._local.get(key)
+            if current is None or isinstance(reply, BaseException):
+                continue
+            local = current
+            local[0], local[1], local[2] = (
+                float(reply[3]),
+                float(reply[4]),
+                float(reply[5]),
+            )
+            local[3] -= pending
+        self._available = True
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._flush_task = None
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.warning("Failed to flush rate limit counters: %s", exc)
+        await self._connection.close()
+
+
+def create_store(url: str = "memory://", max_keys: int = 100_000) -> RateLimitStore:
+    """
+    Create a rate limit store from a URL
+
+    - ``memory://`` -- per-process store (default)
+    - ``mmap://[/path/to/table][?slots=65536][&name=myapp]`` -- shared by
+      workers on a host; ``name`` picks the default table path
+    - ``redis://[:password@]host[:port][/db][?flush_interval=0.05]``
+    """
+    parsed = urlparse(url or "memory://")
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+    if parsed.scheme == "memory":
+        return MemoryStore(max_keys=max_keys)
+    if parsed.scheme == "mmap":
+        return SharedMemoryStore(
+            path=parsed.path or None,
+            slots=int(options.get("slots", 65536)),
+            name=options.get("name"),
+        )
+    if parsed.scheme == "redis":
+        redis_url = parsed._replace(query="").geturl()
+        return RedisStore(
+            redis_url,
+            prefix=options.get("prefix", "zestapi:ratelimit:"),
+            flush_interval=float(options.get("flush_interval", 0.0)),
+        )
+    raise ValueError(f"Unsupported rate limit storage: {url}")
@@ -0,0 +1,193 @@
+"""
+Request ID generation
+
+Request IDs are made by one generator per application and shared by the
+access log, error responses and (for span IDs and new trace IDs) tracing.
+Modes:
+
+- ``counter``: a random per-process prefix and a counter, e.g.
+  ``3f9c2a1b-1f``. The cheapest; unique across workers with high
+  probability, ordered within one.
+- ``ulid``: 26-character ULIDs (48-bit millisecond time, 80 random bits),
+  sortable by creation time.
+- ``uuid7``: time-ordered RFC 9562 UUIDv7 strings.
+
+Any mode can first honour a client's ``X-Request-ID``, for requests arriving
+through a proxy or another service that already assigned one.
+
+Random bits come from ``random_pool``, which reads ``os.urandom`` a few
+kilobytes at a time instead of once per ID.
+"""
+
+import itertools
+import os
+import threading
+import time
+from typing import Dict, Optional, Type
+
+from starlette.types import Scope
+
+REQUEST_ID_MODES = ("counter", "ulid", "uuid7")
+
+# Crockford's base32, as used by ULIDs
+_ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+# Longest incoming request ID accepted
+MAX_HEADER_LENGTH = 128
+
+
+class RandomPool:
+    """
+    Random bytes from ``os.urandom``, read ``size`` bytes at a time
+
+    The pool is discarded in forked children so that workers never hand out
+    the same bytes as their parent; ``generation`` counts the forks.
+    """
+
+    def __init__(self, size: int = 4096) -> None:
+        self.size = size
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._buffer = b""
+        self._offset = 0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._discard)
+
+    def _discard(self) -> None:
+        self._lock = threading.Lock()
+        self._buffer = b""
+        self._offset = 0
+        self.generation += 1
+
+    def read(self, count: int) -> bytes:
+        with self._lock:
+            end = self._offset + count
+            if end > len(self._buffer):
+                self._buffer = os.urandom(max(self.size, count))
+                self._offset, end = 0, count
+            chunk = self._buffer[self._offset : end]
+            self._offset = end
+        return chunk
+
+    def randbits(self, bits: int) -> int:
+        """A random non-negative integer of at most ``bits`` bits"""
+        return int.from_bytes(self.read((bits + 7) // 8), "big") >> (-bits % 8)
+
+    def hex_id(self, length: int) -> str:
+        """A random lower-case hex string of ``length`` characters, never all
+        zeros (trace and span IDs)"""
+        while True:
+            value = self.read(length // 2).hex()
+            if value.strip("0"):
+                return value
+
+
+# Shared by request IDs and tracing
+random_pool = RandomPool()
+
+
+class RequestIdGenerator:
+    """
+    Base class of request ID generators
+
+    Call with the request's scope to get its ID. With ``trust_header``, a
+    valid ``X-Request-ID`` header (printable ASCII, at most 128 characters)
+    is used as the ID instead of generating one.
+    """
+
+    def __init__(self, trust_header: bool = False) -> None:
+        self.trust_header = trust_header
+
+    def __call__(self, scope: Optional[Scope] = None) -> str:
+        if self.trust_header and scope is not None:
+            incoming = incoming_request_id(scope)
+            if incoming is not None:
+                return incoming
+        return self.new_id()
+
+    def new_id(self) -> str:
+        raise NotImplementedError
+
+
+def incoming_request_id(scope: Scope) -> Optional[str]:
+    """The request's ``X-Request-ID`` header, if it is safe to reuse"""
+    for name, value in scope.get("headers", ()):
+        if name == b"x-request-id":
+            if 0 < len(value) <= MAX_HEADER_LENGTH and all(
+                0x21 <= byte <= 0x7E for byte in value
+            ):
+                request_id: str = value.decode("ascii")
+                return request_id
+            return None
+    return None
+
+
+class CounterRequestIds(RequestIdGenerator):
+    """``<process prefix>-<counter in hex>``, a new prefix in every
+    process"""
+
+    def __init__(self, trust_header: bool = False) -> None:
+        super().__init__(trust_header)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.prefix = random_pool.hex_id(8)
+        self._counter = itertools.count(1)
+        self._generation = random_pool.generation
+
+    def new_id(self) -> str:
+        if self._generation != random_pool.generation:
+            # Forked since the prefix was chosen
+            self._reset()
+        return f"{self.prefix}-{next(self._counter):x}"
+
+
+class ULIDRequestIds(RequestIdGenerator):
+    """Crockford base32 ULIDs"""
+
+    def new_id(self) -> str:
+        value = (time.time_ns() // 1_000_000) << 80 | random_pool.randbits(80)
+        chars = []
+        for _ in range(26):
+            chars.append(_ULID_ALPHABET[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+
+class UUID7RequestIds(RequestIdGenerator):
+    """UUIDv7 strings: 48-bit millisecond time, version, 74 random bits"""
+
+    def new_id(self) -> str:
+        random_bits = random_pool.randbits(74)
+        value = (
+            (time.time_ns() // 1_000_000) << 80
+            | 0x7 << 76
+            | (random_bits >> 62) << 64
+            | 0b10 << 62
+            | (random_bits & ((1 << 62) - 1))
+        )
+        text = f"{value:032x}"
+        return f"{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}"
+
+
+_GENERATORS: Dict[str, Type[RequestIdGenerator]] = {
+    "counter": CounterRequestIds,
+    "ulid": ULIDRequestIds,
+    "uuid7": UUID7RequestIds,
+}
+
+
+def create_request_id_generator(
+    mode: str = "counter", trust_header: bool = False
+) -> RequestIdGenerator:
+    """Generator for a ``REQUEST_ID_MODES`` mode"""
+    generator_class = _GENERATORS.get(mode)
+    if generator_class is None:
+        raise ValueError(
+            f"Unknown request ID mode: {mode} (expected one of {REQUEST_ID_MODES})"
+        )
+    return generator_class(trust_header=trust_header)
+
+
+# Used by middleware created without a generator
+default_request_ids = CounterRequestIds()
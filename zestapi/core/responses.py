@@ -1,13 +1,316 @@
-from typing import Any
+import asyncio
+import functools
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Union,
+)
 
 import orjson
-from starlette.responses import JSONResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.types import Message, Receive, Scope, Send
+
+from .conditional import (
+    compute_etag,
+    etag_matches,
+    not_modified_headers,
+    request_if_none_match,
+)
+from .profiling import current_timer
+
+STREAM_FORMATS = ("array", "ndjson")
 
 
 class ORJSONResponse(JSONResponse):
-    """High-performance JSON response using orjson for serialization"""
+    """
+    High-performance JSON response using orjson for serialization
+
+    With ``etag=True`` the response gets an ETag hashed from its body, or
+    pass ``etag`` a precomputed one (see ``version_etag``). Requests whose
+    ``If-None-Match`` matches the ETag are answered with an empty 304.
+    """
 
     media_type = "application/json"
 
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        background: Optional[BackgroundTask] = None,
+        etag: Union[bool, str] = False,
+    ) -> None:
+        super().__init__(content, status_code, headers, media_type, background)
+        self.etag: Optional[str] = None
+        if etag:
+            self.etag = compute_etag(self.body) if etag is True else str(etag)
+            self.headers["etag"] = self.etag
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.not_modified(scope):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": not_modified_headers(self.raw_headers),
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            if self.background is not None:
+                await self.background()
+            return
+        await super().__call__(scope, receive, send)
+
+    def not_modified(self, scope: Scope) -> bool:
+        """Whether the request's ``If-None-Match`` matches the ETag"""
+        if self.etag is None or self.status_code != 200:
+            return False
+        if_none_match = request_if_none_match(scope)
+        return if_none_match is not None and etag_matches(if_none_match, self.etag)
+
     def render(self, content: Any) -> bytes:
-        return orjson.dumps(content)
+        timer = current_timer()
+        if timer is None:
+            return orjson.dumps(content)
+        previous = timer.enter("serialization")
+        try:
+            return orjson.dumps(content)
+        finally:
+            timer.enter(previous)
+
+
+class StaticJSONResponse(ORJSONResponse):
+    """
+    JSON response rendered once and sent unchanged to every request
+
+    Create it once, e.g. at module level, and return the same instance from
+    the handler. The body, raw headers and ASGI messages (and with ``etag``
+    the 304 answer) are built in the constructor, so a request only sends
+    copies of two prebuilt messages; they are copied because middleware may
+    add headers to them.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        etag: Union[bool, str] = False,
+    ) -> None:
+        super().__init__(content, status_code, headers, media_type, etag=etag)
+        self._build_messages()
+
+    @classmethod
+    def from_response(cls, response: Response) -> "StaticJSONResponse":
+        """Replay an already rendered response"""
+        body = getattr(response, "body", None)
+        if not isinstance(body, bytes) or response.background is not None:
+            raise TypeError(
+                f"Cannot replay {type(response).__name__}: static responses need "
+                f"a rendered body and no background task"
+            )
+        static = cls.__new__(cls)
+        static.status_code = response.status_code
+        static.body = body
+        static.background = None
+        static.raw_headers = list(response.raw_headers)
+        static.etag = getattr(response, "etag", None)
+        static._build_messages()
+        return static
+
+    def _build_messages(self) -> None:
+        self._start_message: Message = {
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        }
+        self._body_message: Message = {"type": "http.response.body", "body": self.body}
+        self._not_modified_message: Message = {
+            "type": "http.response.start",
+            "status": 304,
+            "headers": not_modified_headers(self.raw_headers),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.not_modified(scope):
+            start = self._not_modified_message
+            await send({**start, "headers": list(start["headers"])})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({**self._start_message, "headers": list(self.raw_headers)})
+        await send(dict(self._body_message))
+
+
+def static_endpoint(func: Callable[[Request], Awaitable[Response]]) -> Any:
+    """
+    Endpoint calling ``func`` until it returns a 2xx response
+
+    Nothing is rendered when the endpoint is created, since ``func`` needs a
+    request; to render at import time, return a module-level
+    ``StaticJSONResponse`` instead. The first 2xx response (which must have
+    a rendered body and no background task) is replayed to every later
+    request as a ``StaticJSONResponse``. Requests arriving while the first
+    call runs wait for it instead of calling ``func`` too; other responses,
+    such as a 503 from a health check that is not ready yet, are returned
+    once and not stored.
+    """
+    static: Optional[StaticJSONResponse] = None
+    filling: "Optional[asyncio.Future[Response]]" = None
+
+    async def fill(request: Request) -> Response:
+        nonlocal static
+        response = await func(request)
+        if not 200 <= response.status_code < 300:
+            return response
+        if not isinstance(response, StaticJSONResponse):
+            response = StaticJSONResponse.from_response(response)
+        static = response
+        return response
+
+    def filled(future: "asyncio.Future[Response]") -> None:
+        nonlocal filling
+        filling = None
+        if not future.cancelled():
+            # Retrieved here too, in case the request that started it is gone
+            future.exception()
+
+    @functools.wraps(func)
+    async def endpoint(request: Request) -> Response:
+        nonlocal filling
+        if static is not None:
+            return static
+        if filling is None:
+            filling = asyncio.ensure_future(fill(request))
+            filling.add_done_callback(filled)
+            return await asyncio.shield(filling)
+        await asyncio.wait([filling])
+        if static is not None:
+            return static
+        # The first call's response was not stored, so render our own
+        return await func(request)
+
+    return endpoint
+
+
+class _BatchEncoder:
+    """Encode items into chunks of at least ``flush_size`` bytes"""
+
+    __slots__ = ("array", "flush_size", "option", "parts", "size", "count")
+
+    def __init__(self, array: bool, flush_size: int, option: int) -> None:
+        self.array = array
+        self.flush_size = flush_size
+        self.option = option
+        self.parts: List[bytes] = [b"["] if array else []
+        self.size = 0
+        self.count = 0
+
+    def add(self, item: Any) -> Optional[bytes]:
+        """Encode ``item``, returning a chunk once enough bytes are buffered"""
+        data = orjson.dumps(item, option=self.option)
+        if self.array and self.count:
+            self.parts.append(b",")
+        self.parts.append(data)
+        self.count += 1
+        self.size += len(data)
+        if self.size < self.flush_size:
+            return None
+        chunk = b"".join(self.parts)
+        self.parts = []
+        self.size = 0
+        return chunk
+
+    def finish(self) -> bytes:
+        if self.array:
+            self.parts.append(b"]")
+        return b"".join(self.parts)
+
+    def chunks(self, items: Iterator[Any]) -> Iterator[bytes]:
+        for item in items:
+            chunk = self.add(item)
+            if chunk is not None:
+                yield chunk
+        tail = self.finish()
+        if tail:
+            yield tail
+
+
+class ORJSONStreamingResponse(StreamingResponse):
+    """
+    Stream the items of a sync or async iterable as a JSON array or NDJSON
+
+    Items are encoded with orjson and sent in chunks of about ``flush_size``
+    bytes, so memory is bounded by the chunk size rather than the result
+    size. The next chunk is only produced once the previous one has been
+    sent, so a slow client slows down the iteration. Items of sync iterators
+    other than lists and tuples are pulled in a thread pool, one chunk per
+    call, as they may block.
+
+    An error raised by the iterable after the first chunk has been sent
+    can't change the response; the connection is closed, leaving the body
+    incomplete.
+    """
+
+    def __init__(
+        self,
+        content: Union[Iterable[Any], AsyncIterable[Any]],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        format: str = "array",
+        flush_size: int = 65536,
+        option: int = 0,
+        background: Optional[BackgroundTask] = None,
+    ) -> None:
+        if format not in STREAM_FORMATS:
+            raise ValueError(
+                f"Unknown stream format: {format} (expected one of {STREAM_FORMATS})"
+            )
+        ndjson = format == "ndjson"
+        self.encoder = _BatchEncoder(
+            array=not ndjson,
+            flush_size=flush_size,
+            option=option | orjson.OPT_APPEND_NEWLINE if ndjson else option,
+        )
+        super().__init__(
+            self._encode(content),
+            status_code=status_code,
+            headers=headers,
+            media_type="application/x-ndjson" if ndjson else "application/json",
+            background=background,
+        )
+
+    async def _encode(
+        self, content: Union[Iterable[Any], AsyncIterable[Any]]
+    ) -> AsyncIterator[bytes]:
+        encoder = self.encoder
+        if isinstance(content, AsyncIterable):
+            async for item in content:
+                chunk = encoder.add(item)
+                if chunk is not None:
+                    yield chunk
+            tail = encoder.finish()
+            if tail:
+                yield tail
+        elif isinstance(content, (list, tuple)):
+            for chunk in encoder.chunks(iter(content)):
+                yield chunk
+        else:
+            chunks = encoder.chunks(iter(content))
+            while True:
+                chunk = await run_in_threadpool(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
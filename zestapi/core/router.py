@@ -0,0 +1,263 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette._utils import get_route_path
+from starlette.convertors import (
+    Convertor,
+    FloatConvertor,
+    IntegerConvertor,
+    PathConvertor,
+    StringConvertor,
+    UUIDConvertor,
+)
+from starlette.routing import BaseRoute, Route, Router, WebSocketRoute
+from starlette.types import Receive, Scope, Send
+
+# A whole path segment that is a single parameter, e.g. "{item_id:int}"
+PARAM_SEGMENT = re.compile(
+    r"^\{([a-zA-Z_][a-zA-Z0-9_]*)(?::([a-zA-Z_][a-zA-Z0-9_]*))?\}$"
+)
+
+# Parameter segments are tried most specific first, plain strings last
+CONVERTOR_PRIORITY: Dict[type, int] = {
+    IntegerConvertor: 0,
+    UUIDConvertor: 1,
+    FloatConvertor: 2,
+    StringConvertor: 3,
+}
+
+SegmentMatcher = Callable[[str], bool]
+
+
+def _is_ascii_digits(segment: str) -> bool:
+    return segment.isascii() and segment.isdigit()
+
+
+def _segment_matcher(convertor: Convertor) -> SegmentMatcher:
+    """Create a check for a single (non-empty) path segment"""
+    if isinstance(convertor, StringConvertor):
+        return bool
+    if isinstance(convertor, IntegerConvertor):
+        return _is_ascii_digits
+    pattern = re.compile(convertor.regex)
+    return lambda segment: pattern.fullmatch(segment) is not None
+
+
+class _Leaf:
+    """A route terminating at a tree node"""
+
+    __slots__ = ("route", "names", "convertors", "scope_type", "methods")
+
+    def __init__(self, route: BaseRoute, params: List[Tuple[str, Convertor]]) -> None:
+        self.route = route
+        self.names = tuple(name for name, _ in params)
+        self.convertors = tuple(convertor for _, convertor in params)
+        self.scope_type = "websocket" if isinstance(route, WebSocketRoute) else "http"
+        self.methods = getattr(route, "methods", None)
+
+    def accepts(self, scope_type: str, method: Optional[str]) -> bool:
+        if scope_type != self.scope_type:
+            return False
+        return method is None or not self.methods or method in self.methods
+
+    def path_params(self, values: List[str]) -> Dict[str, Any]:
+        return {
+            name: convertor.convert(value)
+            for name, convertor, value in zip(self.names, self.convertors, values)
+        }
+
+
+class _Node:
+    """A radix tree node keyed by path segment"""
+
+    __slots__ = ("static", "params", "catch_all", "leaves")
+
+    def __init__(self) -> None:
+        self.static: Dict[str, "_Node"] = {}
+        # (priority, convertor type, matcher, child)
+        self.params: List[Tuple[int, type, SegmentMatcher, "_Node"]] = []
+        # Routes ending in a {name:path} segment, which consumes the rest
+        self.catch_all: List[_Leaf] = []
+        self.leaves: List[_Leaf] = []
+
+    def param_child(self, convertor: Convertor) -> "_Node":
+        kind = type(convertor)
+        for _, child_kind, _, child in self.params:
+            if child_kind is kind:
+                return child
+        child = _Node()
+        self.params.append(
+            (CONVERTOR_PRIORITY[kind], kind, _segment_matcher(convertor), child)
+        )
+        self.params.sort(key=lambda item: item[0])
+        return child
+
+
+class RadixRouter(Router):
+    """
+    Router that matches requests against a prefix tree of path segments
+
+    Starlette's ``Router`` tries every route's regex in order, so lookups get
+    slower as the route table grows. This router compiles ``Route`` and
+    ``WebSocketRoute`` paths into a tree where static segments are looked up
+    in a dict first and typed parameter segments (``int``, ``uuid``,
+    ``float``, ``str``) are tried after them, with a trailing ``{name:path}``
+    parameter consuming the rest of the path.
+
+    ``request.path_params`` are converted exactly as Starlette does. Routes
+    the tree cannot represent (mounts, hosts, custom convertors, segments
+    mixing text and parameters) keep working through the regular linear
+    match, as do trailing slash redirects. When every route is in the tree,
+    404 and 405 responses are answered without a linear scan.
+    """
+
+    def __init__(self, routes: Optional[Sequence[BaseRoute]] = None, **kwargs: Any):
+        super().__init__(routes, **kwargs)
+        self.compile()
+
+    def compile(self) -> None:
+        """(Re)build the tree from ``self.routes``"""
+        root = _Node()
+        fallback = 0
+        for route in self.routes:
+            if not self._insert(root, route):
+                fallback += 1
+        self._root = root
+        self._compiled_routes = len(self.routes)
+        self.fallback_routes = fallback
+
+    def _insert(self, root: _Node, route: BaseRoute) -> bool:
+        """Add a route to the tree, returning False if it is unsupported"""
+        if type(route) not in (Route, WebSocketRoute):
+            return False
+
+        segments = route.path.split("/")  # type: ignore[attr-defined]
+        param_convertors = route.param_convertors  # type: ignore[attr-defined]
+        nodes: List[Tuple[str, Any]] = []
+        params: List[Tuple[str, Convertor]] = []
+        for position, segment in enumerate(segments):
+            if "{" not in segment and "}" not in segment:
+                nodes.append(("static", segment))
+                continue
+            match = PARAM_SEGMENT.match(segment)
+            if not match:
+                return False
+            convertor = param_convertors[match.group(1)]
+            if isinstance(convertor, PathConvertor):
+                if position != len(segments) - 1:
+                    return False
+                nodes.append(("catch_all", None))
+            elif type(convertor) in CONVERTOR_PRIORITY:
+                nodes.append(("param", convertor))
+            else:
+                return False
+            params.append((match.group(1), convertor))
+
+        node = root
+        leaf = _Leaf(route, params)
+        for kind, value in nodes:
+            if kind == "static":
+                node = node.static.setdefault(value, _Node())
+            elif kind == "param":
+                node = node.param_child(value)
+            else:
+                node.catch_all.append(leaf)
+                return True
+        node.leaves.append(leaf)
+        return True
+
+    def lookup(
+        self, route_path: str, scope_type: str, method: Optional[str]
+    ) -> Optional[Tuple[BaseRoute, Dict[str, Any]]]:
+        """Find the route matching a path and its path parameters
+
+        ``method`` is the HTTP method to match, or None to match any method.
+        """
+        if self._compiled_routes != len(self.routes):
+            # Routes were added after the tree was built
+            self.compile()
+        found = self._search(
+            self._root, route_path.split("/"), 0, [], scope_type, method
+        )
+        if found is None:
+            return None
+        leaf, values = found
+        return leaf.route, leaf.path_params(values)
+
+    def _search(
+        self,
+        node: _Node,
+        segments: List[str],
+        index: int,
+        values: List[str],
+        scope_type: str,
+        method: Optional[str],
+    ) -> Optional[Tuple[_Leaf, List[str]]]:
+        if index == len(segments):
+            for leaf in node.leaves:
+                if leaf.accepts(scope_type, method):
+                    return leaf, values
+            return None
+
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._search(child, segments, index + 1, values, scope_type, method)
+            if found is not None:
+                return found
+
+        if segment:
+            for _, _, matcher, child in node.params:
+                if matcher(segment):
+                    values.append(segment)
+                    found = self._search(
+                        child, segments, index + 1, values, scope_type, method
+                    )
+                    if found is not None:
+                        return found
+                    values.pop()
+
+        for leaf in node.catch_all:
+            if leaf.accepts(scope_type, method):
+                return leaf, values + ["/".join(segments[index:])]
+        return None
+
+    async def app(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await super().app(scope, receive, send)
+            return
+
+        route_path = get_route_path(scope)
+        found = self.lookup(route_path, scope["type"], scope.get("method"))
+        if found is None:
+            if self.fallback_routes or self._redirects(scope, route_path):
+                # Unsupported routes and trailing slash redirects
+                await super().app(scope, receive, send)
+                return
+            # Every route is in the tree, so a route matching the path with
+            # another method answers 405, otherwise it's a 404
+            found = self.lookup(route_path, scope["type"], None)
+            if found is None:
+                scope.setdefault("router", self)
+                await self.default(scope, receive, send)
+                return
+
+        route, matched_params = found
+        if "router" not in scope:
+            scope["router"] = self
+        path_params = dict(scope.get("path_params", {}))
+        path_params.update(matched_params)
+        scope["route"] = route
+        scope["endpoint"] = route.endpoint  # type: ignore[attr-defined]
+        scope["path_params"] = path_params
+        await route.handle(scope, receive, send)
+
+    def _redirects(self, scope: Scope, route_path: str) -> bool:
+        """Check if Starlette would redirect to the path with(out) a slash"""
+        if scope["type"] != "http" or not self.redirect_slashes or route_path == "/":
+            return False
+        if route_path.endswith("/"):
+            route_path = route_path.rstrip("/")
+        else:
+            route_path += "/"
+        return self.lookup(route_path, "http", None) is not None
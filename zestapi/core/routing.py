@@ -1,76 +1,439 @@
+import ast
+import asyncio
 import importlib.util
+import logging
 import os
-from typing import Any, Callable, List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import CodeType, ModuleType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from starlette.routing import BaseRoute, Route, WebSocketRoute
+from starlette.routing import (
+    BaseRoute,
+    Route,
+    WebSocketRoute,
+    request_response,
+    websocket_session,
+)
+from starlette.types import ASGIApp, Receive, Scope, Send
 
+from .responses import static_endpoint
 
-def discover_routes(routes_dir: str) -> List[BaseRoute]:
-    discovered_routes: List[BaseRoute] = []
+logger = logging.getLogger(__name__)
+
+# Route modules loaded lazily, keyed by file path, so all routes of a module
+# share one import
+_modules: Dict[str, ModuleType] = {}
+# One lock per module, so a slow import only holds up users of that module;
+# _modules_lock guards the creation of the per-module locks
+_module_locks: Dict[str, threading.Lock] = {}
+_modules_lock = threading.Lock()
+
+# Seconds spent executing each route module, keyed by file path
+import_times: Dict[str, float] = {}
+
+ROUTE_DECORATORS = ("route", "websocket_route")
+
+
+def iter_route_files(routes_dir: str) -> Iterator[Tuple[str, str]]:
+    """Yield ``(file_path, path_prefix)`` for every route module"""
     for root, _, files in os.walk(routes_dir):
         for file in files:
             if file.endswith(".py") and not file.startswith("__"):
-                module_name = file[:-3]
-                file_path = os.path.join(root, file)
-                try:
-                    spec = importlib.util.spec_from_file_location(
-                        module_name,
-                        file_path,
-                    )
-                    if spec and spec.loader:
-                        module = importlib.util.module_from_spec(spec)
-                        spec.loader.exec_module(module)
-
-                        # Determine the path prefix based on directory
-                        # structure
-                        relative_path = os.path.relpath(root, routes_dir)
-                        path_prefix = (
-                            "/" + relative_path.replace(os.sep, "/")
-                            if relative_path != "."
-                            else ""
-                        )
-
-                        for attr_name in dir(module):
-                            attr = getattr(module, attr_name)
-                            if callable(attr) and hasattr(attr, "__route__"):
-                                route_info = getattr(attr, "__route__")
-                                path = path_prefix + route_info["path"]
-                                methods = route_info["methods"]
-                                is_websocket = route_info.get("websocket", False)
-
-                                if is_websocket:
-                                    discovered_routes.append(
-                                        WebSocketRoute(
-                                            path,
-                                            attr,
-                                            name=attr_name,
-                                        )
-                                    )
-                                else:
-                                    discovered_routes.append(
-                                        Route(
-                                            path,
-                                            attr,
-                                            methods=methods,
-                                            name=attr_name,
-                                        )
-                                    )
-                except Exception as e:
-                    # Log the error but continue processing other files
-                    import logging
-
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Failed to load route file {file_path}: {e}")
-                    continue
+                # Determine the path prefix based on directory structure
+                relative_path = os.path.relpath(root, routes_dir)
+                path_prefix = (
+                    "/" + relative_path.replace(os.sep, "/")
+                    if relative_path != "."
+                    else ""
+                )
+                yield os.path.join(root, file), path_prefix
+
+
+def load_route_module(
+    file_path: str, fresh: bool = False, code: Optional[CodeType] = None
+) -> ModuleType:
+    """Execute a route module, returning the already loaded one unless
+    ``fresh`` is set. ``code`` is the module's precompiled code, if any."""
+    with _modules_lock:
+        lock = _module_locks.setdefault(file_path, threading.Lock())
+    with lock:
+        module = _modules.get(file_path)
+        if module is not None and not fresh:
+            return module
+        module_name = os.path.basename(file_path)[:-3]
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        if not spec or not spec.loader:
+            raise ImportError(f"Cannot load route module {file_path}")
+        module = importlib.util.module_from_spec(spec)
+        start = time.perf_counter()
+        if code is None:
+            spec.loader.exec_module(module)
+        else:
+            exec(code, module.__dict__)
+        import_times[file_path] = time.perf_counter() - start
+        _modules[file_path] = module
+        logger.debug(
+            f"Imported route module {file_path} in "
+            f"{import_times[file_path] * 1000:.1f}ms"
+        )
+        return module
+
+
+def log_import_times(file_paths: Iterable[str], slowest: int = 5) -> None:
+    """Log the total import time of route modules and the slowest ones"""
+    timings = sorted(
+        (
+            (import_times[path], path)
+            for path in set(file_paths)
+            if path in import_times
+        ),
+        reverse=True,
+    )
+    if not timings:
+        return
+    total = sum(elapsed for elapsed, _ in timings)
+    details = ", ".join(
+        f"{path} {elapsed * 1000:.1f}ms" for elapsed, path in timings[:slowest]
+    )
+    logger.info(
+        f"Imported {len(timings)} route modules in {total * 1000:.1f}ms "
+        f"(slowest: {details})"
+    )
+
+
+def module_routes(module: ModuleType) -> List[Tuple[str, Any]]:
+    """``(attribute name, endpoint)`` pairs decorated with ``@route``"""
+    found = []
+    for attr_name in dir(module):
+        attr = getattr(module, attr_name)
+        if callable(attr) and hasattr(attr, "__route__"):
+            found.append((attr_name, attr))
+    return found
+
+
+def make_route(
+    path: str, endpoint: Any, route_info: Dict[str, Any], name: str
+) -> BaseRoute:
+    """Create the Starlette route for a discovered endpoint"""
+    if route_info.get("websocket", False):
+        return WebSocketRoute(path, endpoint, name=name)
+    return Route(path, endpoint, methods=route_info["methods"], name=name)
+
+
+class LazyEndpoint:
+    """
+    Endpoint that imports its route module, in a worker thread, on first use
+
+    Carries the ``__route__`` metadata of the real endpoint, so routes can be
+    registered (and rate limits compiled) without executing the module.
+    """
+
+    def __init__(
+        self, file_path: str, attr_name: str, route_info: Dict[str, Any]
+    ) -> None:
+        self.file_path = file_path
+        self.__name__ = attr_name
+        self.__route__ = route_info
+        self._app: Optional[ASGIApp] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._app is not None
+
+    def load(self) -> ASGIApp:
+        """Import the route module and build the endpoint's ASGI app"""
+        if self._app is None:
+            module = load_route_module(self.file_path)
+            endpoint = getattr(module, self.__name__)
+            if self.__route__.get("websocket", False):
+                self._app = websocket_session(endpoint)
+            else:
+                self._app = request_response(endpoint)
+        return self._app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        app = self._app
+        if app is None:
+            # Import in a thread, like the warm-up, to keep the loop serving
+            loop = asyncio.get_running_loop()
+            app = await loop.run_in_executor(None, self.load)
+        await app(scope, receive, send)
+
+    def __repr__(self) -> str:
+        return f"LazyEndpoint({self.file_path!r}, {self.__name__!r})"
+
+
+def lazy_file_routes(
+    file_path: str, path_prefix: str, endpoints: Iterable[Tuple[str, Dict[str, Any]]]
+) -> List[BaseRoute]:
+    """Create routes with ``LazyEndpoint`` proxies for a module's endpoints"""
+    return [
+        make_route(
+            path_prefix + route_info["path"],
+            LazyEndpoint(file_path, attr_name, route_info),
+            route_info,
+            attr_name,
+        )
+        for attr_name, route_info in endpoints
+    ]
+
+
+def _route_aliases(tree: ast.Module) -> Tuple[Dict[str, str], List[str]]:
+    """Names bound to the route decorators and to the zestapi package"""
+    decorators: Dict[str, str] = {}
+    packages: List[str] = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and (node.module or "").startswith(
+            "zestapi"
+        ):
+            for alias in node.names:
+                if alias.name in ROUTE_DECORATORS:
+                    decorators[alias.asname or alias.name] = alias.name
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == "zestapi":
+                    packages.append(alias.asname or alias.name)
+    return decorators, packages
+
+
+def scan_route_source(
+    source: Union[str, bytes, ast.Module], filename: str = "<unknown>"
+) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+    """
+    Find the endpoints of a route module without executing it
+
+    Returns ``(function name, __route__)`` pairs for top-level functions
+    decorated with ``@route`` or ``@websocket_route`` from zestapi, sorted by
+    name like ``discover_routes`` does, or None if a decorator's arguments
+    are not literals and the module has to be imported.
+    """
+    tree = source if isinstance(source, ast.Module) else ast.parse(source, filename)
+    decorators, packages = _route_aliases(tree)
+    endpoints: Dict[str, Dict[str, Any]] = {}
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for decorator in node.decorator_list:
+            if not isinstance(decorator, ast.Call):
+                continue
+            func = decorator.func
+            if isinstance(func, ast.Name) and func.id in decorators:
+                kind = decorators[func.id]
+            elif (
+                isinstance(func, ast.Attribute)
+                and isinstance(func.value, ast.Name)
+                and func.value.id in packages
+                and func.attr in ROUTE_DECORATORS
+            ):
+                kind = func.attr
+            else:
+                continue
+            try:
+                args = [ast.literal_eval(arg) for arg in decorator.args]
+                kwargs = {
+                    keyword.arg: ast.literal_eval(keyword.value)
+                    for keyword in decorator.keywords
+                    if keyword.arg is not None
+                }
+                if len(kwargs) != len(decorator.keywords):
+                    # **kwargs
+                    return None
+                make_decorator = route if kind == "route" else websocket_route
+                endpoints[node.name] = make_decorator(*args, **kwargs)(
+                    lambda: None
+                ).__route__
+            except (ValueError, TypeError, SyntaxError):
+                return None
+    return sorted(endpoints.items())
+
+
+async def warm_up_routes(routes: Iterable[BaseRoute]) -> None:
+    """Import the modules of lazy endpoints one by one in a worker thread"""
+    loop = asyncio.get_running_loop()
+    pending: Dict[str, LazyEndpoint] = {}
+    for route_obj in routes:
+        endpoint = getattr(route_obj, "endpoint", None)
+        if isinstance(endpoint, LazyEndpoint) and not endpoint.loaded:
+            pending.setdefault(endpoint.file_path, endpoint)
+
+    for endpoint in pending.values():
+        try:
+            await loop.run_in_executor(None, endpoint.load)
+        except Exception as e:
+            logger.error(f"Failed to import route module {endpoint.file_path}: {e}")
+    log_import_times(pending)
+
+
+def load_route_file(
+    file_path: str, path_prefix: str, code: Optional[CodeType] = None
+) -> List[BaseRoute]:
+    """Import a route module and create routes for its endpoints"""
+    module = load_route_module(file_path, fresh=True, code=code)
+    return [
+        make_route(
+            path_prefix + attr.__route__["path"], attr, attr.__route__, attr_name
+        )
+        for attr_name, attr in module_routes(module)
+    ]
+
+
+class RouteFile(NamedTuple):
+    """A route module parsed, scanned and compiled ahead of execution"""
+
+    file_path: str
+    path_prefix: str
+    code: Optional[CodeType]
+    # Statically found endpoints, None if the module must be imported
+    endpoints: Optional[List[Tuple[str, Dict[str, Any]]]]
+    # Whether executing the module could register routes at all
+    mentions_routes: bool
+    error: Optional[Exception] = None
+
+
+def prepare_route_file(
+    file_path: str, path_prefix: str, lazy: bool = False
+) -> RouteFile:
+    """Parse and scan a route module and compile it to bytecode
+
+    Uses the loader's ``__pycache__`` bytecode when it is up to date. With
+    ``lazy`` set, modules whose endpoints were found, or that cannot declare
+    routes, are not compiled.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            source = f.read()
+        endpoints = scan_route_source(ast.parse(source, file_path))
+        mentions_routes = bool(endpoints) or b"route" in source
+        if lazy and (endpoints or not mentions_routes):
+            return RouteFile(file_path, path_prefix, None, endpoints, mentions_routes)
+        spec = importlib.util.spec_from_file_location(
+            os.path.basename(file_path)[:-3], file_path
+        )
+        if not spec or not spec.loader:
+            raise ImportError(f"Cannot load route module {file_path}")
+        code = spec.loader.get_code(spec.name)  # type: ignore[attr-defined]
+        return RouteFile(file_path, path_prefix, code, endpoints, mentions_routes)
+    except Exception as e:
+        return RouteFile(file_path, path_prefix, None, None, True, e)
+
+
+def prepare_route_files(
+    routes_dir: str, workers: int, lazy: bool = False
+) -> List[RouteFile]:
+    """Prepare every route module under ``routes_dir`` in a thread pool"""
+    files = list(iter_route_files(routes_dir))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(lambda item: prepare_route_file(item[0], item[1], lazy), files)
+        )
+
+
+def _prepared_routes(route_file: RouteFile, lazy: bool) -> List[BaseRoute]:
+    """Create the routes of a prepared module, importing it only if needed"""
+    if route_file.error is not None:
+        raise route_file.error
+    # An empty scan is not trusted: the module may apply the decorators in a
+    # way the scan does not recognise, e.g. through ``import ... as``
+    if lazy and route_file.endpoints:
+        return lazy_file_routes(
+            route_file.file_path, route_file.path_prefix, route_file.endpoints
+        )
+    if not route_file.mentions_routes:
+        logger.debug(f"Skipping route file without routes: {route_file.file_path}")
+        return []
+    return load_route_file(
+        route_file.file_path, route_file.path_prefix, code=route_file.code
+    )
+
+
+def discover_routes(routes_dir: str, workers: int = 0) -> List[BaseRoute]:
+    """
+    Import route modules and create routes for their endpoints
+
+    With ``workers`` set, route files are read, scanned and compiled in a
+    thread pool first, then only modules that can declare routes are executed,
+    in order, on the calling thread.
+    """
+    discovered_routes: List[BaseRoute] = []
+    if workers:
+        for route_file in prepare_route_files(routes_dir, workers):
+            try:
+                discovered_routes.extend(_prepared_routes(route_file, lazy=False))
+            except Exception as e:
+                logger.warning(f"Failed to load route file {route_file.file_path}: {e}")
+        return discovered_routes
+
+    for file_path, path_prefix in iter_route_files(routes_dir):
+        try:
+            discovered_routes.extend(load_route_file(file_path, path_prefix))
+        except Exception as e:
+            # Log the error but continue processing other files
+            logger.warning(f"Failed to load route file {file_path}: {e}")
+            continue
     return discovered_routes
 
 
-def route(path: str, methods: Optional[List[str]] = None) -> Callable[[Any], Any]:
+def discover_lazy_routes(routes_dir: str, workers: int = 0) -> List[BaseRoute]:
+    """
+    Discover routes by scanning route modules instead of importing them
+
+    Endpoints are ``LazyEndpoint`` proxies that import their module on first
+    use. Modules whose decorators can't be read statically are imported.
+    ``workers`` prepares the modules in a thread pool, as ``discover_routes``
+    does.
+    """
+    route_files: Iterable[RouteFile]
+    if workers:
+        route_files = prepare_route_files(routes_dir, workers, lazy=True)
+    else:
+        route_files = (
+            prepare_route_file(file_path, path_prefix, lazy=True)
+            for file_path, path_prefix in iter_route_files(routes_dir)
+        )
+
+    discovered_routes: List[BaseRoute] = []
+    for route_file in route_files:
+        try:
+            discovered_routes.extend(_prepared_routes(route_file, lazy=True))
+        except Exception as e:
+            logger.warning(f"Failed to load route file {route_file.file_path}: {e}")
+    return discovered_routes
+
+
+def route(
+    path: str,
+    methods: Optional[List[str]] = None,
+    rate_limit: Optional[Union[str, Dict[str, str]]] = None,
+    static: bool = False,
+) -> Callable[[Any], Any]:
+    """
+    Mark a function as a route endpoint
+
+    With ``static``, the endpoint still runs on the first request, and its
+    first 2xx response is replayed to all later requests (see
+    ``static_endpoint``).
+    """
     if methods is None:
         methods = ["GET"]
 
     def decorator(func: Any) -> Any:
-        func.__route__ = {"path": path, "methods": methods}
+        func.__route__ = {"path": path, "methods": methods, "rate_limit": rate_limit}
+        if static:
+            func.__route__["static"] = True
+            return static_endpoint(func)
         return func
 
     return decorator
@@ -1,5 +1,8 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional, Tuple
+from typing import Any, Dict, Optional, Tuple, Type
 
 from jose import JWTError, jwt
 from starlette.authentication import (
@@ -9,15 +12,43 @@ from starlette.authentication import (
 )
 from starlette.requests import HTTPConnection
 
+from . import hmac_jwt
+from .jwks import JWKSKeySet
 from .settings import settings
 
 ALGORITHM = "HS256"
 
 
+AuthResult = Tuple[AuthCredentials, SimpleUser]
+
+
 class JWTAuthBackend(AuthenticationBackend):
-    async def authenticate(
-        self, conn: HTTPConnection
-    ) -> Optional[Tuple[AuthCredentials, SimpleUser]]:
+    """
+    Authenticate requests carrying a bearer JWT signed with the JWT secret
+
+    Verified tokens are kept in a bounded LRU cache keyed by a hash of the
+    token until they expire (their ``exp`` claim, capped at ``cache_ttl``
+    seconds), so repeated requests with the same token skip decoding and
+    signature checks. Invalid tokens are never cached. ``cache_size=0``
+    disables the cache.
+    """
+
+    def __init__(
+        self,
+        algorithm: str = ALGORITHM,
+        cache_size: int = 10_000,
+        cache_ttl: float = 300.0,
+    ) -> None:
+        self.algorithm = algorithm
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # token hash -> (expires_at, result), least recently used first
+        self._cache: "OrderedDict[bytes, Tuple[float, AuthResult]]" = OrderedDict()
+        self._cache_generation = self._key_generation()
+
+    async def authenticate(self, conn: HTTPConnection) -> Optional[AuthResult]:
         if "Authorization" not in conn.headers:
             return None
 
@@ -25,17 +56,7 @@ class JWTAuthBackend(AuthenticationBackend):
         try:
             scheme, credentials = auth.split()
             if scheme.lower() == "bearer":
-                payload = jwt.decode(
-                    credentials, settings.jwt_secret, algorithms=[ALGORITHM]
-                )
-                username = payload.get("sub")
-                if username is None:
-                    # Return None for missing subject
-                    return None
-                return (
-                    AuthCredentials(["authenticated"]),
-                    SimpleUser(username),
-                )
+                return self._verify(credentials)
             return None  # Invalid scheme
         except JWTError:
             # Return None instead of raising exception for invalid JWT
@@ -44,8 +65,138 @@ class JWTAuthBackend(AuthenticationBackend):
             # Return None for invalid header format
             return None
 
+    def _verify(self, token: str) -> Optional[AuthResult]:
+        """Verify a token, using the cache when enabled"""
+        if not self.cache_size:
+            return self._decode(token)[1]
+
+        generation = self._key_generation()
+        if self._cache_generation != generation:
+            # Tokens verified with a rotated key are no longer trusted
+            self.cache_clear()
+            self._cache_generation = generation
+
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        now = time.time()
+        entry = self._cache.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return entry[1]
+            del self._cache[key]
+        self.cache_misses += 1
+
+        expires_at, result = self._decode(token)
+        if result is not None:
+            self._cache[key] = (min(expires_at, now + self.cache_ttl), result)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _decode(self, token: str) -> Tuple[float, Optional[AuthResult]]:
+        """Decode and verify a token, returning its expiry time and result"""
+        payload = self._claims(token)
+        username = payload.get("sub")
+        if username is None:
+            # Return None for missing subject
+            return 0.0, None
+        exp = payload.get("exp")
+        expires_at = float(exp) if isinstance(exp, (int, float)) else float("inf")
+        return expires_at, (AuthCredentials(["authenticated"]), SimpleUser(username))
+
+    def _key_generation(self) -> Any:
+        """Changes whenever the verification key does"""
+        return settings.jwt_secret
+
+    def _claims(self, token: str) -> Dict[str, Any]:
+        """Verify a token's signature and claims with python-jose"""
+        claims: Dict[str, Any] = jwt.decode(
+            token, settings.jwt_secret, algorithms=[self.algorithm]
+        )
+        return claims
+
+    def cache_info(self) -> Dict[str, int]:
+        """Hit and miss counters and size of the verification cache"""
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": len(self._cache),
+            "max_size": self.cache_size,
+        }
+
+    def cache_clear(self) -> None:
+        """Forget all verified tokens"""
+        self._cache.clear()
+
+
+class HMACJWTAuthBackend(JWTAuthBackend):
+    """
+    JWT backend verifying HS256/HS384/HS512 tokens without python-jose
+
+    Uses ``hmac`` with a key prepared once per secret, ``orjson`` for the
+    claims and integer math for ``exp``/``nbf``.
+    """
+
+    def __init__(self, algorithm: str = ALGORITHM, **kwargs: Any) -> None:
+        if algorithm not in hmac_jwt.HMAC_ALGORITHMS:
+            raise ValueError(f"Unsupported HMAC algorithm: {algorithm}")
+        super().__init__(algorithm, **kwargs)
+
+    def _claims(self, token: str) -> Dict[str, Any]:
+        key = hmac_jwt.get_key(settings.jwt_secret, self.algorithm)
+        return hmac_jwt.decode(token, key)
+
+
+class JWKSAuthBackend(JWTAuthBackend):
+    """
+    JWT backend verifying asymmetric (RS*/ES*/PS*) tokens against a JWKS
+
+    The signing key is looked up by the token's ``kid`` in a ``JWKSKeySet``,
+    which holds the parsed public keys, and the token's ``alg`` must match
+    the algorithm of that key. Tokens naming an unknown ``kid`` are rejected
+    while the key set refreshes in the background.
+    """
+
+    def __init__(
+        self, key_set: JWKSKeySet, algorithm: str = "RS256", **kwargs: Any
+    ) -> None:
+        self.key_set = key_set
+        super().__init__(algorithm, **kwargs)
+
+    def _key_generation(self) -> Any:
+        return self.key_set.version
+
+    def _claims(self, token: str) -> Dict[str, Any]:
+        signing_input, header, claims, signature = hmac_jwt.parse_token(token)
+        key = self.key_set.get(header.get("kid"))
+        if key is None:
+            raise JWTError("Unable to find a signing key that matches the token")
+        if header.get("alg") != key.algorithm:
+            raise JWTError("The specified alg value is not allowed")
+        if not key.verify(signing_input, signature):
+            raise JWTError("Signature verification failed.")
+        return hmac_jwt.validate_claims(claims)
+
+
+def create_auth_backend(
+    algorithm: str, key_set: Optional[JWKSKeySet] = None, **kwargs: Any
+) -> JWTAuthBackend:
+    """Create the JWT backend for an algorithm, using the built-in HMAC
+    implementation where possible and the key set when one is given"""
+    if key_set is not None:
+        return JWKSAuthBackend(key_set, algorithm, **kwargs)
+    backend_class: Type[JWTAuthBackend] = (
+        HMACJWTAuthBackend if algorithm in hmac_jwt.HMAC_ALGORITHMS else JWTAuthBackend
+    )
+    return backend_class(algorithm, **kwargs)
+
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+def create_access_token(
+    data: dict,
+    expires_delta: Optional[timedelta] = None,
+    algorithm: Optional[str] = None,
+) -> str:
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -54,7 +205,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
             minutes=settings.jwt_access_token_expire_minutes
         )
     to_encode.update({"exp": expire})
-    encoded_jwt: str = jwt.encode(to_encode, settings.jwt_secret, algorithm=ALGORITHM)
+    algorithm = algorithm or settings.jwt_algorithm
+    if algorithm in hmac_jwt.HMAC_ALGORITHMS:
+        key = hmac_jwt.get_key(settings.jwt_secret, algorithm)
+        return hmac_jwt.encode(to_encode, key)
+    encoded_jwt: str = jwt.encode(to_encode, settings.jwt_secret, algorithm=algorithm)
     return encoded_jwt
 
 
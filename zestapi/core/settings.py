@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,6 +12,12 @@ class Settings(BaseSettings):
     jwt_secret: str = "your-secret-key"
     jwt_algorithm: str = "HS256"
     jwt_access_token_expire_minutes: int = 30
+    # Verified tokens cached until they expire; 0 disables the cache
+    jwt_cache_size: int = 10_000
+    # JSON Web Key Set (file path or URL) for RS*/ES*/PS* tokens, refreshed
+    # in the background every jwt_jwks_refresh_interval seconds
+    jwt_jwks: Optional[str] = None
+    jwt_jwks_refresh_interval: float = 300.0
 
     # Server Configuration
     host: str = "0.0.0.0"
@@ -19,8 +25,100 @@ class Settings(BaseSettings):
     debug: bool = True  # Default to True for development
     reload: bool = False
 
+    # Routing: match requests with a compiled radix tree instead of trying
+    # every route's regex in order. Useful for large route tables.
+    compiled_router: bool = False
+    # Route manifest written by `zest manifest`, used to register discovered
+    # routes without importing their modules until first use
+    routes_manifest: Optional[str] = None
+    # Register discovered routes by scanning their modules, importing each
+    # module on first use or in a background warm-up after startup
+    lazy_routes: bool = False
+    lazy_routes_warmup: bool = True
+    # Threads used to read, scan and compile route files during discovery;
+    # 0 discovers them one by one
+    route_discovery_workers: int = 0
+
+    # CPU-bound work (run_cpu_bound): "thread" or "process" pool, 0 workers
+    # uses one per CPU. Calls beyond workers + max queue get a 503. The
+    # executor is shared by the process: an application reuses one installed
+    # by another application unless it sets any of these.
+    cpu_executor_kind: str = "thread"
+    cpu_executor_workers: int = 0
+    cpu_executor_max_queue: Optional[int] = 256
+    cpu_executor_queue_timeout: float = 0.0
+
+    # Prometheus metrics served at metrics_path. Set metrics_dir to a
+    # directory shared by the workers on a host (emptied on deploy) to
+    # aggregate their metrics; each worker keeps up to metrics_capacity values.
+    metrics: bool = False
+    metrics_path: str = "/metrics"
+    metrics_dir: Optional[str] = None
+    metrics_capacity: int = 65536
+
+    # Request IDs (X-Request-ID, logs, error responses): "counter" (process
+    # prefix and counter), "ulid" or "uuid7". With request_id_trust_header,
+    # a valid incoming X-Request-ID is kept instead. With tracing enabled
+    # the trace ID is used.
+    request_id_mode: str = "counter"
+    request_id_trust_header: bool = False
+
+    # Tracing with W3C traceparent propagation: a server span per request
+    # (whose trace ID becomes the request ID) and child spans for middleware
+    # and route handlers. New traces are sampled at tracing_sample_rate;
+    # requests with a traceparent follow the caller. Spans are written to
+    # tracing_file as JSON lines, or kept in memory when it is not set.
+    tracing: bool = False
+    tracing_service_name: str = "zestapi"
+    tracing_sample_rate: float = 1.0
+    tracing_file: Optional[str] = None
+
+    # Per-phase request timing (auth, rate_limit, routing, handler,
+    # serialization, send) passed to timing hooks. Requests slower than
+    # profiling_log_threshold milliseconds are logged with their phases, and
+    # with metrics enabled phases are recorded as a histogram.
+    profiling: bool = False
+    profiling_log_threshold: Optional[float] = None
+    # Stack sampling profiler served at profiler_path, enabled by setting the
+    # token clients must send in the X-Profiler-Token header
+    profiler_token: Optional[str] = None
+    profiler_path: str = "/admin/profile"
+    profiler_max_seconds: float = 60.0
+    profiler_interval: float = 0.005
+
+    # ETags hashed from the body of complete 200 responses to GET requests,
+    # with matching If-None-Match requests answered by an empty 304
+    etags: bool = False
+
+    # Response compression negotiated from Accept-Encoding: zstd and br when
+    # zstandard/brotli are installed (zestapi[compression]), else gzip.
+    # Bodies smaller than compression_minimum_size bytes are sent as is;
+    # compressed bodies of responses with an ETag are cached up to
+    # compression_cache_bytes. compression_levels overrides per-encoding
+    # levels, e.g. {"gzip": 6, "br": 4, "zstd": 3}.
+    compression: bool = False
+    compression_minimum_size: int = 500
+    compression_encodings: List[str] = ["zstd", "br", "gzip"]
+    compression_levels: Dict[str, int] = {}
+    compression_cache_bytes: int = 16 * 1024 * 1024
+
+    # Shared cache of @cached routes: memory:// (per-process LRU holding up
+    # to response_cache_bytes) or redis://host:port/db to share it between
+    # workers
+    response_cache_storage: str = "memory://"
+    response_cache_bytes: int = 64 * 1024 * 1024
+
     # Rate Limiting
     rate_limit: str = "100/minute"
+    rate_limit_algorithm: str = "sliding_window"  # token_bucket, gcra
+    rate_limit_max_keys: int = 100_000
+    # memory://, mmap://[/path], redis://host:port/db[?flush_interval=0.05]
+    rate_limit_storage: str = "memory://"
+    # Client identity for limits: ip, user (JWT subject), api_key or auto
+    rate_limit_key: str = "ip"
+    rate_limit_api_key_header: str = "X-API-Key"
+    # Per-identity overrides, e.g. {"user:partner": "10000/hour"}
+    rate_limit_policies: Dict[str, str] = {}
 
     # CORS Configuration
     cors_origins: List[str] = ["*"]
@@ -33,6 +131,24 @@ class Settings(BaseSettings):
 
     # Logging
     log_level: str = "INFO"
+    # "text", or "json" for one JSON object per line with request metadata
+    log_format: str = "text"
+    # Share of successful requests written to the access log (1.0 logs all),
+    # sampled by request ID. Errors and requests slower than
+    # access_log_slow_threshold milliseconds are always logged.
+    access_log_sample_rate: float = 1.0
+    access_log_slow_threshold: Optional[float] = None
+    # Write log records from a background thread fed by a bounded queue, so
+    # logging never blocks request handling. When the queue is full, new
+    # (or with "oldest", the oldest queued) records are dropped and counted.
+    log_queue: bool = False
+    log_queue_size: int = 10_000
+    log_queue_drop: str = "new"
+    # Log file used outside debug mode, rotated at log_file_max_bytes (0
+    # never rotates)
+    log_file: str = "zestapi.log"
+    log_file_max_bytes: int = 0
+    log_file_backup_count: int = 5
 
     # Plugins
     enabled_plugins: List[str] = []
@@ -0,0 +1,464 @@
+"""
+Request tracing with W3C Trace Context propagation
+
+``CoreMiddleware`` continues the trace of an incoming ``traceparent`` header
+(or starts a new one) with a server span for each request, and uses its
+trace ID as the request ID, so logs, error responses and traces of every
+service a request passes through share one ID. ``SpanMiddleware`` and
+``trace_routes`` add child spans for middleware layers and route handlers;
+handlers can add their own with ``Tracer.span`` and propagate the trace to
+outgoing requests with ``trace_headers``.
+
+Spans are ``__slots__`` records taken from a pool. Finished spans are
+buffered and handed to a ``SpanExporter`` in batches on a background thread,
+then returned to the pool, so exporters must copy anything they keep.
+Spans of unsampled traces are never exported.
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .request_id import random_pool
+
+logger = logging.getLogger(__name__)
+
+SPAN_KINDS = ("internal", "server", "client", "producer", "consumer")
+
+_HEX = frozenset("0123456789abcdef")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar(
+    "zestapi_current_span", default=None
+)
+
+
+def current_span() -> Optional["Span"]:
+    """The innermost span of the request being handled, if tracing is on"""
+    return _current_span.get()
+
+
+def _is_hex_id(value: str, length: int) -> bool:
+    return len(value) == length and _HEX.issuperset(value) and value != "0" * length
+
+
+def parse_traceparent(header: str) -> Optional[Tuple[str, str, bool]]:
+    """
+    Parse a ``traceparent`` header into ``(trace_id, parent_id, sampled)``
+
+    Returns ``None`` for headers that are malformed, of the invalid version
+    ``ff``, or with an all-zero ID. Headers of later versions are accepted
+    by their first four fields, as the specification asks.
+    """
+    parts = header.strip().split("-")
+    if len(parts) < 4:
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if (
+        len(version) != 2
+        or not _HEX.issuperset(version)
+        or version == "ff"
+        or (version == "00" and len(parts) != 4)
+        or not _is_hex_id(trace_id, 32)
+        or not _is_hex_id(parent_id, 16)
+        or len(flags) != 2
+        or not _HEX.issuperset(flags)
+    ):
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool) -> str:
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+class Span:
+    """
+    A timed operation within a trace
+
+    Times are nanoseconds since the epoch. ``status`` is ``"UNSET"``,
+    ``"OK"`` or ``"ERROR"``. Spans are recycled once exported: don't keep
+    references to a span after ending it.
+    """
+
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "kind",
+        "start",
+        "end",
+        "attributes",
+        "status",
+        "sampled",
+        "trace_state",
+    )
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.trace_id = ""
+        self.span_id = ""
+        self.parent_id: Optional[str] = None
+        self.name = ""
+        self.kind = "internal"
+        self.start = 0
+        self.end = 0
+        self.attributes: Optional[Dict[str, Any]] = None
+        self.status = "UNSET"
+        self.sampled = True
+        self.trace_state: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        """This span as the parent in a ``traceparent`` header"""
+        return format_traceparent(self.trace_id, self.span_id, self.sampled)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.attributes is None:
+            self.attributes = {}
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        """Mark the span as failed by ``exc``"""
+        self.status = "ERROR"
+        self.set_attribute("exception.type", type(exc).__name__)
+        self.set_attribute("exception.message", str(exc))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The span in the shape of an OpenTelemetry (OTLP JSON) span"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": self.end,
+            "attributes": dict(self.attributes or {}),
+            "status": {"code": self.status},
+        }
+
+
+class SpanExporter:
+    """
+    Destination for finished spans
+
+    ``export`` is called from the tracer's background thread with a batch of
+    spans, which are reused once it returns.
+    """
+
+    def export(self, spans: Sequence[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keep the last ``max_spans`` exported spans as dicts, for tests and
+    debugging"""
+
+    def __init__(self, max_spans: int = 10_000) -> None:
+        self.spans: Deque[Dict[str, Any]] = deque(maxlen=max_spans)
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self.spans.extend(span.to_dict() for span in spans)
+
+    def get_finished_spans(self) -> List[Dict[str, Any]]:
+        return list(self.spans)
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class FileSpanExporter(SpanExporter):
+    """Append spans to ``path`` as JSON lines, one write per batch"""
+
+    def __init__(self, path: str, service_name: str = "zestapi") -> None:
+        self.path = path
+        self.resource = {"service.name": service_name}
+        self._file = open(path, "ab")
+
+    def export(self, spans: Sequence[Span]) -> None:
+        lines = []
+        for span in spans:
+            data = span.to_dict()
+            data["resource"] = self.resource
+            lines.append(orjson.dumps(data))
+        lines.append(b"")
+        self._file.write(b"\n".join(lines))
+        self._file.flush()
+
+    def shutdown(self) -> None:
+        self._file.close()
+
+
+_STOP: List[Span] = []
+
+
+class Tracer:
+    """
+    Create spans and export finished ones in batches
+
+    New traces are sampled at ``sample_rate``; traces continued from a
+    ``traceparent`` keep the caller's decision. Finished spans are handed to
+    the exporter every ``batch_size`` spans and at least every
+    ``flush_interval`` seconds. When ``max_batches`` batches are waiting,
+    further batches are dropped and counted in ``dropped``.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        sample_rate: float = 1.0,
+        batch_size: int = 512,
+        max_batches: int = 64,
+        flush_interval: float = 1.0,
+        pool_size: int = 4096,
+    ) -> None:
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pool_size = pool_size
+        self.dropped = 0
+        self._pool: List[Span] = []
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[List[Span]]" = queue.Queue(max_batches)
+        self._thread: Optional[threading.Thread] = threading.Thread(
+            target=self._run, name="zestapi-span-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def start_span(
+        self,
+        name: str,
+        parent: Optional[Span] = None,
+        kind: str = "internal",
+        traceparent: Optional[str] = None,
+    ) -> Span:
+        """
+        Start a span, the child of ``parent`` (by default the current span)
+        or of the remote span in ``traceparent``
+
+        A span with neither, or with a ``traceparent`` that is empty or
+        invalid, starts a new trace.
+        """
+        # The pool is refilled by the exporter thread and spans may be started
+        # from worker threads, so pop without checking first
+        try:
+            span = self._pool.pop()
+        except IndexError:
+            span = Span()
+        span.name = name
+        span.kind = kind
+        span.span_id = random_pool.hex_id(16)
+        if parent is None and traceparent is None:
+            parent = _current_span.get()
+        remote = parse_traceparent(traceparent) if traceparent else None
+        if parent is not None:
+            span.trace_id = parent.trace_id
+            span.parent_id = parent.span_id
+            span.sampled = parent.sampled
+            span.trace_state = parent.trace_state
+        elif remote is not None:
+            span.trace_id, span.parent_id, span.sampled = remote
+        else:
+            span.trace_id = random_pool.hex_id(32)
+            span.sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        span.start = time.time_ns()
+        return span
+
+    def start_request_span(self, scope: Scope) -> Span:
+        """Start the server span of an HTTP request, continuing the trace in
+        its ``traceparent`` header if it has a valid one"""
+        traceparent = trace_state = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+            elif name == b"tracestate":
+                trace_state = value.decode("latin-1")
+        span = self.start_span(
+            scope.get("method", "HTTP"), kind="server", traceparent=traceparent or ""
+        )
+        if trace_state and span.parent_id is not None:
+            span.trace_state = trace_state
+        span.attributes = {
+            "http.request.method": scope.get("method"),
+            "url.path": scope.get("path"),
+        }
+        return span
+
+    def end_span(self, span: Span) -> None:
+        span.end = time.time_ns()
+        if not span.sampled:
+            self._release([span])
+            return
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._submit(batch)
+
+    @contextmanager
+    def span(
+        self, name: str, kind: str = "internal", **attributes: Any
+    ) -> Iterator[Span]:
+        """Run a block in a child of the current span, recording any
+        exception it raises"""
+        span = self.start_span(name, kind=kind)
+        if attributes:
+            span.attributes = attributes
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Export the buffered spans and wait for queued batches to be
+        exported"""
+        self._submit(self._take())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                self._queue.all_tasks_done.wait(remaining)
+
+    def shutdown(self) -> None:
+        """Export the buffered spans and stop the exporter thread"""
+        if self._thread is None:
+            return
+        self._submit(self._take())
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        self.exporter.shutdown()
+
+    def _take(self) -> List[Span]:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        return batch
+
+    def _submit(self, batch: List[Span]) -> None:
+        if not batch:
+            return
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self.dropped += len(batch)
+            self._release(batch)
+
+    def _release(self, spans: Sequence[Span]) -> None:
+        pool = self._pool
+        for span in spans:
+            if len(pool) >= self.pool_size:
+                break
+            span.reset()
+            pool.append(span)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._submit(self._take())
+                continue
+            try:
+                if batch is _STOP:
+                    return
+                self._export(batch)
+            finally:
+                self._queue.task_done()
+
+    def _export(self, batch: List[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.error(f"Failed to export {len(batch)} spans: {e}")
+        self._release(batch)
+
+
+def trace_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Add ``traceparent`` (and ``tracestate``) for the current span to
+    ``headers`` of an outgoing request"""
+    headers = {} if headers is None else headers
+    span = _current_span.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent
+        if span.trace_state:
+            headers["tracestate"] = span.trace_state
+    return headers
+
+
+class SpanMiddleware:
+    """Run the wrapped middleware layer in a child span named ``name``"""
+
+    def __init__(self, app: ASGIApp, tracer: Tracer, name: str) -> None:
+        self.app = app
+        self.tracer = tracer
+        self.name = name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        parent = _current_span.get()
+        if parent is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        span = self.tracer.start_span(self.name, parent)
+        token = _current_span.set(span)
+        try:
+            await self.app(scope, receive, send)
+        except Exception as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.tracer.end_span(span)
+
+
+class RouteSpanApp(SpanMiddleware):
+    """ASGI wrapper running a route's handler in a span, and naming the
+    request's server span after the route template"""
+
+    def __init__(self, app: ASGIApp, tracer: Tracer, path: str) -> None:
+        super().__init__(app, tracer, f"handler {path}")
+        self.path = path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        server = scope.get("state", {}).get("span")
+        if server is not None and scope["type"] == "http":
+            server.name = f"{scope['method']} {self.path}"
+            server.set_attribute("http.route", self.path)
+        await super().__call__(scope, receive, send)
+
+
+def trace_routes(routes: List[BaseRoute], tracer: Tracer) -> int:
+    """Wrap the ASGI app of every HTTP route in a handler span, returning the
+    number of traced routes"""
+    count = 0
+    for route in routes:
+        if not isinstance(route, Route) or isinstance(route.app, RouteSpanApp):
+            continue
+        route.app = RouteSpanApp(route.app, tracer, route.path)
+        count += 1
+    return count